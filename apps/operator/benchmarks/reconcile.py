@@ -0,0 +1,176 @@
+"""
+Benchmarks the existence checks the operator runs for every PLC when it resumes,
+against a local stub API server holding the deployments and services of the PLCs.
+
+The checks that list every deployment and service of the namespace for each PLC are compared against
+the checks answered from an index of the managed resources (filled from a single list, as kopf does on startup)
+and against the targeted GET by name the index falls back to.
+
+The resume of the operator is then measured end to end: the PLCs are created through the on_create handler and
+resumed through it again, once without the indices and once with the indices of the managed deployments, services,
+ConfigMaps and claims filled from a single list of each. kopf runs no resume handler before every index is filled.
+
+usage: python3 apps/operator/benchmarks/reconcile.py --plcs 500 --latency 2
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+os.environ.setdefault('ENVIRONMENT', 'dev')
+
+from kubernetes_asyncio import client
+
+import main as operator
+from handlers.create import deployment_already_exists, service_already_exists
+from stub_api import StubApiServer, NAMESPACE, DEPLOYMENTS, SERVICES
+from throughput import plc
+from utilities import kubeapi, manifest
+
+
+def resource(kind: str, name: str) -> dict:
+    """ Returns a deployment or service of a PLC with the labels and a spec of a realistic size """
+    metadata = {
+        'name': name,
+        'namespace': NAMESPACE,
+        'uid': f'{kind}-{name}',
+        'resourceVersion': '1',
+        'labels': {
+            'app.kubernetes.io/name': name,
+            'app.kubernetes.io/instance': f'{NAMESPACE}.{name}',
+            'app.kubernetes.io/component': 'plc',
+            'app.kubernetes.io/part-of': 'foreveroceans',
+            'app.kubernetes.io/managed-by': 'plc-operator',
+        },
+    }
+    if kind == 'Service':
+        return {'apiVersion': 'v1', 'kind': kind, 'metadata': metadata, 'spec': {
+            'type': 'NodePort',
+            'ports': [{'port': 5000, 'targetPort': 5000, 'name': 'http'}],
+            'selector': {'app.kubernetes.io/name': name},
+        }}
+
+    env = [{'name': f'ENV_{i}', 'value': 'x' * 32} for i in range(30)]
+    return {'apiVersion': 'apps/v1', 'kind': kind, 'metadata': metadata, 'spec': {
+        'replicas': 1,
+        'selector': {'matchLabels': {'app.kubernetes.io/name': name}},
+        'template': {
+            'metadata': {'labels': {'app.kubernetes.io/name': name}},
+            'spec': {'containers': [{'name': name, 'image': f'plc:{name}', 'env': env}]},
+        },
+    }}
+
+
+async def list_scan(name: str) -> bool:
+    """ The existence checks before the index, listing every deployment and service of the namespace """
+    deployments = await kubeapi.call(kubeapi.apps_v1().list_namespaced_deployment, NAMESPACE)
+    services = await kubeapi.call(kubeapi.core_v1().list_namespaced_service, NAMESPACE)
+    return any(item.metadata.name == name for item in deployments.items) and any(item.metadata.name == name for item in services.items)
+
+
+async def run(server: StubApiServer, names: list[str], strategy: str) -> dict:
+    logger = logging.getLogger('benchmark')
+    server.reset()
+    start = time.perf_counter()
+
+    if strategy == 'list':
+        for name in names:
+            await list_scan(name)
+    else:
+        deployments = services = None
+        if strategy == 'index':
+            # kopf lists each resource once and keeps the index current from the watch stream
+            deployments = {(NAMESPACE, item.metadata.name): True for item in (await kubeapi.call(kubeapi.apps_v1().list_namespaced_deployment, NAMESPACE)).items}
+            services = {(NAMESPACE, item.metadata.name): True for item in (await kubeapi.call(kubeapi.core_v1().list_namespaced_service, NAMESPACE)).items}
+        for name in names:
+            await deployment_already_exists(name, NAMESPACE, logger, deployments)
+            await service_already_exists(name, NAMESPACE, logger, services)
+
+    elapsed = time.perf_counter() - start
+    return {
+        'strategy': strategy,
+        'seconds': round(elapsed, 3),
+        'requests': sum(server.requests.values()),
+        'megabytes': round(server.bytes / 1E6, 1),
+    }
+
+
+async def indices() -> dict[str, dict]:
+    """ Lists each kind of managed resource once and indexes the hash of its manifest, as the indices of the operator do """
+    core_v1, apps_v1 = kubeapi.core_v1(), kubeapi.apps_v1()
+    lists = {
+        'managed_deployments': apps_v1.list_namespaced_deployment,
+        'managed_services': core_v1.list_namespaced_service,
+        'managed_configmaps': core_v1.list_namespaced_config_map,
+        'managed_claims': core_v1.list_namespaced_persistent_volume_claim,
+    }
+    return {
+        index: {
+            (NAMESPACE, item.metadata.name): [(item.metadata.annotations or {}).get(manifest.HASH_ANNOTATION)]
+            for item in (await kubeapi.call(list_items, NAMESPACE)).items
+        }
+        for index, list_items in lists.items()
+    }
+
+
+async def handle(server: StubApiServer, bodies: list[dict], phase: str, indexed: bool) -> dict:
+    """ Runs the on_create handler for every PLC, as kopf does on the creation and on the resume of the PLCs """
+    logger = logging.getLogger('benchmark')
+    server.reset()
+    start = time.perf_counter()
+
+    kwargs = await indices() if indexed else {index: None for index in ('managed_deployments', 'managed_services', 'managed_configmaps', 'managed_claims')}
+    for body in bodies:
+        await operator.on_create(
+            spec=body['spec'], name=body['metadata']['name'], namespace=NAMESPACE, body=body, patch={}, logger=logger,
+            plc_specs={}, **kwargs,
+        )
+
+    elapsed = time.perf_counter() - start
+    return {
+        'phase': phase,
+        'indices': indexed,
+        'seconds': round(elapsed, 3),
+        'requests': dict(server.requests),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--plcs', type=int, default=500, help='the number of PLC custom resources to reconcile')
+    parser.add_argument('--latency', type=float, default=2, help='the latency of the stub API server in milliseconds')
+    args = parser.parse_args()
+
+    server = StubApiServer(args.latency / 1E3)
+    names = [f'plc{i:04d}' for i in range(args.plcs)]
+    for name in names:
+        server.collections[DEPLOYMENTS][name] = resource('Deployment', name)
+        server.collections[SERVICES][name] = resource('Service', name)
+    server.start()
+
+    configuration = client.Configuration()
+    configuration.host = server.host
+    await kubeapi.connect(concurrency=1, configuration=configuration)
+
+    results = [await run(server, names, strategy) for strategy in ('list', 'get', 'index')]
+
+    # the resume starts from the resources the handler created
+    for collection in server.collections.values():
+        collection.clear()
+    bodies = [plc(name) for name in names]
+    resume = [
+        await handle(server, bodies, 'create', indexed=True),
+        await handle(server, bodies, 'resume', indexed=False),
+        await handle(server, bodies, 'resume', indexed=True),
+    ]
+    await kubeapi.close()
+    server.shutdown()
+    print(json.dumps({'plcs': args.plcs, 'latency_ms': args.latency, 'results': results, 'resume': resume}, indent=2))
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,143 @@
+"""
+A stub of the Kubernetes API server for the operator benchmarks.
+
+It keeps the resources in memory by collection path and serves the list, get, create and patch of the deployments,
+services, configmaps, persistent volume claims and PLC custom resources, with an added latency per request to stand in for a remote API server.
+"""
+import json
+import time
+import threading
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+NAMESPACE = 'plc'
+
+DEPLOYMENTS = f'/apis/apps/v1/namespaces/{NAMESPACE}/deployments'
+SERVICES = f'/api/v1/namespaces/{NAMESPACE}/services'
+CONFIGMAPS = f'/api/v1/namespaces/{NAMESPACE}/configmaps'
+CLAIMS = f'/api/v1/namespaces/{NAMESPACE}/persistentvolumeclaims'
+PLCS = f'/apis/foreveroceans.io/v1/namespaces/{NAMESPACE}/plcs'
+
+
+def merge(target: dict, patch: dict):
+    """ Merges the patch into the target the way a merge patch does """
+    for key, value in patch.items():
+        if value is None:
+            target.pop(key, None)
+        elif isinstance(value, dict) and isinstance(target.get(key), dict):
+            merge(target[key], value)
+        else:
+            target[key] = value
+
+
+class StubApiServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 512
+
+    def __init__(self, latency: float):
+        super().__init__(('127.0.0.1', 0), StubApiHandler)
+        self.latency = latency
+        self.collections: dict[str, dict[str, dict]] = {DEPLOYMENTS: {}, SERVICES: {}, CONFIGMAPS: {}, CLAIMS: {}, PLCS: {}}
+        self.requests: dict[str, int] = {}
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+
+    @property
+    def host(self) -> str:
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+
+    def reset(self):
+        with self.lock:
+            self.requests = {}
+            self.bytes = 0
+
+
+    def count(self, method: str, size: int):
+        with self.lock:
+            self.requests[method] = self.requests.get(method, 0) + 1
+            self.bytes += size
+
+
+class StubApiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # the headers and the body are written separately, with Nagle's algorithm every keep-alive request waits for a delayed ack
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+
+    def resolve(self) -> tuple[dict | None, str | None, str]:
+        """ Returns the collection, the name of the item (None for the collection) and the subresource of the path """
+        path = self.path.split('?')[0].rstrip('/')
+        if path in self.server.collections:
+            return self.server.collections[path], None, ''
+
+        for subresource in ('', '/status'):
+            if subresource and not path.endswith(subresource):
+                continue
+            collection, _, name = path[:len(path) - len(subresource)].rpartition('/')
+            if collection in self.server.collections:
+                return self.server.collections[collection], name, subresource
+        return None, None, ''
+
+
+    def read_body(self) -> dict:
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length)) if length else {}
+
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        collection, name, _ = self.resolve()
+        if collection is None:
+            return self.not_found()
+        if name is None:
+            return self.reply(HTTPStatus.OK, {'apiVersion': 'v1', 'kind': 'List', 'metadata': {'resourceVersion': '1'}, 'items': list(collection.values())})
+        if name not in collection:
+            return self.not_found()
+        self.reply(HTTPStatus.OK, collection[name])
+
+
+    def do_POST(self):
+        time.sleep(self.server.latency)
+        collection, name, _ = self.resolve()
+        body = self.read_body()
+        if collection is None or name is not None:
+            return self.not_found()
+        if body['metadata']['name'] in collection:
+            return self.reply(HTTPStatus.CONFLICT, {'kind': 'Status', 'apiVersion': 'v1', 'status': 'Failure', 'reason': 'AlreadyExists', 'code': 409})
+        body['metadata'].setdefault('resourceVersion', '1')
+        collection[body['metadata']['name']] = body
+        self.reply(HTTPStatus.CREATED, body)
+
+
+    def do_PATCH(self):
+        time.sleep(self.server.latency)
+        collection, name, _ = self.resolve()
+        body = self.read_body()
+        if collection is None or name not in collection:
+            return self.not_found()
+        with self.server.lock:
+            merge(collection[name], body)
+        self.reply(HTTPStatus.OK, collection[name])
+
+
+    def not_found(self):
+        self.reply(HTTPStatus.NOT_FOUND, {'kind': 'Status', 'apiVersion': 'v1', 'status': 'Failure', 'reason': 'NotFound', 'code': 404})
+
+
+    def reply(self, status: HTTPStatus, body: dict):
+        payload = json.dumps(body).encode()
+        self.server.count(self.command, len(payload))
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
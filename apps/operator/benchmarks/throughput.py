@@ -0,0 +1,103 @@
+"""
+Benchmarks the throughput of the create and update handlers of the operator against a local stub API server.
+
+A burst of PLC custom resources is created and then updated (a new image version), every event is handled
+concurrently as kopf does for the events of distinct resources. The concurrency bounds the calls to the API server
+in flight, the synchronous handlers were bounded to the 5 workers of the kopf executor.
+
+usage: python3 apps/operator/benchmarks/throughput.py --plcs 500 --latency 5 --concurrency 5 20 50
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+os.environ.setdefault('ENVIRONMENT', 'dev')
+
+from kubernetes_asyncio import client
+
+from handlers import create, update
+from stub_api import StubApiServer, NAMESPACE
+from utilities import kubeapi
+
+
+def plc(name: str) -> dict:
+    """ Returns a PLC custom resource with a few properties """
+    return {
+        'apiVersion': 'foreveroceans.io/v1',
+        'kind': 'PLC',
+        'metadata': {'name': name, 'namespace': NAMESPACE, 'uid': f'uid-{name}'},
+        'spec': {
+            'version': '1.0.0',
+            'base': 'modbus+tcp://127.0.0.1:502',
+            'properties': {
+                f'property{i}': {'type': 'integer', 'forms': [{'href': f'modbus+tcp://127.0.0.1:502/1/{i}?quantity=1', 'op': ['readproperty']}]}
+                for i in range(20)
+            },
+        },
+    }
+
+
+async def on_create(body: dict, logger):
+    name, spec = body['metadata']['name'], body['spec']
+    await create.deployment(spec, NAMESPACE, name, spec['version'], logger, body)
+    await create.service(name, NAMESPACE, logger, spec['version'], body)
+
+
+async def on_update(body: dict, logger):
+    name, spec = body['metadata']['name'], body['spec']
+    await update.deployment(spec, name, NAMESPACE, spec['version'], logger, body)
+    await update.service(name, NAMESPACE, spec['version'], logger, body)
+
+
+async def run(server: StubApiServer, plcs: int, concurrency: int) -> dict:
+    logger = logging.getLogger('benchmark')
+    for collection in server.collections.values():
+        collection.clear()
+
+    configuration = client.Configuration()
+    configuration.host = server.host
+    await kubeapi.connect(concurrency=concurrency, configuration=configuration)
+
+    bodies = [plc(f'plc{i:04d}') for i in range(plcs)]
+    result = {'concurrency': concurrency}
+    for phase, handler in (('create', on_create), ('update', on_update)):
+        server.reset()
+        start = time.perf_counter()
+        await asyncio.gather(*(handler(body, logger) for body in bodies))
+        elapsed = time.perf_counter() - start
+        result[phase] = {
+            'seconds': round(elapsed, 3),
+            'events_per_second': round(plcs / elapsed, 1),
+            'requests': dict(server.requests),
+        }
+
+        # the next phase updates the image version of every PLC
+        for body in bodies:
+            body['spec']['version'] = '1.0.1'
+
+    await kubeapi.close()
+    return result
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--plcs', type=int, default=500, help='the number of PLC custom resources to create and update')
+    parser.add_argument('--latency', type=float, default=5, help='the latency of the stub API server in milliseconds')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[5, 20, 50], help='the maximum calls to the API server in flight')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    server = StubApiServer(args.latency / 1E3)
+    server.start()
+    results = [await run(server, args.plcs, concurrency) for concurrency in args.concurrency]
+    server.shutdown()
+    print(json.dumps({'plcs': args.plcs, 'latency_ms': args.latency, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -1,14 +1,18 @@
 import os
-import yaml
+import json
+from http import HTTPStatus
 
 import kopf
-from kubernetes import client
+from kubernetes_asyncio.client.exceptions import ApiException
 from jinja2 import Template
 
-from utilities.jinja import load_deployment_template, load_service_template
+from utilities import kubeapi
+from utilities.jinja import load_deployment_template, load_service_template, load_configmap_template, load_pvc_template
+from utilities.storage import is_persistent
+from utilities.manifest import annotate, applied_hash, parse
 
 
-def deployment(spec, namespace, name, version, logger):
+async def deployment(spec, namespace, name, version, logger, body, index: kopf.Index | None = None):
     """
     Creates the PLC Deployment
     """
@@ -19,9 +23,7 @@ def deployment(spec, namespace, name, version, logger):
     # render the template with the CR's spec and some additional metadata
     # note: do not use the CRs body as an environment variable, the last-applied-configuration causes problems
     rendered_template: str = template.render(
-        # SPEC is the PLC CR's spec so the PLC service can consume it
-        spec=spec,
-        # NAME is the PLC name
+        # NAME is the PLC name, the PLC service consumes the spec from the {name}-spec ConfigMap
         name=name,
         # VERSION is the image tag to use
         version=version,
@@ -37,8 +39,22 @@ def deployment(spec, namespace, name, version, logger):
         kafka_max_block_ms = os.getenv('KAFKA_MAX_BLOCK_MS', 5000),
         # KAFKA_RETRIES is the number of times the kafka producer will retry sending a message
         kafka_retries = os.getenv('KAFKA_RETRIES', 5),
+        # KAFKA_TELEMETRY_TOPIC is the kafka topic to stream the sampled telemetry to, the stream is disabled if empty
+        kafka_telemetry_topic = os.getenv('KAFKA_TELEMETRY_TOPIC', ''),
+        # KAFKA_COMMANDS_TOPIC is the kafka topic to consume write commands from, the consumer is disabled if empty
+        kafka_commands_topic = os.getenv('KAFKA_COMMANDS_TOPIC', ''),
         # PLC_TIMEOUT is the timeout to make a modbus request to the PLC device
         plc_timeout = spec.get('plc_timeout', 1.0),
+        # STANDBY runs a warm standby replica that takes over the PLC through a Lease when the active replica fails
+        standby = os.getenv('STANDBY', 'false').lower() == 'true',
+        # PERSISTENT_STORAGE keeps the outbox and the spool on the {name}-data claim, those of a PLC with a standby are on an emptyDir
+        persistent = is_persistent(standby=os.getenv('STANDBY', 'false').lower() == 'true'),
+        # LEASE_DURATION_SECONDS is the time after its last renewal the lease of the active replica is taken over
+        lease_duration = os.getenv('LEASE_DURATION_SECONDS', 15),
+        # LEASE_RENEW_DEADLINE_SECONDS is the time the active replica keeps polling while it fails to renew its lease
+        lease_renew_deadline = os.getenv('LEASE_RENEW_DEADLINE_SECONDS', 10),
+        # LEASE_RETRY_INTERVAL_SECONDS is the time between the attempts to acquire or renew the lease
+        lease_retry_interval = os.getenv('LEASE_RETRY_INTERVAL_SECONDS', 2),
         # OTEL_METRICS_EXPORTER is the exporter to use for metrics. valid values are 'otlp', 'console', or both e.g 'console,otlp'
         otel_metrics_exporter = os.getenv('OTEL_METRICS_EXPORTER', 'otlp'),
         # OTEL_EXPORTER_OTLP_METRICS_ENDPOINT is the target to which the metric exporter is going to send metrics
@@ -52,7 +68,7 @@ def deployment(spec, namespace, name, version, logger):
     )
 
     # convert the rendered template to a dict
-    deployment: dict = yaml.safe_load(rendered_template)
+    deployment: dict = parse(rendered_template)
 
     # add the recommended kubernetes labels to the PLCs CR, Deployment, and Pod
     # note: labels are added to the deployments pod template through the nested parameter
@@ -71,24 +87,97 @@ def deployment(spec, namespace, name, version, logger):
     )
 
     # add the CR's uid to the pod's owner references.
-    kopf.adopt(deployment)
+    kopf.adopt(deployment, owner=body)
 
-    # create the deployment
-    k8s_apps_v1 = client.AppsV1Api()
+    # record the hash of the manifest so updates that render identically are skipped
+    annotate(deployment)
 
-    if not deployment_already_exists(name, namespace, logger):
-        k8s_apps_v1.create_namespaced_deployment(
+    # create the deployment
+    if not await deployment_already_exists(name, namespace, logger, index):
+        await kubeapi.call(
+            kubeapi.apps_v1().create_namespaced_deployment,
             body=deployment,
             namespace=namespace
         )
 
 
-def service(name, namespace, logger, version: str):
+async def configmap(spec, namespace, name, logger, body, index: kopf.Index | None = None):
+    """
+    Creates the ConfigMap holding the PLC's spec, the PLC service reloads the spec when the ConfigMap changes.
+    A ConfigMap that renders identically to the indexed one is skipped, so a resumed PLC makes no call for it
+    """
+    template: Template = load_configmap_template()
+    configmap: dict = parse(template.render(name=name, spec=json.dumps(dict(spec))))
+    kopf.label(
+        objs=[configmap],
+        labels={
+            'app.kubernetes.io/name': name,
+            'app.kubernetes.io/instance': f"{namespace}.{name}",
+            'app.kubernetes.io/component': 'plc',
+            'app.kubernetes.io/part-of': 'foreveroceans',
+            'app.kubernetes.io/managed-by': 'plc-operator'
+        }
+    )
+    kopf.adopt(configmap, owner=body)
+    if annotate(configmap) == applied_hash(index, namespace, configmap['metadata']['name']):
+        return
+
+    core_v1 = kubeapi.core_v1()
+    try:
+        await kubeapi.call(core_v1.create_namespaced_config_map, body=configmap, namespace=namespace)
+    except ApiException as e:
+        # the ConfigMap of a resumed PLC already exists
+        if e.status != HTTPStatus.CONFLICT:
+            raise
+        await kubeapi.call(core_v1.patch_namespaced_config_map, name=configmap['metadata']['name'], namespace=namespace, body=configmap)
+        logger.info(f"Found configmap: {configmap['metadata']['name']}")
+
+
+async def volume_claim(namespace, name, logger, body=None, index: kopf.Index | None = None):
+    """
+    Creates the PersistentVolumeClaim holding the outbox and the OTLP spool of the PLC, or of a shard if it has no owner.
+    The spec of a claim can not be changed once it is bound, an existing claim is kept as it is (an indexed claim without a call)
+    """
+    if index is not None and (namespace, f'{name}-data') in index:
+        return
+
+    template: Template = load_pvc_template()
+    claim: dict = parse(template.render(
+        name=name,
+        # STORAGE_CLASS is the storage class of the claim, the default storage class of the cluster if empty
+        storage_class=os.getenv('STORAGE_CLASS', ''),
+        # STORAGE_SIZE is the size of the claim, it holds the outbox (EVENTS_OUTBOX_MAX_BYTES) and the spool (OTEL_SPOOL_CAPACITY_BYTES)
+        storage_size=os.getenv('STORAGE_SIZE', '1Gi'),
+    ))
+    kopf.label(
+        objs=[claim],
+        labels={
+            'app.kubernetes.io/name': name,
+            'app.kubernetes.io/instance': f"{namespace}.{name}",
+            'app.kubernetes.io/component': 'plc' if body is not None else 'plc-shard',
+            'app.kubernetes.io/part-of': 'foreveroceans',
+            'app.kubernetes.io/managed-by': 'plc-operator'
+        }
+    )
+    # the claim of a PLC is deleted with its CR, together with the events it did not deliver yet
+    if body is not None:
+        kopf.adopt(claim, owner=body)
+
+    try:
+        await kubeapi.call(kubeapi.core_v1().create_namespaced_persistent_volume_claim, body=claim, namespace=namespace)
+    except ApiException as e:
+        # the claim of a resumed PLC already exists
+        if e.status != HTTPStatus.CONFLICT:
+            raise
+        logger.info(f"Found volume claim: {claim['metadata']['name']}")
+
+
+async def service(name, namespace, logger, version: str, body, index: kopf.Index | None = None):
     """
     Creates the PLC Service
     """
     template: Template = load_service_template()
-    service: dict = yaml.safe_load(template.render(name=name))
+    service: dict = parse(template.render(name=name, selector=name, target_port=5000, standby=os.getenv('STANDBY', 'false').lower() == 'true'))
     kopf.label(
         objs=[service],
         labels={
@@ -100,42 +189,54 @@ def service(name, namespace, logger, version: str):
             'app.kubernetes.io/managed-by': 'plc-operator'
         }
     )
-    kopf.adopt(service)
-    core_v1_api = client.CoreV1Api()
+    kopf.adopt(service, owner=body)
+    annotate(service)
 
-    if not service_already_exists(name, namespace, logger):
-        core_v1_api.create_namespaced_service(
+    if not await service_already_exists(name, namespace, logger, index):
+        await kubeapi.call(
+            kubeapi.core_v1().create_namespaced_service,
             body=service,
             namespace=namespace,
         )
 
 
-def deployment_already_exists(name, namespace, logger) -> bool:
-    # create the deployment
-    k8s_apps_v1 = client.AppsV1Api()
+async def deployment_already_exists(name, namespace, logger, index: kopf.Index | None = None) -> bool:
+    """
+    Returns True if the deployment exists.
+    The index of the deployments managed by the operator answers without a call to the API server,
+    a deployment that is not in the index is looked up by name
+    """
+    if index is not None and (namespace, name) in index:
+        logger.info(f"Found deployment in index: {name}")
+        return True
 
-    api_response = k8s_apps_v1.list_namespaced_deployment(
-        namespace,
-    )
-    for item in api_response.items:
-        if item.metadata.name == name:
-            logger.info("Found deployment: %s" % item.metadata.name)
-            return True
-    else:
-        return False
+    try:
+        await kubeapi.call(kubeapi.apps_v1().read_namespaced_deployment, name=name, namespace=namespace)
+    except ApiException as e:
+        if e.status == HTTPStatus.NOT_FOUND:
+            return False
+        raise
 
+    logger.info(f"Found deployment: {name}")
+    return True
 
-def service_already_exists(name, namespace, logger) -> bool:
-    # create the deployment
-    core_v1_api = client.CoreV1Api()
 
-    api_response = core_v1_api.list_namespaced_service(
-        namespace,
-    )
-
-    for item in api_response.items:
-        if item.metadata.name == name:
-            logger.info("Found service: %s" % item.metadata.name)
-            return True
-    else:
-        return False
+async def service_already_exists(name, namespace, logger, index: kopf.Index | None = None) -> bool:
+    """
+    Returns True if the service exists.
+    The index of the services managed by the operator answers without a call to the API server,
+    a service that is not in the index is looked up by name
+    """
+    if index is not None and (namespace, name) in index:
+        logger.info(f"Found service in index: {name}")
+        return True
+
+    try:
+        await kubeapi.call(kubeapi.core_v1().read_namespaced_service, name=name, namespace=namespace)
+    except ApiException as e:
+        if e.status == HTTPStatus.NOT_FOUND:
+            return False
+        raise
+
+    logger.info(f"Found service: {name}")
+    return True
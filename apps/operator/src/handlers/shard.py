@@ -0,0 +1,237 @@
+import os
+import json
+import asyncio
+from collections import defaultdict
+from http import HTTPStatus
+
+import kopf
+from kubernetes_asyncio.client.exceptions import ApiException
+from jinja2 import Template
+
+from handlers import create
+from utilities import kubeapi
+from utilities.jinja import load_shard_template, load_service_template, load_configmap_template
+from utilities.manifest import annotate, applied_hash, parse
+from utilities.ring import HashRing, members
+from utilities.storage import is_persistent
+
+_locks: defaultdict[tuple[str, str], asyncio.Lock] = defaultdict(asyncio.Lock)
+""" The lock of each shard by namespace and name, the ports of a shard are read and assigned by one handler at a time """
+
+
+def shard_names(count: int) -> list[str]:
+    return [f'plc-shard-{index}' for index in range(count)]
+
+
+def previous_shards(ring: HashRing, name: str, namespace: str, shards: kopf.Index) -> list[str]:
+    """
+    Returns the shards of the namespace to reconcile before the shard the PLC is assigned to: the shards whose applied
+    ConfigMap lists the PLC, which it ran on before the ring changed, and the shards no longer on the ring
+    """
+    return sorted(
+        shard for (ns, shard), plcs in shards.items()
+        if ns == namespace and shard != ring.node(name) and (shard not in ring.nodes or any(name in names for names in plcs))
+    )
+
+
+async def reconcile_plc(ring: HashRing, name: str, namespace: str, specs: dict[tuple[str, str], dict], logger, deployments: kopf.Index | None = None, services: kopf.Index | None = None, claims: kopf.Index | None = None, shards: kopf.Index | None = None):
+    """
+    Reconciles the shard the PLC is assigned to, after the shards it ran on before a change of the number of shards.
+    A PLC moved to another shard is removed from its previous shard first, so its device is not polled by both shards,
+    and the shards no longer on the ring are retired
+    """
+    for shard in previous_shards(ring, name, namespace, shards or {}):
+        await reconcile(ring, shard, namespace, specs, logger, deployments, services, claims)
+    await reconcile(ring, ring.node(name), namespace, specs, logger, deployments, services, claims)
+
+
+async def reconcile(ring: HashRing, shard: str, namespace: str, specs: dict[tuple[str, str], dict], logger, deployments: kopf.Index | None = None, services: kopf.Index | None = None, claims: kopf.Index | None = None):
+    """
+    Applies the specs of the PLCs assigned to the shard to its ConfigMap, the deployment of the shard and the service of each PLC.
+    The shard reloads the specs from the mounted ConfigMap, so a PLC added, removed or changed does not roll the deployment.
+    The manifests that render identically to the applied ones are skipped, so only the services whose PLCs changed are patched.
+    A shard no longer on the ring has no PLCs assigned and is retired
+    """
+    async with _locks[(namespace, shard)]:
+        applied = await applied_specs(shard, namespace)
+        plcs = members(ring, shard, namespace, specs, {name: plc['port'] for name, plc in applied.items()})
+        if shard not in ring.nodes:
+            # the ConfigMap is deleted after the deployment, a shard without one has been retired
+            if applied:
+                await retire(shard, namespace, logger)
+            return
+        if plcs != applied:
+            await configmap(shard, namespace, plcs, logger)
+
+    if is_persistent():
+        await create.volume_claim(namespace, shard, logger, index=claims)
+    await deployment(shard, namespace, len(plcs), logger, deployments)
+    for name, plc in plcs.items():
+        await service(name, namespace, shard, plc['port'], logger, services)
+
+
+async def applied_specs(shard: str, namespace: str) -> dict[str, dict]:
+    """ Returns the port and spec of each PLC by name in the ConfigMap of the shard, empty if the shard has none yet """
+    try:
+        configmap = await kubeapi.call(kubeapi.core_v1().read_namespaced_config_map, name=f'{shard}-spec', namespace=namespace)
+    except ApiException as e:
+        if e.status != HTTPStatus.NOT_FOUND:
+            raise
+        return {}
+    return json.loads((configmap.data or {}).get('spec.json', '{}'))
+
+
+async def configmap(shard: str, namespace: str, plcs: dict[str, dict], logger):
+    """
+    Creates or patches the ConfigMap holding the port and spec of each PLC of the shard by name
+    """
+    template: Template = load_configmap_template()
+    configmap: dict = parse(template.render(name=shard, spec=json.dumps(plcs)))
+    kopf.label(
+        objs=[configmap],
+        labels={
+            'app.kubernetes.io/name': shard,
+            'app.kubernetes.io/instance': f"{namespace}.{shard}",
+            'app.kubernetes.io/component': 'plc-shard',
+            'app.kubernetes.io/part-of': 'foreveroceans',
+            'app.kubernetes.io/managed-by': 'plc-operator'
+        }
+    )
+
+    core_v1 = kubeapi.core_v1()
+    try:
+        await kubeapi.call(core_v1.create_namespaced_config_map, body=configmap, namespace=namespace)
+    except ApiException as e:
+        if e.status != HTTPStatus.CONFLICT:
+            raise
+        await kubeapi.call(core_v1.patch_namespaced_config_map, name=configmap['metadata']['name'], namespace=namespace, body=configmap)
+    logger.info(f"Applied the specs of the {len(plcs)} plcs of shard {shard}")
+
+
+async def deployment(shard: str, namespace: str, plcs: int, logger, index: kopf.Index | None = None):
+    """
+    Creates or patches the shard Deployment, the PLCs of the shard are read from its ConfigMap
+    """
+    template: Template = load_shard_template()
+    version = os.getenv('SHARD_VERSION', 'latest')
+
+    # render the template with the PLCs of the shard and some additional metadata
+    rendered_template: str = template.render(
+        # NAME is the shard name, the shard consumes the port and spec of each of its PLCs from the {name}-spec ConfigMap
+        name=shard,
+        # PERSISTENT_STORAGE keeps the outboxes and spools of the PLCs on the {name}-data claim of the shard
+        persistent = is_persistent(),
+        # VERSION is the image tag the shards run
+        version=version,
+        # ENVIRONMENT is the environment (e.g dev, qa, prod)
+        environment=os.getenv('ENVIRONMENT', 'default'),
+        # DEBUG is the debug flag to development or debugging feature like console exporter
+        debug = False,
+        # KAFKA_BROKERS is the kafka brokers to connect to
+        kafka_brokers = os.getenv('KAFKA_BROKERS'),
+        # KAFKA_EVENTS_TOPIC is the kafka topic to publish events to
+        kafka_events_topic = os.getenv('KAFKA_EVENTS_TOPIC'),
+        # KAFKA_MAX_BLOCK_MS is the maximum time to block waiting for kafka to respond
+        kafka_max_block_ms = os.getenv('KAFKA_MAX_BLOCK_MS', 5000),
+        # KAFKA_RETRIES is the number of times the kafka producer will retry sending a message
+        kafka_retries = os.getenv('KAFKA_RETRIES', 5),
+        # KAFKA_TELEMETRY_TOPIC is the kafka topic to stream the sampled telemetry to, the stream is disabled if empty
+        kafka_telemetry_topic = os.getenv('KAFKA_TELEMETRY_TOPIC', ''),
+        # KAFKA_COMMANDS_TOPIC is the kafka topic to consume write commands from, the consumer is disabled if empty
+        kafka_commands_topic = os.getenv('KAFKA_COMMANDS_TOPIC', ''),
+        # PLC_TIMEOUT is the timeout to make a modbus request to the PLC devices of the shard
+        plc_timeout = os.getenv('PLC_TIMEOUT', 1.0),
+        # OTEL_METRICS_EXPORTER is the exporter to use for metrics. valid values are 'otlp', 'console', or both e.g 'console,otlp'
+        otel_metrics_exporter = os.getenv('OTEL_METRICS_EXPORTER', 'otlp'),
+        # OTEL_EXPORTER_OTLP_METRICS_ENDPOINT is the target to which the metric exporter is going to send metrics
+        otel_exporter_otlp_metrics_endpoint = os.getenv('OTEL_EXPORTER_OTLP_METRICS_ENDPOINT','telemetry-collector.opentelemetry.svc.cluster.local:4317'),
+        # OTEL_EXPORTER_OTLP_METRICS_TIMEOUT is the maximum time the OTLP exporter will wait for each batch export for metrics.
+        otel_exporter_otlp_metrics_timeout = os.getenv('OTEL_EXPORTER_OTLP_METRICS_TIMEOUT','2500'),
+        # OTEL_EXPORTER_OTLP_METRICS_PROTOCOL represents the the transport protocol for metrics.
+        otel_exporter_otlp_metrics_protocol = os.getenv('OTEL_EXPORTER_OTLP_METRICS_PROTOCOL', 'grpc'),
+        # OTEL_EXPORTER_OTLP_METRICS_INSECURE` represents whether to enable client transport security for gRPC requests for metrics.
+        otel_exporter_otlp_metrics_insecure = os.getenv('OTEL_EXPORTER_OTLP_METRICS_INSECURE', 'true')
+    )
+    deployment: dict = parse(rendered_template)
+
+    # the shard is not owned by a single PLC CR, it is labelled as a shard so the availability of its
+    # deployment is not mistaken for the availability of a PLC
+    kopf.label(
+        objs=[deployment],
+        labels={
+            'app.kubernetes.io/name': shard,
+            'app.kubernetes.io/instance': f"{namespace}.{shard}",
+            'app.kubernetes.io/version': version,
+            'app.kubernetes.io/component': 'plc-shard',
+            'app.kubernetes.io/part-of': 'foreveroceans',
+            'app.kubernetes.io/managed-by': 'plc-operator'
+        },
+        nested='spec.template'
+    )
+
+    if annotate(deployment) == applied_hash(index, namespace, shard):
+        logger.info(f"Shard is unchanged: {shard}")
+        return
+
+    apps_v1 = kubeapi.apps_v1()
+    try:
+        await kubeapi.call(apps_v1.create_namespaced_deployment, body=deployment, namespace=namespace)
+    except ApiException as e:
+        if e.status != HTTPStatus.CONFLICT:
+            raise
+        await kubeapi.call(apps_v1.patch_namespaced_deployment, name=shard, namespace=namespace, body=deployment)
+    logger.info(f"Applied shard {shard} with {plcs} plcs")
+
+
+async def service(name: str, namespace: str, shard: str, port: int, logger, index: kopf.Index | None = None):
+    """
+    Creates or patches the Service of a PLC, which routes to the port of the PLC on its shard
+    """
+    template: Template = load_service_template()
+    service: dict = parse(template.render(name=name, selector=shard, target_port=port, standby=False))
+    kopf.label(
+        objs=[service],
+        labels={
+            'app.kubernetes.io/name': name,
+            'app.kubernetes.io/instance': f"{namespace}.{name}",
+            'app.kubernetes.io/component': 'plc',
+            'app.kubernetes.io/part-of': 'foreveroceans',
+            'app.kubernetes.io/managed-by': 'plc-operator'
+        }
+    )
+    if annotate(service) == applied_hash(index, namespace, name):
+        return
+
+    core_v1 = kubeapi.core_v1()
+    try:
+        await kubeapi.call(core_v1.create_namespaced_service, body=service, namespace=namespace)
+    except ApiException as e:
+        if e.status != HTTPStatus.CONFLICT:
+            raise
+        await kubeapi.call(core_v1.patch_namespaced_service, name=name, namespace=namespace, body=service)
+
+
+async def retire(shard: str, namespace: str, logger):
+    """
+    Deletes the deployment and ConfigMap of a shard no longer on the ring.
+    The claim of the shard is kept, it may hold the events its PLCs did not publish yet
+    """
+    for delete, name in (
+        (kubeapi.apps_v1().delete_namespaced_deployment, shard),
+        (kubeapi.core_v1().delete_namespaced_config_map, f'{shard}-spec'),
+    ):
+        try:
+            await kubeapi.call(delete, name=name, namespace=namespace)
+        except ApiException as e:
+            if e.status != HTTPStatus.NOT_FOUND:
+                raise
+    logger.info(f"Retired shard {shard}, it is no longer on the ring")
+
+
+async def delete_service(name: str, namespace: str):
+    """ Deletes the Service of a PLC removed from its shard """
+    try:
+        await kubeapi.call(kubeapi.core_v1().delete_namespaced_service, name=name, namespace=namespace)
+    except ApiException as e:
+        if e.status != HTTPStatus.NOT_FOUND:
+            raise
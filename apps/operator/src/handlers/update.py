@@ -1,15 +1,18 @@
 import os
-import yaml
+import json
+from http import HTTPStatus
 
 import kopf
 from jinja2 import Template
-from kubernetes import client
-from kubernetes.client.exceptions import ApiException
+from kubernetes_asyncio.client.exceptions import ApiException
 
-from utilities.jinja import load_deployment_template, load_service_template
+from utilities import kubeapi
+from utilities.jinja import load_deployment_template, load_service_template, load_configmap_template
+from utilities.manifest import annotate, applied_hash, parse
+from utilities.storage import is_persistent
 
 
-def deployment(spec, name, namespace, version):
+async def deployment(spec, name, namespace, version, logger, body, index: kopf.Index | None = None):
     """
     Creates the PLC Deployment
     """
@@ -19,9 +22,7 @@ def deployment(spec, name, namespace, version):
     # render the template with the CR's spec and some additional metadata
     # note: do not use the CRs body as an environment variable, the last-applied-configuration causes problems
     rendered_template: str = template.render(
-        # SPEC is the PLC CR's spec so the PLC service can consume it
-        spec=spec,
-        # NAME is the PLC name
+        # NAME is the PLC name, the PLC service consumes the spec from the {name}-spec ConfigMap
         name=name,
         # VERSION is the image tag to use
         version=version,
@@ -37,8 +38,22 @@ def deployment(spec, name, namespace, version):
         kafka_max_block_ms = os.getenv('KAFKA_MAX_BLOCK_MS', 5000),
         # KAFKA_RETRIES is the number of times the kafka producer will retry sending a message
         kafka_retries = os.getenv('KAFKA_RETRIES', 5),
+        # KAFKA_TELEMETRY_TOPIC is the kafka topic to stream the sampled telemetry to, the stream is disabled if empty
+        kafka_telemetry_topic = os.getenv('KAFKA_TELEMETRY_TOPIC', ''),
+        # KAFKA_COMMANDS_TOPIC is the kafka topic to consume write commands from, the consumer is disabled if empty
+        kafka_commands_topic = os.getenv('KAFKA_COMMANDS_TOPIC', ''),
         # PLC_TIMEOUT is the timeout to make a modbus request to the PLC device
         plc_timeout = spec.get('plc_timeout', 1.0),
+        # STANDBY runs a warm standby replica that takes over the PLC through a Lease when the active replica fails
+        standby = os.getenv('STANDBY', 'false').lower() == 'true',
+        # PERSISTENT_STORAGE keeps the outbox and the spool on the {name}-data claim, those of a PLC with a standby are on an emptyDir
+        persistent = is_persistent(standby=os.getenv('STANDBY', 'false').lower() == 'true'),
+        # LEASE_DURATION_SECONDS is the time after its last renewal the lease of the active replica is taken over
+        lease_duration = os.getenv('LEASE_DURATION_SECONDS', 15),
+        # LEASE_RENEW_DEADLINE_SECONDS is the time the active replica keeps polling while it fails to renew its lease
+        lease_renew_deadline = os.getenv('LEASE_RENEW_DEADLINE_SECONDS', 10),
+        # LEASE_RETRY_INTERVAL_SECONDS is the time between the attempts to acquire or renew the lease
+        lease_retry_interval = os.getenv('LEASE_RETRY_INTERVAL_SECONDS', 2),
         # OTEL_METRICS_EXPORTER is the exporter to use for metrics. valid values are 'otlp', 'console', or both e.g 'console,otlp'
         otel_metrics_exporter = os.getenv('OTEL_METRICS_EXPORTER', 'otlp'),
         # OTEL_EXPORTER_OTLP_METRICS_ENDPOINT is the target to which the metric exporter is going to send metrics
@@ -52,7 +67,7 @@ def deployment(spec, name, namespace, version):
     )
 
     # convert the rendered template to a dict
-    deployment: dict = yaml.safe_load(rendered_template)
+    deployment: dict = parse(rendered_template)
 
     # add the recommended kubernetes labels to the PLCs CR, Deployment, and Pod
     # note: labels are added to the deployments pod template through the nested parameter
@@ -71,25 +86,60 @@ def deployment(spec, name, namespace, version):
     )
 
     # add the CR's uid to the pod's owner references.
-    kopf.adopt(deployment)
+    kopf.adopt(deployment, owner=body)
 
-    # create the deployment
-    k8s_apps_v1 = client.AppsV1Api()
+    # skip the patch if the deployment was applied from an identical manifest
+    if annotate(deployment) == applied_hash(index, namespace, name):
+        logger.info(f"Deployment is unchanged: {name}")
+        return
 
-    k8s_apps_v1.patch_namespaced_deployment(
+    # patch the deployment
+    await kubeapi.call(
+        kubeapi.apps_v1().patch_namespaced_deployment,
         name=name,
         namespace=namespace,
         body=deployment,
-        
     )
 
 
-def service(name, namespace, version):
+async def configmap(spec, name, namespace, logger, body, index: kopf.Index | None = None):
+    """
+    Patches the ConfigMap holding the PLC's spec.
+    The PLC service watches the mounted ConfigMap and applies the changed properties without a restart,
+    so a change to the properties does not roll the Deployment. A ConfigMap that renders identically is skipped
+    """
+    template: Template = load_configmap_template()
+    configmap: dict = parse(template.render(name=name, spec=json.dumps(dict(spec))))
+    kopf.label(
+        objs=[configmap],
+        labels={
+            'app.kubernetes.io/name': name,
+            'app.kubernetes.io/instance': f"{namespace}.{name}",
+            'app.kubernetes.io/component': 'plc',
+            'app.kubernetes.io/part-of': 'foreveroceans',
+            'app.kubernetes.io/managed-by': 'plc-operator'
+        }
+    )
+    kopf.adopt(configmap, owner=body)
+    if annotate(configmap) == applied_hash(index, namespace, configmap['metadata']['name']):
+        return
+
+    core_v1 = kubeapi.core_v1()
+    try:
+        await kubeapi.call(core_v1.patch_namespaced_config_map, name=configmap['metadata']['name'], namespace=namespace, body=configmap)
+    except ApiException as e:
+        # the PLCs created before the spec was moved to a ConfigMap do not have one yet
+        if e.status != HTTPStatus.NOT_FOUND:
+            raise
+        await kubeapi.call(core_v1.create_namespaced_config_map, body=configmap, namespace=namespace)
+
+
+async def service(name, namespace, version, logger, body, index: kopf.Index | None = None):
     """
     Creates the PLC Service
     """
     template: Template = load_service_template()
-    service: dict = yaml.safe_load(template.render(name=name))
+    service: dict = parse(template.render(name=name, selector=name, target_port=5000, standby=os.getenv('STANDBY', 'false').lower() == 'true'))
     kopf.label(
         objs=[service],
         labels={
@@ -101,18 +151,23 @@ def service(name, namespace, version):
             'app.kubernetes.io/managed-by': 'plc-operator'
         }
     )
-    kopf.adopt(service)
-    core_v1_api = client.CoreV1Api()
-    core_v1_api.patch_namespaced_service(
+    kopf.adopt(service, owner=body)
+    if annotate(service) == applied_hash(index, namespace, name):
+        logger.info(f"Service is unchanged: {name}")
+        return
+
+    await kubeapi.call(
+        kubeapi.core_v1().patch_namespaced_service,
         name=name,
         body=service,
         namespace=namespace,
     )
 
 
-def status(
+async def status(
+    namespace: str,
     name: str,
-    is_available: bool,
+    status: dict,
     group: str = "foreveroceans.io",
     version: str = "v1",
     plural: str = "plcs",
@@ -121,16 +176,15 @@ def status(
     """
     Updates the PLC CR's status to reflect availability
     """
-    api =   client.CustomObjectsApi()
-
-    try: 
-        api.patch_namespaced_custom_object_status(
+    try:
+        await kubeapi.call(
+            kubeapi.custom_objects().patch_namespaced_custom_object_status,
             group=group,
             version=version,
-            namespace='plc',
+            namespace=namespace,
             plural=plural,
             name=name,
-            body={ 'status': { 'available': str(is_available) } },
+            body={ 'status': status },
         )
     except ApiException as e:
-        logger.exception(f"Failed to update plc status")
\ No newline at end of file
+        logger.exception(f"Failed to update plc status")
@@ -1,19 +1,48 @@
 import os
+import json
 
 import kopf
 
-from handlers import create, update
+from handlers import create, update, shard
+from utilities import kubeapi, manifest
+from utilities.status import StatusWriter
+from utilities.scraper import StatsScraper, summarize
 from utilities.tunnel import ServiceTunnel
+from utilities.ring import HashRing
+from utilities.storage import is_persistent
+
+# SHARDS is the number of shard deployments the PLCs are assigned to by consistent hashing, a deployment per PLC if 0
+SHARDS = int(os.getenv("SHARDS", 0))
+ring = HashRing(shard.shard_names(SHARDS)) if SHARDS > 0 else None
+
+# STANDBY runs two replicas of every PLC, their outbox and spool are on an emptyDir as they can not share a ReadWriteOnce claim
+STANDBY = os.getenv("STANDBY", "false").lower() == "true"
 
 
 @kopf.on.startup()
-def startup(logger, settings, **kwargs):
+async def startup(logger, settings, memo, **kwargs):
     """
     Execute this handler when the operator starts.
     No call to the API server is made until this handler
     completes successfully.
     """
-    settings.execution.max_workers = 5
+    # the handlers are coroutines sharing one pooled api client, MAX_CONCURRENT_REQUESTS bounds the calls in flight
+    await kubeapi.connect(concurrency=int(os.getenv("MAX_CONCURRENT_REQUESTS", 20)))
+
+    # the availability transitions of a PLC within STATUS_DEBOUNCE_SECONDS are written to its status at once,
+    # STATUS_WRITES_PER_SECOND bounds the status writes of all the PLCs
+    memo.status_writer = StatusWriter(
+        write=lambda namespace, name, status: update.status(namespace, name, status, logger=logger),
+        debounce=float(os.getenv("STATUS_DEBOUNCE_SECONDS", 5)),
+        rate=float(os.getenv("STATUS_WRITES_PER_SECOND", 10)),
+    )
+
+    # the stats of the PLC services are scraped with at most STATS_CONCURRENCY requests in flight
+    memo.stats_scraper = StatsScraper(
+        concurrency=int(os.getenv("STATS_CONCURRENCY", 20)),
+        timeout=float(os.getenv("STATS_TIMEOUT_SECONDS", 5)),
+    )
+
     settings.networking.request_timeout = 30
     settings.networking.connect_timeout = 10
     settings.persistence.finalizer = 'plc.foreveroceans.io/finalizer'
@@ -39,35 +68,108 @@ def startup(logger, settings, **kwargs):
 
 
 @kopf.on.cleanup()
-def cleanup(logger, **kwargs):
+async def cleanup(logger, memo, **kwargs):
+    await memo.stats_scraper.close()
+    await memo.status_writer.close()
+    await kubeapi.close()
     logger.info("im shutting down. Goodbye!")
 
 
+@kopf.index('deployments', labels={'app.kubernetes.io/managed-by': 'plc-operator'})
+async def managed_deployments(namespace, name, annotations, **kwargs):
+    """
+    Indexes the hash of the manifest of the deployments managed by the operator by namespace and name.
+    kopf fills the index from a single list and keeps it current from the watch stream before any handler runs,
+    so the existence checks on resume do not list the deployments once per PLC
+    """
+    return {(namespace, name): annotations.get(manifest.HASH_ANNOTATION)}
+
+
+@kopf.index('services', labels={'app.kubernetes.io/managed-by': 'plc-operator'})
+async def managed_services(namespace, name, annotations, **kwargs):
+    """ Indexes the hash of the manifest of the services managed by the operator by namespace and name """
+    return {(namespace, name): annotations.get(manifest.HASH_ANNOTATION)}
+
+
+@kopf.index('configmaps', labels={'app.kubernetes.io/managed-by': 'plc-operator'})
+async def managed_configmaps(namespace, name, annotations, **kwargs):
+    """ Indexes the hash of the manifest of the spec ConfigMaps managed by the operator by namespace and name """
+    return {(namespace, name): annotations.get(manifest.HASH_ANNOTATION)}
+
+
+@kopf.index('configmaps', labels={'app.kubernetes.io/managed-by': 'plc-operator', 'app.kubernetes.io/component': 'plc-shard'})
+async def shard_members(namespace, labels, body, **kwargs):
+    """
+    Indexes the names of the PLCs in the applied spec ConfigMap of each shard by namespace and shard name,
+    so a PLC moved to another shard by a change of SHARDS is removed from the shard it ran on
+    """
+    return {(namespace, labels['app.kubernetes.io/name']): list(json.loads((body.get('data') or {}).get('spec.json', '{}')))}
+
+
+@kopf.index('persistentvolumeclaims', labels={'app.kubernetes.io/managed-by': 'plc-operator'})
+async def managed_claims(namespace, name, **kwargs):
+    """ Indexes the claims managed by the operator by namespace and name, an existing claim is never patched """
+    return {(namespace, name): True}
+
+
+@kopf.index('plcs.foreveroceans.io')
+async def plc_specs(namespace, name, spec, **kwargs):
+    """ Indexes the specs of the PLC CRs by namespace and name, the shards are rendered from the specs of their PLCs """
+    return {(namespace, name): dict(spec)} if ring is not None else None
+
+
+def get_specs(index: kopf.Index) -> dict[tuple[str, str], dict]:
+    """ Returns the spec of every indexed PLC """
+    return {key: next(iter(specs)) for key, specs in index.items()}
+
+
 @kopf.on.resume('plcs.foreveroceans.io')
 @kopf.on.create('plcs.foreveroceans.io')
-def on_create(spec, name, namespace, patch, logger, **kwargs):
-    """ Create the PLC Deployment and Service """
+async def on_create(spec, name, namespace, body, patch, logger, managed_deployments: kopf.Index, managed_services: kopf.Index, managed_configmaps: kopf.Index, managed_claims: kopf.Index, plc_specs: kopf.Index, shard_members: kopf.Index, **kwargs):
+    """ Create the PLC spec, Deployment and Service, or add the PLC to its shard """
+    if ring is not None:
+        specs = {**get_specs(plc_specs), (namespace, name): dict(spec)}
+        await shard.reconcile_plc(ring, name, namespace, specs, logger, managed_deployments, managed_services, managed_claims, shard_members)
+        return
+
     version = spec.get('version', 'latest')
-    create.deployment(spec, namespace, name, version, logger)
-    create.service(name, namespace, logger, version)
+    await create.configmap(spec, namespace, name, logger, body, index=managed_configmaps)
+    if is_persistent(standby=STANDBY):
+        await create.volume_claim(namespace, name, logger, body, index=managed_claims)
+    await create.deployment(spec, namespace, name, version, logger, body, index=managed_deployments)
+    await create.service(name, namespace, logger, version, body, index=managed_services)
 
 
 @kopf.on.update("plcs.foreveroceans.io")
-def on_update(spec, name, namespace, **kwargs):
-    """ Update the PLC Deployment and Service"""
+async def on_update(spec, name, namespace, body, logger, managed_deployments: kopf.Index, managed_services: kopf.Index, managed_configmaps: kopf.Index, managed_claims: kopf.Index, plc_specs: kopf.Index, shard_members: kopf.Index, **kwargs):
+    """ Update the PLC spec, Deployment and Service, or the shard of the PLC. A change of the properties only patches the spec """
+    if ring is not None:
+        specs = {**get_specs(plc_specs), (namespace, name): dict(spec)}
+        await shard.reconcile_plc(ring, name, namespace, specs, logger, managed_deployments, managed_services, managed_claims, shard_members)
+        return
+
     version = spec.get('version', 'latest')
-    update.deployment(spec, name, namespace, version)
-    update.service(name, namespace, version)
+    await update.configmap(spec, name, namespace, logger, body, index=managed_configmaps)
+    # the spec of a claim can not be changed, an update only creates the claim of a PLC created without one
+    if is_persistent(standby=STANDBY):
+        await create.volume_claim(namespace, name, logger, body, index=managed_claims)
+    await update.deployment(spec, name, namespace, version, logger, body, index=managed_deployments)
+    await update.service(name, namespace, version, logger, body, index=managed_services)
 
 
 @kopf.on.delete("plcs.foreveroceans.io")
-def on_delete(logger, **kwargs):
-    """ Owner reference will delete the deployment and service."""
+async def on_delete(name, namespace, logger, managed_deployments: kopf.Index, managed_services: kopf.Index, managed_configmaps: kopf.Index, managed_claims: kopf.Index, plc_specs: kopf.Index, shard_members: kopf.Index, **kwargs):
+    """ Owner reference will delete the deployment and service, a sharded PLC is removed from its shard """
     logger.info("on_delete plcs.foreveroceans.io")
+    if ring is not None:
+        specs = get_specs(plc_specs)
+        specs.pop((namespace, name), None)
+        await shard.reconcile_plc(ring, name, namespace, specs, logger, managed_deployments, managed_services, managed_claims, shard_members)
+        await shard.delete_service(name, namespace)
 
 
 @kopf.on.mutate("plcs.foreveroceans.io", operation="CREATE")
-def k8slabel(spec, name, namespace, patch, **kwargs):
+async def k8slabel(spec, name, namespace, patch, **kwargs):
     """ On admission attach the k8s labels to the PLC CR """
     kopf.label(
         objs=[patch],
@@ -87,12 +189,18 @@ def is_deployment_available(condition) -> bool:
     return condition["type"] == "Available" and condition["status"] == "True"
 
 
+@kopf.index('plcs.foreveroceans.io')
+async def plc_transitions(namespace, name, status, **kwargs):
+    """ Indexes the availability transitions recorded in the status of the PLC CRs by namespace and name """
+    return {(namespace, name): status.get('transitions', 0)}
+
+
 @kopf.on.field(
     'deployments',
     field='status.conditions',
-    labels={'app.kubernetes.io/managed-by': 'plc-operator'},
+    labels={'app.kubernetes.io/managed-by': 'plc-operator', 'app.kubernetes.io/component': 'plc'},
 )
-def deployment_status_changed(name, old, new, logger, **kwargs):
+async def deployment_status_changed(name, namespace, old, new, logger, memo, plc_transitions: kopf.Index, **kwargs):
     """
     When the deployment status changes, update the PLC CR status if it has changed.
     The deployment status reflects the pod being ready.
@@ -103,4 +211,24 @@ def deployment_status_changed(name, old, new, logger, **kwargs):
 
     if was_available != is_available:
         logger.info(f"[plc/status] {name} deployment status changed to {is_available}")
-        update.status(name, is_available, logger=logger)
+        transitions = next(iter(plc_transitions.get((namespace, name), [])), 0)
+        memo.status_writer.submit(namespace, name, is_available, transitions)
+
+
+@kopf.timer('plcs.foreveroceans.io', interval=float(os.getenv("STATS_INTERVAL_SECONDS", 60)))
+async def scrape_stats(name, namespace, status, memo, logger, **kwargs):
+    """
+    Scrapes the stats of an available PLC service on an interval and merges the summary into the PLC CR status,
+    the summary is written together with any availability change of the same PLC
+    """
+    # the availability of a sharded PLC is not tracked, its service is scraped regardless
+    if ring is None and status.get('available') != 'True':
+        return
+
+    try:
+        stats = await memo.stats_scraper.scrape(namespace, name)
+    except Exception as e:
+        logger.warning(f"[plc/stats] failed to scrape the stats of {name}: {e}")
+        return
+
+    memo.status_writer.update(namespace, name, {'stats': summarize(stats)})
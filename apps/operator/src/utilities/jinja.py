@@ -1,14 +1,30 @@
 import os
+import threading
 
 from jinja2 import Template, StrictUndefined
 
+_templates: dict[str, tuple[int, Template]] = {}
+""" The compiled templates by path and the modification time of the file they were compiled from """
+_lock = threading.Lock()
+
 
 def load_template(path: str) -> Template:
     """
-    Loads a jinja2 template from a file
+    Loads a jinja2 template from a file.
+    The template is compiled once and reused until the file is modified
     """
+    mtime = os.stat(path).st_mtime_ns
+    with _lock:
+        cached = _templates.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
     with open(path, 'rt') as f:
-        return Template(f.read(), undefined=StrictUndefined)
+        template = Template(f.read(), undefined=StrictUndefined)
+
+    with _lock:
+        _templates[path] = (mtime, template)
+    return template
 
 
 def load_deployment_template() -> Template:
@@ -32,4 +48,39 @@ def load_service_template() -> Template:
     else:
         path = '/usr/app/kubernetes/service.yaml'
 
-    return load_template(path)
\ No newline at end of file
+    return load_template(path)
+
+
+def load_shard_template() -> Template:
+    """
+    Loads the shard deployment template
+    """
+    if os.getenv("ENVIRONMENT", "dev") == "dev":
+        path = './apps/operator/kubernetes/shard.yaml'
+    else:
+        path = '/usr/app/kubernetes/shard.yaml'
+
+    return load_template(path)
+
+
+def load_configmap_template() -> Template:
+    """
+    Loads the template of the ConfigMap holding the spec of a PLC
+    """
+    if os.getenv("ENVIRONMENT", "dev") == "dev":
+        path = './apps/operator/kubernetes/configmap.yaml'
+    else:
+        path = '/usr/app/kubernetes/configmap.yaml'
+
+    return load_template(path)
+
+def load_pvc_template() -> Template:
+    """
+    Loads the template of the PersistentVolumeClaim holding the outbox and the OTLP spool of a PLC
+    """
+    if os.getenv("ENVIRONMENT", "dev") == "dev":
+        path = './apps/operator/kubernetes/pvc.yaml'
+    else:
+        path = '/usr/app/kubernetes/pvc.yaml'
+
+    return load_template(path)
@@ -0,0 +1,56 @@
+import asyncio
+
+from kubernetes_asyncio import client, config
+from kubernetes_asyncio.config import ConfigException
+
+_api_client: client.ApiClient | None = None
+""" The api client shared by the handlers, its connections to the API server are pooled and reused """
+
+_semaphore: asyncio.Semaphore | None = None
+""" Bounds the number of calls to the API server in flight at once """
+
+
+async def connect(concurrency: int, configuration: client.Configuration | None = None):
+    """
+    Creates the shared api client, from the in-cluster service account or the local kubeconfig
+    unless a configuration is given
+    """
+    global _api_client, _semaphore
+
+    if configuration is None:
+        configuration = client.Configuration()
+        try:
+            config.load_incluster_config(client_configuration=configuration)
+        except ConfigException:
+            await config.load_kube_config(client_configuration=configuration)
+
+    # one pooled connection per call in flight
+    configuration.connection_pool_maxsize = concurrency
+    _api_client = client.ApiClient(configuration)
+    _semaphore = asyncio.Semaphore(concurrency)
+
+
+async def close():
+    """ Closes the connections of the shared api client """
+    global _api_client
+    if _api_client is not None:
+        await _api_client.close()
+        _api_client = None
+
+
+async def call(method, *args, **kwargs):
+    """ Calls the API server, waiting for a free slot when the maximum number of calls are in flight """
+    async with _semaphore:
+        return await method(*args, **kwargs)
+
+
+def apps_v1() -> client.AppsV1Api:
+    return client.AppsV1Api(_api_client)
+
+
+def core_v1() -> client.CoreV1Api:
+    return client.CoreV1Api(_api_client)
+
+
+def custom_objects() -> client.CustomObjectsApi:
+    return client.CustomObjectsApi(_api_client)
@@ -0,0 +1,35 @@
+import json
+import hashlib
+
+import kopf
+import yaml
+
+HASH_ANNOTATION = 'plc.foreveroceans.io/manifest-hash'
+""" The annotation holding the hash of the rendered manifest a resource was last applied from """
+
+_Loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+""" The libyaml loader if pyyaml is built with it, it parses a rendered manifest an order of magnitude faster than the pure python loader """
+
+
+def parse(rendered: str) -> dict:
+    """ Returns the manifest of a rendered template """
+    return yaml.load(rendered, Loader=_Loader)
+
+
+def digest(manifest: dict) -> str:
+    """ Returns the sha256 of the manifest, independent of the order of its keys """
+    return hashlib.sha256(json.dumps(manifest, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+
+def annotate(manifest: dict) -> str:
+    """ Adds the hash of the manifest to its annotations and returns the hash """
+    value = digest(manifest)
+    manifest.setdefault('metadata', {}).setdefault('annotations', {})[HASH_ANNOTATION] = value
+    return value
+
+
+def applied_hash(index: kopf.Index | None, namespace: str, name: str) -> str | None:
+    """ Returns the hash of the manifest the indexed resource was last applied from, None if it is unknown """
+    if index is None or (namespace, name) not in index:
+        return None
+    return next(iter(index[(namespace, name)]), None)
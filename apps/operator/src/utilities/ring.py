@@ -0,0 +1,44 @@
+import bisect
+import hashlib
+
+FIRST_PORT = 5000
+""" The port of the first PLC of a shard, a PLC added to a shard serves its api on the lowest port not taken by another PLC """
+
+
+def position(key: str) -> int:
+    """ Returns the position of the key on the ring """
+    return int.from_bytes(hashlib.sha1(key.encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    """
+    Assigns keys to nodes by consistent hashing.
+    Every node is placed at many points of the ring and a key belongs to the node of the first point after it,
+    so adding a node only moves the keys that now fall on its points, about 1/n of the keys.
+    """
+
+    def __init__(self, nodes: list[str], replicas: int = 128):
+        self.nodes = list(nodes)
+        self.points = sorted((position(f'{node}#{replica}'), node) for node in nodes for replica in range(replicas))
+        self.positions = [point for point, _ in self.points]
+
+
+    def node(self, key: str) -> str:
+        """ Returns the node the key is assigned to """
+        index = bisect.bisect(self.positions, position(key)) % len(self.points)
+        return self.points[index][1]
+
+
+def members(ring: HashRing, shard: str, namespace: str, specs: dict[tuple[str, str], dict], ports: dict[str, int]) -> dict[str, dict]:
+    """
+    Returns the port and spec of the PLCs of the namespace assigned to the shard by name.
+    A PLC keeps the port it was assigned (ports), so adding or removing a PLC does not move the others.
+    The PLCs new to the shard are assigned the lowest free ports in the order of their names
+    """
+    names = sorted(name for (ns, name) in specs if ns == namespace and ring.node(name) == shard)
+    assigned = {name: ports[name] for name in names if name in ports}
+    free = (port for port in range(FIRST_PORT, FIRST_PORT + len(names) + len(assigned)) if port not in assigned.values())
+    return {
+        name: {'port': assigned[name] if name in assigned else next(free), 'spec': specs[(namespace, name)]}
+        for name in names
+    }
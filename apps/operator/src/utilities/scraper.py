@@ -0,0 +1,52 @@
+import asyncio
+from datetime import datetime, timezone
+
+import aiohttp
+
+
+class StatsScraper:
+    """
+    Scrapes the stats endpoint of the PLC services over one pooled http session.
+    The scrapes of all PLCs share a bound on the requests in flight, so a fleet wide round does not flood the cluster.
+    """
+
+    def __init__(self, concurrency: int, timeout: float, port: int = 5000):
+        self.port = port
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=timeout),
+            connector=aiohttp.TCPConnector(limit=concurrency),
+        )
+
+
+    async def scrape(self, namespace: str, name: str) -> dict:
+        """ Returns the stats of the PLC service, raises if the service can not be reached """
+        async with self.semaphore:
+            async with self.session.get(f'http://{name}.{namespace}.svc:{self.port}/api/stats') as response:
+                response.raise_for_status()
+                return await response.json()
+
+
+    async def close(self):
+        await self.session.close()
+
+
+def summarize(stats: dict) -> dict:
+    """ Returns the fields of the CR status summarizing the stats of a PLC service """
+    def rounded(value, digits: int = 1):
+        return None if value is None else round(value, digits)
+
+    budget = stats['budget']
+    return {
+        'cycleMs': rounded(stats['cycles']['mean_ms']),
+        'maxCycleMs': rounded(stats['cycles']['max_ms']),
+        'overruns': stats['cycles']['overruns'],
+        'errorRate': rounded(stats['modbus']['error_rate'], 4),
+        'p50Ms': rounded(stats['modbus']['p50_ms']),
+        'p99Ms': rounded(stats['modbus']['p99_ms']),
+        'subscribers': stats['subscribers'],
+        'budgetUsed': rounded(budget['used'], 2),
+        'budgetLimit': budget['limit'],
+        'overBudget': budget['limit'] is not None and budget['used'] > budget['limit'],
+        'scrapeTime': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+    }
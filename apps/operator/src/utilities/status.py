@@ -0,0 +1,75 @@
+import time
+import asyncio
+from datetime import datetime, timezone
+from typing import Awaitable, Callable
+
+
+class StatusWriter:
+    """
+    Writes the availability and the stats of the PLCs to the status of their custom resources.
+    The updates of a PLC are coalesced for the debounce window that follows the first one and written in a single
+    patch with the latest state, so a flapping PLC costs one write per window. The writes of all PLCs are spaced
+    to at most `rate` per second.
+    """
+
+    def __init__(self, write: Callable[[str, str, dict], Awaitable], debounce: float, rate: float):
+        self.write = write
+        """ Writes the status of the custom resource of the namespace and name """
+        self.debounce = debounce
+        self.interval = 1 / rate if rate > 0 else 0
+        self.next_write = 0.0
+        """ The monotonic time of the next write slot """
+
+        self.pending: dict[tuple[str, str], dict] = {}
+        """ The latest status of each PLC waiting to be written """
+        self.transitions: dict[tuple[str, str], int] = {}
+        """ The number of availability transitions of each PLC """
+        self.tasks: set[asyncio.Task] = set()
+
+
+    def submit(self, namespace: str, name: str, is_available: bool, transitions: int = 0):
+        """
+        Records a transition of the availability of a PLC and schedules the write of its status.
+        The transitions already recorded in the status of the custom resource are counted from on the first transition.
+        """
+        key = (namespace, name)
+        self.transitions[key] = self.transitions.get(key, transitions) + 1
+        self.update(namespace, name, {
+            'available': str(is_available),
+            'transitions': self.transitions[key],
+            'lastTransitionTime': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        })
+
+
+    def update(self, namespace: str, name: str, status: dict):
+        """ Merges the fields into the pending status of a PLC and schedules its write """
+        key = (namespace, name)
+        scheduled = key in self.pending
+        self.pending.setdefault(key, {}).update(status)
+        if not scheduled:
+            task = asyncio.create_task(self.flush(key))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+
+    async def throttle(self):
+        """ Waits for the next write slot """
+        now = time.monotonic()
+        slot = max(now, self.next_write)
+        self.next_write = slot + self.interval
+        await asyncio.sleep(slot - now)
+
+
+    async def flush(self, key: tuple[str, str]):
+        await asyncio.sleep(self.debounce)
+        await self.throttle()
+
+        # the transitions while waiting for the write slot are coalesced as well
+        status = self.pending.pop(key)
+        namespace, name = key
+        await self.write(namespace, name, status)
+
+
+    async def close(self):
+        """ Writes the pending statuses """
+        await asyncio.gather(*self.tasks, return_exceptions=True)
@@ -0,0 +1,11 @@
+import os
+
+
+def is_persistent(standby: bool = False) -> bool:
+    """
+    Returns True if the outbox and the OTLP spool of a PLC are kept on its <name>-data PersistentVolumeClaim (PERSISTENT_STORAGE, default true),
+    so the undelivered events and metrics survive the replacement of the pod (a rollout, a node drain or an eviction).
+    The replicas of a PLC with a standby run on different nodes and can not share a ReadWriteOnce claim, their outbox and
+    spool are on an emptyDir like without PERSISTENT_STORAGE, which only survives a restart of the container within the same pod
+    """
+    return os.getenv('PERSISTENT_STORAGE', 'true').lower() == 'true' and not standby
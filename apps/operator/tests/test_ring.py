@@ -0,0 +1,52 @@
+from src.utilities.ring import FIRST_PORT, HashRing, members
+
+def specs(*names, namespace='plc'):
+    return {(namespace, name): {'base': f'modbus+tcp://{name}:502/1'} for name in names}
+
+def ports(plcs):
+    return {name: plc['port'] for name, plc in plcs.items()}
+
+def test_members_assigns_ports_in_name_order():
+    ring = HashRing(['plc-shard-0'])
+    plcs = members(ring, 'plc-shard-0', 'plc', specs('c', 'a', 'b'), {})
+    assert ports(plcs) == {'a': FIRST_PORT, 'b': FIRST_PORT + 1, 'c': FIRST_PORT + 2}
+    assert plcs['a']['spec'] == {'base': 'modbus+tcp://a:502/1'}
+
+def test_members_keep_their_ports_when_a_plc_is_removed_or_added():
+    ring = HashRing(['plc-shard-0'])
+    applied = ports(members(ring, 'plc-shard-0', 'plc', specs('a', 'b', 'c', 'd'), {}))
+    removed = ports(members(ring, 'plc-shard-0', 'plc', specs('a', 'c', 'd'), applied))
+    assert removed == {'a': applied['a'], 'c': applied['c'], 'd': applied['d']}
+    added = ports(members(ring, 'plc-shard-0', 'plc', specs('a', 'c', 'd', 'aa', 'e'), removed))
+    assert {name: added[name] for name in removed} == removed
+
+def test_members_new_plcs_take_the_lowest_free_ports():
+    ring = HashRing(['plc-shard-0'])
+    applied = {'a': FIRST_PORT, 'c': FIRST_PORT + 2, 'e': FIRST_PORT + 4}
+    plcs = ports(members(ring, 'plc-shard-0', 'plc', specs('a', 'b', 'c', 'd', 'e', 'f'), applied))
+    assert plcs == {**applied, 'b': FIRST_PORT + 1, 'd': FIRST_PORT + 3, 'f': FIRST_PORT + 5}
+
+def test_members_are_the_plcs_of_the_namespace_on_the_shard():
+    ring = HashRing(['plc-shard-0', 'plc-shard-1'])
+    names = [f'plc{i:03d}' for i in range(50)]
+    all_specs = {**specs(*names), **specs('other', namespace='default')}
+    shards = {shard: members(ring, shard, 'plc', all_specs, {}) for shard in ring.nodes}
+    assert all(ring.node(name) == shard for shard, plcs in shards.items() for name in plcs)
+    assert sorted(name for plcs in shards.values() for name in plcs) == names
+
+def test_ring_is_deterministic():
+    assert [HashRing(['a', 'b', 'c']).node(f'plc{i}') for i in range(100)] == [HashRing(['c', 'b', 'a']).node(f'plc{i}') for i in range(100)]
+
+def test_adding_a_node_moves_about_1_over_n_of_the_keys():
+    keys = [f'plc{i:04d}' for i in range(5000)]
+    before = HashRing([f'plc-shard-{i}' for i in range(4)])
+    after = HashRing([f'plc-shard-{i}' for i in range(5)])
+    moved = [key for key in keys if before.node(key) != after.node(key)]
+    assert all(after.node(key) == 'plc-shard-4' for key in moved)
+    assert 0.15 < len(moved) / len(keys) < 0.25
+
+def test_removing_a_node_only_moves_its_keys():
+    keys = [f'plc{i:04d}' for i in range(5000)]
+    before = HashRing([f'plc-shard-{i}' for i in range(5)])
+    after = HashRing([f'plc-shard-{i}' for i in range(4)])
+    assert all(before.node(key) == 'plc-shard-4' for key in keys if before.node(key) != after.node(key))
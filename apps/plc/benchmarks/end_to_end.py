@@ -0,0 +1,283 @@
+"""
+Benchmarks the hot paths of a PLC service end to end against the Modbus TCP simulator of its spec.
+
+The real ModbusClient, PLC servient and flask api run in this process against apps/plc/benchmarks/simulator.py,
+kafka and the opentelemetry exporters are not started. The benchmark runs three stages one after the other:
+
+  modbus  reads the observed properties through the ModbusClient back to back for the duration
+  poll    polls every observed property through the PLC servient (PLC.poll) back to back for the cycles
+  http    requests a property read and the snapshot from the api with concurrent keep-alive clients for the duration
+
+It reports the transactions per second served by the simulator, the read latency percentiles, the poll cycle duration,
+the PDUs per poll cycle and the requests per second and latency percentiles of the endpoints as JSON. With a baseline
+(the JSON of an earlier run) the metrics that got worse by more than the tolerance are reported as regressions and the
+benchmark exits with 1, so it can gate a change of the hot paths.
+
+usage: python3 apps/plc/benchmarks/end_to_end.py --properties 100 --latency 0.002 --jitter 0.001 --output baseline.json
+       python3 apps/plc/benchmarks/end_to_end.py --properties 100 --latency 0.002 --jitter 0.001 --baseline baseline.json
+       python3 apps/plc/benchmarks/end_to_end.py --spec spec.json --registers 65536 --stages poll
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+import statistics
+import http.client
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from http_server import client, percentile
+from simulator import Simulator, build_spec, free_port
+
+STAGES = ('modbus', 'poll', 'http')
+
+REGRESSIONS = {
+    'modbus.tps': 'higher',
+    'modbus.latency_ms.p50': 'lower',
+    'modbus.latency_ms.p99': 'lower',
+    'poll.cycle_ms.mean': 'lower',
+    'poll.cycle_ms.p99': 'lower',
+    'poll.pdus_per_cycle': 'lower',
+    'http.read.rps': 'higher',
+    'http.read.latency_ms.p99': 'lower',
+    'http.snapshot.rps': 'higher',
+    'http.snapshot.latency_ms.p99': 'lower',
+}
+""" The metrics compared with the baseline and whether higher or lower is better """
+
+
+def configure(spec: dict, http_port: int, args):
+    """ Initializes the configuration of the service from the environment, as main.py does """
+    os.environ.update({
+        'NAME': 'simulator',
+        'SPEC': repr(spec),
+        'ENVIRONMENT': 'benchmark',
+        'FLASK_PORT': str(http_port),
+        'HTTP_THREADS': str(args.concurrency),
+        'PLC_TIMEOUT': str(args.timeout),
+        'KUBERNETES_POD_UID': 'simulator',
+        'KUBERNETES_POD_NAME': 'simulator',
+        'KUBERNETES_NAMESPACE_NAME': 'benchmark',
+        'KAFKA_BROKERS': '127.0.0.1:9',
+        'KAFKA_EVENTS_TOPIC': 'events',
+    })
+    import config
+    config.initialize()
+
+
+def latency_summary(samples: list[float]) -> dict:
+    """ Returns the percentiles of the latencies in milliseconds """
+    samples = sorted(samples)
+    return {
+        'p50': percentile(samples, 50),
+        'p90': percentile(samples, 90),
+        'p99': percentile(samples, 99),
+        'max': round(samples[-1], 3) if samples else None,
+    }
+
+
+def bench_modbus(plc, simulator: Simulator, names: list[str], duration: float) -> dict:
+    """ Reads the properties through the modbus client back to back, as the exports of the PLC do """
+    from config import config
+
+    forms = [config.plc.get_property_form(name) for name in names]
+    latencies, errors = [], 0
+    served = simulator.served()
+    start = time.perf_counter()
+    deadline = start + duration
+    while time.perf_counter() < deadline:
+        for form in forms:
+            began = time.perf_counter()
+            value = plc.modbus_client.read(form)
+            latencies.append((time.perf_counter() - began) * 1E3)
+            errors += value is None
+    elapsed = time.perf_counter() - start
+    pdus = simulator.served() - served
+
+    return {
+        'reads': len(latencies),
+        'errors': errors,
+        'pdus': pdus,
+        'tps': round(pdus / elapsed, 1),
+        'latency_ms': latency_summary(latencies),
+    }
+
+
+def bench_poll(plc, simulator: Simulator, names: list[str], cycles: int) -> dict:
+    """ Polls every observed property through the PLC servient, one cycle after the other """
+    durations = []
+    served = simulator.served()
+    start = time.perf_counter()
+    for _ in range(cycles):
+        began = time.perf_counter()
+        plc.poll()
+        durations.append((time.perf_counter() - began) * 1E3)
+    elapsed = time.perf_counter() - start
+    pdus = simulator.served() - served
+
+    return {
+        'cycles': cycles,
+        'properties': len(names),
+        'pdus_per_cycle': round(pdus / cycles, 1),
+        'tps': round(pdus / elapsed, 1),
+        'cycle_ms': {
+            'mean': round(statistics.mean(durations), 3),
+            **latency_summary(durations),
+        },
+    }
+
+
+def bench_endpoint(url: str, concurrency: int, duration: float) -> dict:
+    """ Requests the endpoint with concurrent keep-alive clients, as benchmarks/http_server.py """
+    latencies, errors, lock = [], [0], threading.Lock()
+    deadline = time.perf_counter() + duration
+    threads = [
+        threading.Thread(target=client, args=(urlparse(url), deadline, latencies, errors, lock))
+        for _ in range(concurrency)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'rps': round(len(latencies) / elapsed, 1),
+        'latency_ms': latency_summary(latencies),
+    }
+
+
+def wait_until_serving(host: str, port: int, timeout: float = 30):
+    """ Waits until the api answers its liveness probe """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection(host, port, timeout=1)
+            connection.request('GET', '/livez')
+            connection.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError(f'the api did not answer on {host}:{port} within {timeout}s')
+
+
+def lookup(results: dict, metric: str):
+    for key in metric.split('.'):
+        if not isinstance(results, dict) or key not in results:
+            return None
+        results = results[key]
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[dict]:
+    """ Returns the metrics that got worse than the baseline by more than the tolerance (a fraction of the baseline) """
+    regressions = []
+    for metric, better in REGRESSIONS.items():
+        current, previous = lookup(results, metric), lookup(baseline, metric)
+        if current is None or not previous:
+            continue
+        change = (current - previous) / previous
+        if (better == 'higher' and change < -tolerance) or (better == 'lower' and change > tolerance):
+            regressions.append({'metric': metric, 'baseline': previous, 'current': current, 'change': round(change, 3)})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--spec', help='the json file of the spec of the PLC, a spec is generated if not set')
+    parser.add_argument('--properties', type=int, default=100, help='the number of properties of the generated spec')
+    parser.add_argument('--latency', type=float, default=0.001, help='the seconds each modbus request takes on the simulator')
+    parser.add_argument('--jitter', type=float, default=0.0, help='the maximum seconds added to or removed from the latency')
+    parser.add_argument('--registers', type=int, default=0, help='the minimum number of coils and holding registers of the simulator')
+    parser.add_argument('--timeout', type=float, default=1.0, help='the timeout of a modbus request in seconds (PLC_TIMEOUT)')
+    parser.add_argument('--duration', type=float, default=10, help='the seconds the modbus and each http stage run')
+    parser.add_argument('--cycles', type=int, default=20, help='the poll cycles of the poll stage')
+    parser.add_argument('--concurrency', type=int, default=8, help='the concurrent clients of the http stage')
+    parser.add_argument('--stages', default=','.join(STAGES), help=f'the stages to run, a comma separated subset of {",".join(STAGES)}')
+    parser.add_argument('--output', help='also write the results to the file, e.g. to use them as a baseline')
+    parser.add_argument('--baseline', help='the results of an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='the fraction a metric may get worse than the baseline')
+    parser.add_argument('--log-level', default='WARNING', help='the log level of the service, its reads are logged at INFO')
+    args = parser.parse_args()
+
+    stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f'unknown stages {", ".join(sorted(unknown))}')
+
+    logging.basicConfig(level=args.log_level)
+
+    # the spec of the service points at the simulator
+    modbus_port, http_port = free_port(), free_port()
+    if args.spec:
+        with open(args.spec, 'r') as f:
+            spec = json.load(f)
+        spec['base'] = f'modbus+tcp://127.0.0.1:{modbus_port}/' + urlparse(spec['base']).path.lstrip('/')
+    else:
+        spec = build_spec(args.properties, port=modbus_port)
+
+    simulator = Simulator(spec, port=modbus_port, latency=args.latency, jitter=args.jitter, registers=args.registers)
+    simulator.start()
+
+    # the configuration is read when the services are imported
+    configure(spec, http_port, args)
+    import services
+    from config import config
+    from services.plc import PLC
+    from services.flask import HttpServer
+
+    services.plc = plc = PLC()
+    names = config.plc.get_all_observable_properties()
+    results = {
+        'python': sys.version.split()[0],
+        'properties': len(spec['properties']),
+        'observed': len(names),
+        'latency': args.latency,
+        'jitter': args.jitter,
+        'registers': args.registers,
+    }
+
+    # open the connection once, so the first stage does not measure the connect
+    plc.poll()
+
+    if 'modbus' in stages:
+        results['modbus'] = bench_modbus(plc, simulator, names, args.duration)
+    if 'poll' in stages:
+        results['poll'] = bench_poll(plc, simulator, names, args.cycles)
+    if 'http' in stages:
+        services.http_server = HttpServer()
+        services.http_server.start()
+        base = f'http://127.0.0.1:{http_port}'
+        wait_until_serving('127.0.0.1', http_port)
+        results['http'] = {
+            'read': bench_endpoint(f'{base}/api/plc/{names[0]}', args.concurrency, args.duration),
+            'snapshot': bench_endpoint(f'{base}/api/plc/snapshot', args.concurrency, args.duration),
+        }
+        services.http_server.stop()
+
+    plc.sampler.stop()
+    plc.modbus_client.close()
+    simulator.stop()
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            results['regressions'] = compare(results, json.load(f), args.tolerance)
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    if results.get('regressions'):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""
+Benchmarks the failover time of the active and standby replicas of a PLC service against a fake lease backend.
+
+Two replicas run the leader election of apps/plc/src/utilities/election.py against an in-memory lease that adds the
+latency of the api server to every request. Once a replica leads, it is either drained (it stops gracefully and
+releases the lease, as on a node drain or rollout) or crashed (its requests fail, as on a node failure or partition).
+The failover time is measured from the drain or crash until the other replica starts leading. The overlap is the time
+both replicas led at once, the old leader has to stop before the new one starts so it is expected to be zero.
+
+usage: python3 apps/plc/benchmarks/failover.py --trials 5
+       python3 apps/plc/benchmarks/failover.py --duration 15 --renew-deadline 10 --retry-interval 2 --trials 2
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from utilities.election import LeaderElector, MemoryLease
+
+
+class FakeLease(MemoryLease):
+    """ An in-memory lease with the latency of the api server, the requests of a crashed replica fail """
+
+    def __init__(self, latency: float):
+        super().__init__()
+        self.latency = latency
+        self.crashed: set[str] = set()
+
+
+    def call(self, identity: str, method, *args):
+        time.sleep(self.latency)
+        if identity in self.crashed:
+            raise ConnectionError(f'{identity} can not reach the api server')
+        return method(*args)
+
+
+class ReplicaLease:
+    """ The view of the fake lease of a single replica """
+
+    def __init__(self, lease: FakeLease, identity: str):
+        self.lease = lease
+        self.identity = identity
+
+
+    def get(self):
+        return self.lease.call(self.identity, self.lease.get)
+
+
+    def create(self, record: dict) -> bool:
+        return self.lease.call(self.identity, self.lease.create, record)
+
+
+    def update(self, record: dict, version: str) -> bool:
+        return self.lease.call(self.identity, self.lease.update, record, version)
+
+
+class Replica:
+    """ A replica that records when it started and stopped leading """
+
+    def __init__(self, lease: FakeLease, identity: str, args):
+        self.identity = identity
+        self.started: float | None = None
+        self.stopped: float | None = None
+        self.stop_event = threading.Event()
+        self.elector = LeaderElector(
+            lease = ReplicaLease(lease, identity),
+            identity = identity,
+            duration = args.duration,
+            renew_deadline = args.renew_deadline,
+            retry_interval = args.retry_interval,
+            on_started_leading = lambda: setattr(self, 'started', time.monotonic()),
+            on_stopped_leading = lambda: setattr(self, 'stopped', time.monotonic()),
+        )
+        self.thread = threading.Thread(target=self.elector.run, args=(self.stop_event,), daemon=True)
+
+
+    def start(self):
+        self.thread.start()
+
+
+    def drain(self):
+        self.stop_event.set()
+        self.thread.join()
+        self.stopped = time.monotonic()
+
+
+def trial(mode: str, args) -> dict:
+    lease = FakeLease(args.latency)
+    replicas = [Replica(lease, f'plc-{index}', args) for index in range(2)]
+    for replica in replicas:
+        replica.start()
+
+    while not any(replica.started for replica in replicas):
+        time.sleep(0.001)
+    # let the standby observe the lease for a while, as a standby that has been running
+    time.sleep(args.retry_interval * 2)
+    leader, standby = sorted(replicas, key=lambda replica: replica.started is None)
+
+    failed = time.monotonic()
+    if mode == 'drain':
+        leader.drain()
+    else:
+        lease.crashed.add(leader.identity)
+
+    deadline = failed + args.duration * 3
+    while standby.started is None and time.monotonic() < deadline:
+        time.sleep(0.001)
+    while mode == 'crash' and leader.stopped is None and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+    for replica in replicas:
+        replica.stop_event.set()
+
+    if standby.started is None:
+        return {'failover_ms': None, 'overlap_ms': None}
+    return {
+        'failover_ms': (standby.started - failed) * 1E3,
+        'overlap_ms': max(0.0, (leader.stopped - standby.started) * 1E3) if leader.stopped is not None else None,
+    }
+
+
+def summarize(results: list[dict], expected: float) -> dict:
+    failovers = [result['failover_ms'] for result in results if result['failover_ms'] is not None]
+    overlaps = [result['overlap_ms'] for result in results if result['overlap_ms'] is not None]
+    return {
+        'trials': len(results),
+        'failed_over': len(failovers),
+        'failover_ms': {
+            'mean': round(statistics.mean(failovers), 1) if failovers else None,
+            'max': round(max(failovers), 1) if failovers else None,
+            'expected_max': round(expected * 1E3, 1),
+        },
+        'max_overlap_ms': round(max(overlaps), 1) if overlaps else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--trials', type=int, default=5, help='the failovers measured per mode')
+    parser.add_argument('--duration', type=float, default=1.5, help='the lease duration in seconds (LEASE_DURATION_SECONDS)')
+    parser.add_argument('--renew-deadline', type=float, default=1.0, help='the renew deadline in seconds (LEASE_RENEW_DEADLINE_SECONDS)')
+    parser.add_argument('--retry-interval', type=float, default=0.2, help='the retry interval in seconds (LEASE_RETRY_INTERVAL_SECONDS)')
+    parser.add_argument('--latency', type=float, default=0.005, help='the latency of a request to the api server in seconds')
+    args = parser.parse_args()
+
+    # the failed renewals of the crashed replica are expected
+    logging.basicConfig(level=logging.CRITICAL)
+
+    print(json.dumps({
+        'duration': args.duration,
+        'renew_deadline': args.renew_deadline,
+        'retry_interval': args.retry_interval,
+        'latency': args.latency,
+        # a released lease is taken over on the next retry, an expired lease once it was unchanged for the duration,
+        # a renewal in flight, the release and the takeover take two requests each
+        'drain': summarize([trial('drain', args) for _ in range(args.trials)], args.retry_interval + 6 * args.latency),
+        'crash': summarize([trial('crash', args) for _ in range(args.trials)], args.duration + args.retry_interval + 4 * args.latency),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Benchmarks the memory and throughput of the in-memory time-series history.
+
+One million samples of a few typical PLC signals are appended to a series polled every second,
+and the memory held per million samples is measured with tracemalloc.
+
+usage: python3 apps/plc/benchmarks/history.py --samples 1000000
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from utilities.timeseries import Series, lttb, downsample
+
+SIGNALS = {
+    # a fault coil that rarely changes
+    'coil': lambda i, rng: 1.0 if (i // 3600) % 10 == 0 else 0.0,
+    # a run time counter scaled by 0.1 that increments slowly
+    'counter': lambda i, rng: round((i // 360) * 0.1, 1),
+    # a temperature register with a scale of 0.1 and sensor noise
+    'analog': lambda i, rng: round(200 + 50 * math.sin(i / 3600) + rng.randint(-2, 2), 0) * 0.1,
+    # a noisy 16 bit register
+    'noise': lambda i, rng: float(rng.randint(-32768, 32767)),
+}
+
+
+def run(signal: str, samples: int, samples_per_chunk: int) -> dict:
+    rng = random.Random(1)
+    generate = SIGNALS[signal]
+    values = [generate(i, rng) for i in range(samples)]
+    # polled every second with a few milliseconds of jitter
+    timestamps = [1_700_000_000_000 + i * 1000 + rng.randint(-3, 3) for i in range(samples)]
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    series = Series(budget_bytes=1 << 40, samples_per_chunk=samples_per_chunk)
+    start = time.perf_counter()
+    for timestamp, value in zip(timestamps, values):
+        series.append(timestamp, value)
+    append_seconds = time.perf_counter() - start
+    traced = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+
+    # query the last 10 minutes and the whole series downsampled to 1000 points
+    start = time.perf_counter()
+    series.query(timestamps[-600], timestamps[-1])
+    recent_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    all_timestamps, all_values = series.query(timestamps[0], timestamps[-1])
+    lttb(all_timestamps, all_values, 1000)
+    full_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    downsample(all_timestamps, all_values, 1000)
+    minmax_seconds = time.perf_counter() - start
+
+    return {
+        'signal': signal,
+        'samples': samples,
+        'bytes_per_sample': round(traced / samples, 3),
+        'memory_per_million_samples_mib': round(traced / samples * 1E6 / 2**20, 3),
+        'uncompressed_per_million_samples_mib': round(16 * 1E6 / 2**20, 3),
+        'append_samples_per_second': round(samples / append_seconds),
+        'query_last_10_minutes_ms': round(recent_seconds * 1E3, 3),
+        'query_all_lttb_1000_ms': round((full_seconds) * 1E3, 3),
+        'downsample_minmax_1000_ms': round(minmax_seconds * 1E3, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--samples', type=int, default=1_000_000)
+    parser.add_argument('--samples-per-chunk', type=int, default=128)
+    parser.add_argument('--signals', nargs='+', default=list(SIGNALS), choices=list(SIGNALS))
+    args = parser.parse_args()
+
+    print(json.dumps({
+        'benchmark': 'history',
+        'samples_per_chunk': args.samples_per_chunk,
+        'results': [run(signal, args.samples, args.samples_per_chunk) for signal in args.signals],
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmarks the requests per second and the latency percentiles of an endpoint of a running PLC service.
+
+Every client thread holds a keep-alive connection and issues requests back to back for the duration of the run.
+Run it once against the werkzeug development server (HTTP_SERVER=werkzeug) and once against waitress (the default)
+to compare the servers under the same load. Set HTTP_WORKERS to compare the single process against the gateway
+topology with several http worker processes.
+
+usage: python3 apps/plc/benchmarks/http_server.py --url http://localhost:5000/api/plc/generator02TotalRunTimeHoursLw --concurrency 32 --duration 30
+"""
+import sys
+import json
+import time
+import argparse
+import threading
+import http.client
+from urllib.parse import urlparse
+
+
+def percentile(samples: list[float], q: float) -> float | None:
+    """ Returns the q-th percentile of the sorted samples (nearest rank) """
+    if not samples:
+        return None
+    return round(samples[min(len(samples) - 1, int(round(q / 100 * len(samples) + 0.5)) - 1)], 3)
+
+
+def client(url, deadline: float, latencies: list[float], errors: list[int], lock: threading.Lock):
+    """ Issues requests over a single keep-alive connection until the deadline """
+    connection = None
+    local_latencies, local_errors = [], 0
+    while time.perf_counter() < deadline:
+        try:
+            if connection is None:
+                connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=10)
+            start = time.perf_counter()
+            connection.request('GET', url.path + (f'?{url.query}' if url.query else ''))
+            response = connection.getresponse()
+            response.read()
+            local_latencies.append((time.perf_counter() - start) * 1E3)
+            if response.status >= 400:
+                local_errors += 1
+            if response.getheader('connection', '').lower() == 'close':
+                connection.close()
+                connection = None
+        except Exception:
+            local_errors += 1
+            if connection is not None:
+                connection.close()
+            connection = None
+
+    with lock:
+        latencies.extend(local_latencies)
+        errors[0] += local_errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', required=True, help='the endpoint to benchmark')
+    parser.add_argument('--concurrency', type=int, default=16, help='number of concurrent keep-alive clients')
+    parser.add_argument('--duration', type=float, default=10, help='duration of the run in seconds')
+    parser.add_argument('--label', default='', help='label of the run in the output (e.g werkzeug, waitress)')
+    args = parser.parse_args()
+
+    url = urlparse(args.url)
+    latencies, errors, lock = [], [0], threading.Lock()
+    deadline = time.perf_counter() + args.duration
+    threads = [
+        threading.Thread(target=client, args=(url, deadline, latencies, errors, lock), daemon=True)
+        for _ in range(args.concurrency)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    json.dump({
+        'benchmark': 'http',
+        'label': args.label,
+        'url': args.url,
+        'concurrency': args.concurrency,
+        'requests': len(latencies),
+        'errors': errors[0],
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'latency_ms': {
+            'p50': percentile(latencies, 50),
+            'p90': percentile(latencies, 90),
+            'p99': percentile(latencies, 99),
+            'max': round(latencies[-1], 3) if latencies else None,
+        },
+    }, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""
+Benchmarks the memory per PLC of the service run as one pod per PLC against a shard hosting many PLCs.
+
+Both modes run the real service (apps/plc/src/main.py) against the Modbus TCP simulator of apps/plc/benchmarks/simulator.py,
+with kafka and the OTLP collector pointed at closed ports. In the pod mode a service is started per PLC, in the shard mode
+a single service is started with SHARD_SPECS and forks a process per PLC, as apps/plc/src/shard.py does. The memory is
+measured once every PLC serves a snapshot with a value for each of its properties, so the PLCs have polled and their
+services, threads and buffers are up. The proportional set size (PSS) of every process of the service (and of the
+processes it forks) is summed, shared pages are split between the processes sharing them, and the threads are counted.
+
+usage: python3 apps/plc/benchmarks/memory.py --plcs 20
+       python3 apps/plc/benchmarks/memory.py --plcs 50 --properties 100 --settle 10
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import http.client
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC)
+
+from simulator import Simulator, build_spec, free_port
+
+
+def service_env(http_port: int, name: str, spec: dict) -> dict:
+    """ The environment of a service, kafka and the collector are pointed at the discard port nothing listens on """
+    return {
+        **os.environ,
+        'NAME': name,
+        'SPEC': repr(spec),
+        'ENVIRONMENT': 'benchmark',
+        'FLASK_PORT': str(http_port),
+        'KUBERNETES_POD_UID': name,
+        'KUBERNETES_POD_NAME': name,
+        'KUBERNETES_NAMESPACE_NAME': 'benchmark',
+        'KAFKA_BROKERS': '127.0.0.1:9',
+        'KAFKA_EVENTS_TOPIC': 'events',
+        'OTEL_METRICS_EXPORTER': 'otlp',
+        'OTEL_EXPORTER_OTLP_METRICS_ENDPOINT': 'http://127.0.0.1:9',
+        'OTEL_EXPORTER_OTLP_METRICS_INSECURE': 'true',
+    }
+
+
+def tree(pid: int) -> list[int]:
+    """ Returns the process and its descendants """
+    pids = [pid]
+    try:
+        for task in os.listdir(f'/proc/{pid}/task'):
+            with open(f'/proc/{pid}/task/{task}/children') as f:
+                for child in f.read().split():
+                    pids.extend(tree(int(child)))
+    except FileNotFoundError:
+        pass
+    return pids
+
+
+def status(pid: int) -> tuple[int, int]:
+    """ Returns the proportional set size of the process in kB and its number of threads """
+    pss, threads = 0, 0
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                if line.startswith('Pss:'):
+                    pss = int(line.split()[1])
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('Threads:'):
+                    threads = int(line.split()[1])
+    except FileNotFoundError:
+        pass
+    return pss, threads
+
+
+def sampled(port: int, properties: int) -> bool:
+    """ Returns True if the api of the PLC on the port serves a value for every property """
+    try:
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+        connection.request('GET', '/api/plc/snapshot')
+        response = connection.getresponse()
+        return response.status == 200 and len(json.loads(response.read())) == properties
+    except (OSError, ValueError):
+        return False
+
+
+def measure(processes: list[subprocess.Popen], ports: list[int], args) -> dict:
+    """ Waits until every PLC has sampled its properties and the settle time, then sums the memory of the processes """
+    deadline = time.monotonic() + args.timeout
+    pending = set(ports)
+    while pending and time.monotonic() < deadline:
+        if any(process.poll() is not None for process in processes):
+            raise RuntimeError('a service exited before it sampled its PLC')
+        pending = {port for port in pending if not sampled(port, args.properties)}
+        time.sleep(0.1)
+    if pending:
+        raise TimeoutError(f'{len(pending)} PLCs did not sample their properties within {args.timeout}s')
+
+    time.sleep(args.settle)
+    pids = [pid for process in processes for pid in tree(process.pid)]
+    pss, threads = map(sum, zip(*(status(pid) for pid in pids)))
+    return {
+        'processes': len(pids),
+        'threads': threads,
+        'total_mb': round(pss / 1024, 1),
+        'per_plc_mb': round(pss / 1024 / args.plcs, 2),
+    }
+
+
+def stop(processes: list[subprocess.Popen]):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            for pid in reversed(tree(process.pid)):
+                os.kill(pid, 9)
+            process.wait()
+
+
+def pods(spec: dict, args) -> dict:
+    """ Starts a service per PLC, as a pod per PLC does """
+    ports = [free_port() for _ in range(args.plcs)]
+    processes = [
+        subprocess.Popen(
+            [sys.executable, 'main.py'], cwd=SRC, env=service_env(port, f'plc{index:03d}', spec),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        for index, port in enumerate(ports)
+    ]
+    try:
+        return measure(processes, ports, args)
+    finally:
+        stop(processes)
+
+
+def shard(spec: dict, args) -> dict:
+    """ Starts a single service hosting every PLC, as the pod of a shard does """
+    ports = [free_port() for _ in range(args.plcs)]
+    specs = {f'plc{index:03d}': {'port': port, 'spec': spec} for index, port in enumerate(ports)}
+    env = {**service_env(free_port(), 'shard', spec), 'SHARD_SPECS': repr(specs)}
+    processes = [subprocess.Popen([sys.executable, 'main.py'], cwd=SRC, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)]
+    try:
+        return measure(processes, ports, args)
+    finally:
+        stop(processes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--plcs', type=int, default=20, help='the number of PLCs hosted')
+    parser.add_argument('--properties', type=int, default=20, help='the number of properties of the spec of each PLC')
+    parser.add_argument('--settle', type=float, default=5.0, help='the seconds to wait after the PLCs sampled before measuring')
+    parser.add_argument('--timeout', type=float, default=120.0, help='the seconds the PLCs may take to sample their properties')
+    args = parser.parse_args()
+
+    modbus_port = free_port()
+    spec = build_spec(args.properties, port=modbus_port)
+    simulator = Simulator(spec, port=modbus_port)
+    simulator.start()
+    try:
+        results = {
+            'python': sys.version.split()[0],
+            'plcs': args.plcs,
+            'properties': args.properties,
+            'pod_per_plc': pods(spec, args),
+            'shard': shard(spec, args),
+        }
+    finally:
+        simulator.stop()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
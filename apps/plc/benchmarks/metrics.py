@@ -0,0 +1,68 @@
+"""
+Benchmarks the rendering time of the Prometheus /metrics exposition of a large PLC.
+
+Each scrape sees a fraction of the properties change since the previous scrape. The incremental renderer
+is compared against rendering every series from scratch on every scrape.
+
+usage: python3 apps/plc/benchmarks/metrics.py --properties 1000 --changed 0.1 --scrapes 200
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from utilities.prometheus import MetricsRenderer
+from utilities.stats import Histogram, LATENCY_BUCKETS
+
+
+def run(properties: int, changed: float, scrapes: int, incremental: bool) -> dict:
+    rng = random.Random(1)
+    names = [f'property{i:04d}' for i in range(properties)]
+    entries = {name: (round(rng.uniform(0, 100), 1), 1_700_000_000.0) for name in names}
+    latency = Histogram(LATENCY_BUCKETS)
+    for _ in range(1000):
+        latency.observe('readproperty', rng.uniform(1, 50))
+
+    renderer = MetricsRenderer(plc='benchmark', units=dict.fromkeys(names, 'C'))
+    durations = []
+    for scrape in range(scrapes):
+        for name in rng.sample(names, int(properties * changed)):
+            entries[name] = (round(rng.uniform(0, 100), 1), 1_700_000_000.0 + scrape)
+        if not incremental:
+            renderer = MetricsRenderer(plc='benchmark', units=dict.fromkeys(names, 'C'))
+
+        start = time.perf_counter()
+        body = renderer.render(scrape, dict(entries), scrape * 15.0, latency.snapshot(), LATENCY_BUCKETS)
+        durations.append((time.perf_counter() - start) * 1E3)
+
+    durations.sort()
+    return {
+        'incremental': incremental,
+        'bytes': len(body),
+        'p50_ms': round(durations[len(durations) // 2], 3),
+        'p99_ms': round(durations[int(len(durations) * 0.99) - 1], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--properties', type=int, default=1000, help='number of observable properties')
+    parser.add_argument('--changed', type=float, default=0.1, help='fraction of the properties that change between scrapes')
+    parser.add_argument('--scrapes', type=int, default=200, help='number of scrapes')
+    args = parser.parse_args()
+
+    json.dump({
+        'benchmark': 'metrics',
+        'properties': args.properties,
+        'changed': args.changed,
+        'results': [run(args.properties, args.changed, args.scrapes, incremental) for incremental in (False, True)],
+    }, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
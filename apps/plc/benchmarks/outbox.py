@@ -0,0 +1,78 @@
+"""
+Benchmarks the catch-up throughput of the durable events outbox.
+
+The outbox is filled with a backlog of write events, closed and reopened to simulate a pod restart,
+and then drained from the last checkpointed offset the same way the EventsConsumer drains it to kafka.
+
+usage: python3 apps/plc/benchmarks/outbox.py --records 100000 --batch-size 100
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from clients.outbox import Outbox
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=100_000, help='number of events in the backlog')
+    parser.add_argument('--acked', type=int, default=0, help='number of events acknowledged before the restart')
+    parser.add_argument('--batch-size', type=int, default=100, help='records drained per checkpoint')
+    parser.add_argument('--fsync-batch', type=int, default=32, help='records per fsync when appending')
+    parser.add_argument('--segment-bytes', type=int, default=1024 * 1024)
+    args = parser.parse_args()
+
+    event = json.dumps({
+        "context": {
+            "version": "1.0.0",
+            "id": "00000000-0000-0000-0000-000000000000",
+            "timestamp": "2023-11-14T00:00:00+00:00",
+            "type": "plc.write.event",
+            "source": "/plc/write",
+            "action": "update",
+            "dataschema": "http://schema.foreveroceans.io/v1/plc/writeEvent-1.0.0.json",
+            "datacontenttype": "json",
+        },
+        "data": {"property": "generator02TotalRunTimeLoadedHoursLw", "value": 1113},
+    }).encode()
+
+    with tempfile.TemporaryDirectory() as directory:
+        outbox = Outbox(directory, segment_bytes=args.segment_bytes, max_bytes=1 << 40, fsync_batch=args.fsync_batch)
+        start = time.perf_counter()
+        for _ in range(args.records):
+            outbox.append(event)
+        if args.acked:
+            outbox.commit(args.acked - 1)
+        outbox.close()
+        append_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        outbox = Outbox(directory, segment_bytes=args.segment_bytes, max_bytes=1 << 40)
+        recover_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        replayed = 0
+        while records := outbox.read(max_records=args.batch_size, timeout=0):
+            replayed += len(records)
+            outbox.commit(records[-1][0])
+        replay_seconds = time.perf_counter() - start
+        outbox.close()
+
+    print(json.dumps({
+        'benchmark': 'outbox',
+        'records': args.records,
+        'record_bytes': len(event),
+        'append_records_per_second': round(args.records / append_seconds),
+        'recovery_ms': round(recover_seconds * 1E3, 3),
+        'replayed_records': replayed,
+        'replay_records_per_second': round(replayed / replay_seconds) if replayed else None,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+"""
+A Modbus TCP simulator of a PLC driven by its spec, with a configurable latency per request.
+
+The simulator serves a unit for every unit ID the spec addresses. The coils and holding registers of each unit cover
+every address of the spec and at least the size of the register map, and they are filled with seeded random values.
+The requests are served one at a time and each takes the latency plus a uniform jitter, as on the CPU of a PLC.
+The number of requests (PDUs) served is counted, so a benchmark can derive the transactions per second.
+
+usage: python3 apps/plc/benchmarks/simulator.py --spec spec.json --port 5020 --latency 0.005 --jitter 0.002
+       python3 apps/plc/benchmarks/simulator.py --properties 200 --port 5020
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from pymodbus.server.async_io import ModbusTcpServer
+from pymodbus.datastore import ModbusSequentialDataBlock, ModbusSlaveContext, ModbusServerContext
+
+from models.config import PLC
+
+COIL_OFFSET = 1
+""" The address of the first coil in the spec, see ModbusClient.read_coil """
+HOLDING_REGISTER_OFFSET = 400001
+""" The address of the first holding register in the spec, see ModbusClient.read_single_holding_register """
+
+
+def build_spec(properties: int, host: str = '127.0.0.1', port: int = 502, polling_time: float = 1) -> dict:
+    """
+    A spec of observed properties, a tenth of them coils and the others evenly split between single and double words.
+    The holding registers wrap around within the default single and double word ranges of the spec
+    """
+    spec = {'base': f'modbus+tcp://{host}:{port}/1/', 'title': 'Simulated PLC', 'version': '0.0.1', 'properties': {}}
+    for index in range(properties):
+        if index % 10 == 9:
+            entity, href, kind = 'Coil', str(1 + index), 'boolean'
+        elif index % 2 == 0:
+            entity, href, kind = 'HoldingRegister', str(400001 + index % 4500), 'number'
+        else:
+            entity, href, kind = 'HoldingRegister', str(416385 + index * 2 % 1998), 'number'
+
+        spec['properties'][f'property{index:04d}'] = {
+            'forms': [{
+                'href': href,
+                'modbus:entity': entity,
+                'modbus:pollingTime': polling_time,
+                'op': ['observeproperty', 'readproperty', 'writeproperty'],
+            }],
+            'type': kind,
+        }
+    return spec
+
+
+def address_span(spec: dict) -> tuple[int, int]:
+    """ Returns the number of coils and holding registers addressed by the properties of the spec """
+    coils, registers = 0, 0
+    for property in spec['properties'].values():
+        form = property['forms'][0]
+        href = urlparse(form['href'])
+        register = int(href.path.split('/')[-1])
+        quantity = int(parse_qs(href.query).get('quantity', ['1'])[0])
+        if form['modbus:entity'] == 'Coil':
+            coils = max(coils, register - COIL_OFFSET + quantity)
+        else:
+            # a double word spans two registers and the reads of a quantity of double words skip a register in between
+            registers = max(registers, register - HOLDING_REGISTER_OFFSET + quantity * 3)
+    return coils, registers
+
+
+class SlowSlaveContext(ModbusSlaveContext):
+    """ A unit that takes the latency of the simulator to validate each request, every request is validated once """
+
+    def __init__(self, simulator: 'Simulator', **kwargs):
+        super().__init__(**kwargs)
+        self.simulator = simulator
+
+
+    def validate(self, fc_as_hex, address, count=1):
+        self.simulator.serve()
+        return super().validate(fc_as_hex, address, count)
+
+
+class Simulator:
+    """ Serves the registers of the spec over Modbus TCP from a background thread """
+
+    def __init__(self, spec: dict, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0, jitter: float = 0.0, registers: int = 0, seed: int = 0):
+        self.host = host
+        self.port = port or free_port(host)
+        self.latency = latency
+        self.jitter = jitter
+        self.random = random.Random(seed)
+
+        self.pdus = 0
+        """ The number of requests served """
+        self.lock = threading.Lock()
+
+        coils, holding_registers = address_span(spec)
+        coils, holding_registers = max(coils, registers), max(holding_registers, registers)
+        units = PLC(name='simulator', spec=spec).get_unit_ids()
+        self.context = ModbusServerContext(
+            slaves = {
+                unit: SlowSlaveContext(
+                    simulator = self,
+                    co = ModbusSequentialDataBlock(0, [self.random.randint(0, 1) for _ in range(coils)]),
+                    hr = ModbusSequentialDataBlock(0, [self.random.randint(0, 0xFFFF) for _ in range(holding_registers)]),
+                    zero_mode = True,
+                )
+                for unit in units
+            },
+            single = False,
+        )
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.server: ModbusTcpServer | None = None
+        self.thread = threading.Thread(target=self.run, daemon=True, name='simulator')
+
+
+    def serve(self):
+        """ Counts a request and takes the latency with its jitter, the event loop of the server is blocked meanwhile """
+        with self.lock:
+            self.pdus += 1
+        delay = self.latency + self.random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+
+    def served(self) -> int:
+        with self.lock:
+            return self.pdus
+
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.server = ModbusTcpServer(context=self.context, address=(self.host, self.port), allow_reuse_address=True)
+        try:
+            self.loop.run_until_complete(self.server.serve_forever())
+        except asyncio.CancelledError:
+            pass
+
+
+    def start(self, timeout: float = 10):
+        """ Starts the server and waits until it accepts connections """
+        self.thread.start()
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection((self.host, self.port), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.01)
+        raise TimeoutError(f'the simulator did not listen on {self.host}:{self.port} within {timeout}s')
+
+
+    def stop(self):
+        if self.loop is not None and self.server is not None:
+            asyncio.run_coroutine_threadsafe(self.server.shutdown(), self.loop).result(timeout=10)
+        self.thread.join(timeout=10)
+
+
+def free_port(host: str = '127.0.0.1') -> int:
+    with socket.socket() as s:
+        s.bind((host, 0))
+        return s.getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--spec', help='the json file of the spec of the PLC, a spec is generated if not set')
+    parser.add_argument('--properties', type=int, default=100, help='the number of properties of the generated spec')
+    parser.add_argument('--host', default='127.0.0.1', help='the address to listen on')
+    parser.add_argument('--port', type=int, default=5020, help='the port to listen on')
+    parser.add_argument('--latency', type=float, default=0.0, help='the seconds each request takes')
+    parser.add_argument('--jitter', type=float, default=0.0, help='the maximum seconds added to or removed from the latency')
+    parser.add_argument('--registers', type=int, default=0, help='the minimum number of coils and holding registers of each unit')
+    args = parser.parse_args()
+
+    if args.spec:
+        with open(args.spec, 'r') as f:
+            spec = json.load(f)
+    else:
+        spec = build_spec(args.properties, host=args.host, port=args.port)
+
+    simulator = Simulator(spec, host=args.host, port=args.port, latency=args.latency, jitter=args.jitter, registers=args.registers)
+    simulator.start()
+    print(json.dumps({'listening': f'{args.host}:{args.port}', 'units': sorted(simulator.context.slaves())}))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        simulator.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+"""
+Benchmarks the cold start of a PLC service: the import time of its modules and the time to its first sample.
+
+The import time of each module is measured in a fresh interpreter with python -X importtime, so the modules it shares
+with the modules measured before it are counted again, and the configuration is initialized from the environment of
+the service before the modules that read it on import. The time to the first sample is measured by starting the
+service (apps/plc/src/main.py) against a minimal Modbus TCP responder on localhost, with kafka and the OTLP collector
+pointed at closed ports as on a cold cluster where they are not up yet. It is the time from the start of the process
+until the api is up and until the snapshot of the api has a value for every observed property.
+
+usage: python3 apps/plc/benchmarks/startup.py --trials 5
+       python3 apps/plc/benchmarks/startup.py --properties 50 --skip-imports
+"""
+import os
+import sys
+import json
+import time
+import socket
+import struct
+import argparse
+import threading
+import statistics
+import subprocess
+import socketserver
+import http.client
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC)
+
+from shard import PRELOAD
+
+MODULES = PRELOAD + (
+    'clients.modbus',
+    'clients.opentelemetry',
+    'services.flask',
+    'services',
+)
+""" The dependencies of the services and the modules of the service that import them """
+CONFIGURED = ('services.flask', 'services')
+""" The modules that read the configuration when they are imported, it is initialized before they are imported """
+
+
+def import_time(module: str, env: dict) -> dict:
+    """ Returns the cumulative import time of the module in a fresh interpreter in milliseconds, or the error if it is missing """
+    code = f'import config; config.initialize(); import {module}' if module in CONFIGURED else f'import {module}'
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=SRC, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        return {'module': module, 'import_ms': None, 'error': result.stderr.strip().splitlines()[-1]}
+
+    # import time: self [us] | cumulative | imported package
+    for line in reversed(result.stderr.splitlines()):
+        fields = line.split('|')
+        if len(fields) == 3 and fields[2].strip() == module:
+            return {'module': module, 'import_ms': round(int(fields[1]) / 1E3, 1)}
+    return {'module': module, 'import_ms': None, 'error': 'not in the import trace'}
+
+
+class ModbusHandler(socketserver.BaseRequestHandler):
+    """ Answers the reads of coils and holding registers with zeros and acknowledges the writes """
+
+    def handle(self):
+        while True:
+            header = self.recv(7)
+            if header is None:
+                return
+            transaction, protocol, length, unit = struct.unpack('>HHHB', header)
+            pdu = self.recv(length - 1)
+            if pdu is None:
+                return
+
+            function = pdu[0]
+            if function in (1, 2):
+                count = struct.unpack('>H', pdu[3:5])[0]
+                body = bytes([function, (count + 7) // 8]) + bytes((count + 7) // 8)
+            elif function in (3, 4):
+                count = struct.unpack('>H', pdu[3:5])[0]
+                body = bytes([function, count * 2]) + bytes(count * 2)
+            elif function in (5, 6, 15, 16):
+                body = pdu[:5]
+            else:
+                body = bytes([function | 0x80, 1])
+            self.request.sendall(struct.pack('>HHHB', transaction, protocol, len(body) + 1, unit) + body)
+
+
+    def recv(self, size: int) -> bytes | None:
+        data = b''
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+
+class ModbusServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def build_spec(properties: int, modbus_port: int) -> dict:
+    """ A spec of holding registers polled every second, half of them single and half of them double words """
+    return {
+        'base': f'modbus+tcp://127.0.0.1:{modbus_port}/1/',
+        'title': 'Startup Benchmark',
+        'version': '0.0.1',
+        'properties': {
+            f'register{index:03d}': {
+                'forms': [{
+                    'href': str(400001 + index) if index % 2 == 0 else str(416385 + index * 2),
+                    'modbus:entity': 'HoldingRegister',
+                    'modbus:pollingTime': 1,
+                    'op': ['observeproperty', 'readproperty'],
+                }],
+                'readOnly': True,
+                'type': 'number',
+            }
+            for index in range(properties)
+        },
+    }
+
+
+def get(port: int, path: str) -> tuple[int, bytes] | None:
+    try:
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+        connection.request('GET', path)
+        response = connection.getresponse()
+        return response.status, response.read()
+    except OSError:
+        return None
+
+
+def service_env(spec: dict, http_port: int) -> dict:
+    """ The environment of the service, as the operator sets it """
+    return {
+        **os.environ,
+        'NAME': 'startup',
+        'SPEC': repr(spec),
+        'ENVIRONMENT': 'benchmark',
+        'FLASK_PORT': str(http_port),
+        'KUBERNETES_POD_UID': 'startup',
+        'KUBERNETES_POD_NAME': 'startup',
+        'KUBERNETES_NAMESPACE_NAME': 'benchmark',
+        # nothing listens on the discard port, the service has to start without kafka and the collector
+        'KAFKA_BROKERS': '127.0.0.1:9',
+        'KAFKA_EVENTS_TOPIC': 'events',
+        'OTEL_METRICS_EXPORTER': 'otlp',
+        'OTEL_EXPORTER_OTLP_METRICS_ENDPOINT': 'http://127.0.0.1:9',
+        'OTEL_EXPORTER_OTLP_METRICS_INSECURE': 'true',
+    }
+
+
+def first_sample(args, modbus_port: int) -> dict:
+    """ Starts the service and returns the time until its api is up and until every property has a value, in milliseconds """
+    http_port = free_port()
+    env = service_env(build_spec(args.properties, modbus_port), http_port)
+
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, 'main.py'], cwd=SRC, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE if args.verbose else subprocess.DEVNULL,
+    )
+    api_up, sampled = None, None
+    try:
+        deadline = started + args.timeout
+        while sampled is None and time.perf_counter() < deadline and process.poll() is None:
+            response = get(http_port, '/api/plc/snapshot')
+            if response is not None:
+                status, body = response
+                if api_up is None:
+                    api_up = time.perf_counter() - started
+                if status == 200 and len(json.loads(body)) == args.properties:
+                    sampled = time.perf_counter() - started
+            time.sleep(0.005)
+    finally:
+        process.terminate()
+        try:
+            _, stderr = process.communicate(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            _, stderr = process.communicate()
+        if args.verbose and stderr:
+            sys.stderr.write(stderr.decode(errors='replace'))
+
+    return {
+        'api_ms': api_up * 1E3 if api_up is not None else None,
+        'first_sample_ms': sampled * 1E3 if sampled is not None else None,
+    }
+
+
+def summarize(samples: list[float | None]) -> dict:
+    measured = [sample for sample in samples if sample is not None]
+    return {
+        'measured': len(measured),
+        'mean': round(statistics.mean(measured), 1) if measured else None,
+        'min': round(min(measured), 1) if measured else None,
+        'max': round(max(measured), 1) if measured else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--trials', type=int, default=5, help='the number of cold starts measured')
+    parser.add_argument('--properties', type=int, default=20, help='the number of properties of the spec')
+    parser.add_argument('--timeout', type=float, default=60, help='the seconds a start may take before it counts as failed')
+    parser.add_argument('--skip-imports', action='store_true', help='only measure the time to the first sample')
+    parser.add_argument('--verbose', action='store_true', help='print the logs of the service')
+    args = parser.parse_args()
+
+    modbus_port = free_port()
+    modbus = ModbusServer(('127.0.0.1', modbus_port), ModbusHandler)
+    threading.Thread(target=modbus.serve_forever, daemon=True).start()
+
+    starts = [first_sample(args, modbus_port) for _ in range(args.trials)]
+    modbus.shutdown()
+
+    env = service_env(build_spec(args.properties, modbus_port), free_port())
+
+    print(json.dumps({
+        'python': sys.version.split()[0],
+        'properties': args.properties,
+        'trials': args.trials,
+        'api_ms': summarize([start['api_ms'] for start in starts]),
+        'first_sample_ms': summarize([start['first_sample_ms'] for start in starts]),
+        'imports': [] if args.skip_imports else [import_time(module, env) for module in MODULES],
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,26 @@
+import logging
+import threading
+from collections.abc import Callable
+from typing import TypeVar
+
+from config import config
+
+logger = logging.getLogger()
+
+T = TypeVar('T')
+
+
+def connect(factory: Callable[[], T], name: str, stop_event: threading.Event, retry_interval: float = 5.0) -> T | None:
+    """
+    Creates a kafka client on the thread of the service that uses it, so the bootstrap of the brokers does not hold up
+    the start of the other services. Retries until the brokers are reachable, returns None if the service is stopped first
+    """
+    while not stop_event.is_set():
+        try:
+            client = factory()
+            logger.info(f'connected the kafka {name} to {config.kafka.brokers}')
+            return client
+        except:
+            logger.exception(f'failed to connect the kafka {name} to {config.kafka.brokers}, retrying in {retry_interval}s')
+            stop_event.wait(retry_interval)
+    return None
@@ -1,15 +1,55 @@
+import json
 from dataclasses import asdict
 from uuid import uuid4
 from datetime import datetime, timezone
+from typing import Callable
 import threading
 from multiprocessing import Queue
 
+from config import config
+from clients.outbox import Outbox
+
 _event_queue = Queue()
 _event_lock = threading.Lock()
 
-def push_event(property: str, value: int):
+_outbox: Outbox | None = Outbox(
+    directory = config.outbox.directory,
+    segment_bytes = config.outbox.segment_bytes,
+    max_bytes = config.outbox.max_bytes,
+    fsync_interval_ms = config.outbox.fsync_interval_ms,
+    fsync_batch = config.outbox.fsync_batch,
+) if config.outbox.directory else None
+"""
+When a directory is configured the events are persisted to a durable outbox instead of the in-memory queue,
+so that audit records survive a Kafka outage or a pod restart
+"""
+
+
+_forwarder: Callable | None = None
+""" Forwards the events of an http worker process to the gateway process, which owns the queue and the outbox """
+
+
+def set_forwarder(forwarder: Callable | None):
+    """ Forwards the events pushed by this process with the given function instead of queuing them """
+    global _forwarder
+    _forwarder = forwarder
+
+
+def get_outbox() -> Outbox | None:
+    """ Returns the durable outbox, or None if the in-memory queue is used """
+    return _outbox
+
+
+def push_event(property: str, value: int, correlation_id: str | None = None):
+    """
+    Pushes a write audit event. The correlation id of the command that requested the write is attached when known.
+    """
     global _event_queue
 
+    if _forwarder is not None:
+        _forwarder(property, value, correlation_id)
+        return
+
     with _event_lock:
         timestamp = datetime.utcnow().replace(tzinfo=timezone.utc).isoformat()
         cloudevent = {
@@ -28,7 +68,13 @@ def push_event(property: str, value: int):
                 "value": value,
             }
         }
-        _event_queue.put_nowait(cloudevent)
+        if correlation_id is not None:
+            cloudevent["context"]["correlationid"] = correlation_id
+
+        if _outbox is not None:
+            _outbox.append(bytes(json.dumps(cloudevent), 'utf-8'))
+        else:
+            _event_queue.put_nowait(cloudevent)
 
 
 def listen() -> 'dict | None':
@@ -42,4 +88,4 @@ def listen() -> 'dict | None':
         return _event_queue.get(block=True, timeout=5)
     except:
         # normal in timeout when queue is empty
-        return None
\ No newline at end of file
+        return None
@@ -0,0 +1,157 @@
+import threading
+from multiprocessing.connection import Client
+from typing import List
+
+from config import config
+from utilities.valuetable import ValueTable
+
+
+class RemoteResponse:
+    """ The outcome of a modbus write applied by the gateway process, in place of the pymodbus response """
+
+    def __init__(self, error: bool, text: str):
+        self.error = error
+        self.text = text
+
+    def isError(self) -> bool:
+        return self.error
+
+    def __str__(self) -> str:
+        return self.text
+
+
+def to_remote(response):
+    """ Converts the pymodbus response(s) of a write into picklable responses """
+    if response is None:
+        return None
+    if type(response) is list:
+        return [to_remote(r) for r in response]
+    return RemoteResponse(error=response.isError(), text=str(response))
+
+
+class GatewayClient:
+    """
+    Calls the gateway process that owns the modbus connection over a local IPC channel.
+    Every thread of the http worker holds its own connection, so concurrent requests do not serialize on the channel.
+    """
+
+    def __init__(self, address: str, authkey: bytes):
+        self.address = address
+        self.authkey = authkey
+        self.local = threading.local()
+
+
+    def call(self, method: str, *args):
+        """ Calls the method of the gateway and returns its result, raises if the gateway failed """
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = Client(self.address, family='AF_UNIX', authkey=self.authkey)
+
+        try:
+            connection.send((method, args))
+            status, result = connection.recv()
+        except (EOFError, OSError):
+            # the gateway restarted or closed the connection, reconnect on the next call
+            self.local.connection = None
+            connection.close()
+            raise
+
+        if status != 'ok':
+            raise Exception(f'gateway failed to {method}: {result}')
+        return result
+
+
+class RemoteHistory:
+    """ Queries the history held by the gateway process """
+
+    def __init__(self, client: GatewayClient):
+        self.client = client
+        self.series = dict.fromkeys(config.plc.get_all_observable_properties())
+
+
+    def query(self, name: str, since: float, until: float) -> tuple[List[float], List[float]]:
+        return self.client.call('query_history', name, since, until)
+
+
+class RemotePLC:
+    """
+    The PLC as seen by an http worker process.
+    Reads and writes are forwarded to the gateway process, the latest values are read from the shared value table.
+    """
+
+    def __init__(self, client: GatewayClient, table: ValueTable):
+        self.client = client
+        self.table = table
+        self.history: RemoteHistory | None = RemoteHistory(client) if config.history.memory_bytes else None
+
+
+    def is_connected(self) -> bool:
+        return self.client.call('is_connected')
+
+
+    def is_active(self) -> bool:
+        return self.client.call('is_active')
+
+
+    def snapshot(self) -> tuple[int, dict]:
+        """ Returns the version and the last value and timestamp of every property from the shared value table """
+        version, entries = 0, {}
+        for name in self.table.properties:
+            entry = self.table.read(name)
+            if entry is not None:
+                value, timestamp, sequence = entry
+                entries[name] = (value, timestamp)
+                version += sequence
+        return version, entries
+
+
+    def check_readiness(self) -> bool:
+        return self.client.call('check_readiness')
+
+
+    def get_latency(self) -> dict:
+        return self.client.call('get_latency')
+
+
+    def get_stats(self) -> dict:
+        return self.client.call('get_stats')
+
+
+    def readproperty(self, name: str):
+        return self.client.call('readproperty', name)
+
+
+    def writeproperty(self, name: str, value: int):
+        return self.client.call('writeproperty', name, value)
+
+
+    def readform(self, form: dict):
+        return self.client.call('readform', form)
+
+
+    def writeform(self, form: dict, value: int):
+        return self.client.call('writeform', form, value)
+
+
+    def is_unchanged(self, name: str, value: int) -> bool:
+        return self.client.call('is_unchanged', name, value)
+
+
+    def record_write(self, outcome: str):
+        self.client.call('record_write', outcome)
+
+
+class RemoteWriter:
+    """ Submits the writes to debounced properties to the write-behind of the gateway process """
+
+    def __init__(self, client: GatewayClient, debounce_times: dict[str, float]):
+        self.client = client
+        self.debounce_times = debounce_times
+
+
+    def is_debounced(self, name: str) -> bool:
+        return name in self.debounce_times
+
+
+    def submit(self, name: str, value: int) -> bool:
+        return self.client.call('submit_write', name, value)
@@ -0,0 +1,105 @@
+import os
+import ssl
+import json
+import logging
+import urllib.request
+import urllib.error
+from http import HTTPStatus
+
+logger = logging.getLogger()
+
+SERVICE_ACCOUNT = '/var/run/secrets/kubernetes.io/serviceaccount'
+""" The directory the token and the CA certificate of the service account of the pod are mounted at """
+
+
+class KubernetesClient:
+    """
+    A minimal client of the kubernetes api with the service account of the pod.
+    The service only needs the leases and the labels of its own pod, which do not justify the kubernetes package
+    """
+
+    def __init__(self, timeout: float):
+        host = os.getenv('KUBERNETES_SERVICE_HOST')
+        port = os.getenv('KUBERNETES_SERVICE_PORT', '443')
+        self.url = f'https://{host}:{port}'
+        self.timeout = timeout
+        self.context = ssl.create_default_context(cafile=os.path.join(SERVICE_ACCOUNT, 'ca.crt'))
+
+
+    def request(self, method: str, path: str, body: dict | None = None, content_type: str = 'application/json') -> dict:
+        """ Sends a request to the api server, the token is read on every request as it is rotated by the kubelet """
+        with open(os.path.join(SERVICE_ACCOUNT, 'token')) as f:
+            token = f.read().strip()
+
+        request = urllib.request.Request(
+            url = f'{self.url}{path}',
+            method = method,
+            data = json.dumps(body).encode() if body is not None else None,
+            headers = {'Authorization': f'Bearer {token}', 'Content-Type': content_type, 'Accept': 'application/json'},
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout, context=self.context) as response:
+            return json.load(response)
+
+
+    def label_pod(self, namespace: str, name: str, labels: dict[str, str]):
+        """ Merges the labels into the labels of the pod """
+        self.request(
+            method = 'PATCH',
+            path = f'/api/v1/namespaces/{namespace}/pods/{name}',
+            body = {'metadata': {'labels': labels}},
+            content_type = 'application/merge-patch+json',
+        )
+
+
+class KubernetesLease:
+    """
+    Gets, creates and updates a coordination.k8s.io/v1 Lease.
+    An update carries the resource version of the record it was derived from, so the api server rejects
+    the update of a record another replica changed in the meantime.
+    """
+
+    def __init__(self, client: KubernetesClient, namespace: str, name: str):
+        self.client = client
+        self.name = name
+        self.namespace = namespace
+        self.path = f'/apis/coordination.k8s.io/v1/namespaces/{namespace}/leases'
+
+
+    def manifest(self, record: dict, version: str | None = None) -> dict:
+        metadata = {'name': self.name, 'namespace': self.namespace}
+        if version is not None:
+            metadata['resourceVersion'] = version
+        return {'apiVersion': 'coordination.k8s.io/v1', 'kind': 'Lease', 'metadata': metadata, 'spec': record}
+
+
+    def get(self) -> tuple[dict, str] | None:
+        """ Returns the record of the lease and its resource version, None if the lease does not exist """
+        try:
+            lease = self.client.request('GET', f'{self.path}/{self.name}')
+        except urllib.error.HTTPError as e:
+            if e.code == HTTPStatus.NOT_FOUND:
+                return None
+            raise
+        return lease.get('spec', {}), lease['metadata']['resourceVersion']
+
+
+    def create(self, record: dict) -> bool:
+        """ Creates the lease, returns False if another replica created it first """
+        try:
+            self.client.request('POST', self.path, self.manifest(record))
+        except urllib.error.HTTPError as e:
+            if e.code == HTTPStatus.CONFLICT:
+                return False
+            raise
+        return True
+
+
+    def update(self, record: dict, version: str) -> bool:
+        """ Replaces the record of the lease, returns False if the lease changed since the version was read """
+        try:
+            self.client.request('PUT', f'{self.path}/{self.name}', self.manifest(record, version))
+        except urllib.error.HTTPError as e:
+            if e.code == HTTPStatus.CONFLICT:
+                return False
+            raise
+        return True
@@ -1,5 +1,5 @@
+import time
 import logging
-import threading
 from typing import List, Union
 
 from pymodbus.constants import Endian
@@ -13,48 +13,79 @@ from pymodbus.register_write_message import WriteSingleRegisterResponse, WriteMu
 
 from config import config
 from utilities.modbus import is_coil, is_single_word, is_double_word, parse_href
+from utilities.ratelimit import TokenBucket
+from utilities.fairlock import RoundRobinLock
 
 class ModbusClient():
     """
     This class is responsible for communicating with the PLC via Modbus TCP.
+    A single connection is shared by all unit IDs the spec addresses (e.g. RTU devices behind a Modbus TCP gateway),
+    the units take turns on the connection and a unit that fails to respond is skipped for a backoff period.
     """
 
     def __init__(self):
         """ Initializes the modbus client """
-        self.lock = threading.Lock()
+        self.lock = RoundRobinLock()
+        """ Serializes the transactions on the connection, the units waiting for it are served in turn """
+
+        self.multi_unit = len(config.plc.get_unit_ids()) > 1
+        self.unavailable_until: dict[int, float] = {}
+        """ The time until which a unit that failed to respond is skipped, only if the connection is shared by several units """
         self.client = ModbusTcpClient(
             host = config.plc.get_host(),
             port = config.plc.get_port(),
             timeout = config.modbus_client.timeout,
         )
 
+        rate = config.modbus_client.max_transactions_per_second
+        self.limiter = TokenBucket(rate=rate, burst=max(rate, 1)) if rate > 0 else None
+        """ Caps the transactions per second sent to the PLC device, shared by all reads and writes """
+
+
+    def is_unavailable(self, unit: int) -> bool:
+        """ Returns True if the unit failed to respond recently and is skipped, so it does not hold up the other units """
+        return time.monotonic() < self.unavailable_until.get(unit, 0)
+
+
+    def back_off(self, unit: int):
+        """ Skips the reads of a unit that failed to respond for the backoff period, if the connection is shared by several units """
+        if self.multi_unit and config.modbus_client.unit_backoff > 0:
+            self.unavailable_until[unit] = time.monotonic() + config.modbus_client.unit_backoff
+
+
+    def throttle(self, transactions: int):
+        """ Waits until the transactions fit in the transactions per second of the PLC device """
+        if self.limiter is not None:
+            self.limiter.acquire(transactions)
+
 
     def close(self):
         """ Closes the underlying socket connection """
         self.client.close()
 
 
-    def read_coil(self, register: int, address_offset: int = 1) -> int:
+    def read_coil(self, register: int, address_offset: int = 1, unit: int = 0) -> int:
         """
         Read the coil and return the result if successful
         Raises: exception if a modbus error occurs. The exception will be raised with the error message
         """
-        result: ReadCoilsResponse = self.client.read_coils(address = register - address_offset)
+        result: ReadCoilsResponse = self.client.read_coils(address = register - address_offset, slave = unit)
         if result.isError():
             uri = config.plc.get_base() + str(register)
             raise Exception(f"[ModbusClient] unable to read coil at {uri}, response: {result}")
         return int(result.getBit(0))
 
 
-    def write_single_coil(self, register: int, value: int, address_offset: int = 1) -> WriteSingleCoilResponse:
+    def write_single_coil(self, register: int, value: int, address_offset: int = 1, unit: int = 0) -> WriteSingleCoilResponse:
         """ Writes the 1-bit value to the register """
         return self.client.write_coil(
             address = register - address_offset,
-            value = value
+            value = value,
+            slave = unit
         )
 
 
-    def read_single_holding_register(self, register: int, address_offset: int = 400001) -> int:
+    def read_single_holding_register(self, register: int, address_offset: int = 400001, unit: int = 0) -> int:
         """
         Returns the value at the holding register
         Raises: exception if a modbus error occurs. The exception will be raised with
@@ -62,7 +93,8 @@ class ModbusClient():
         """
         result: ReadHoldingRegistersResponse = self.client.read_holding_registers(
             address = register - address_offset,
-            count = 1
+            count = 1,
+            slave = unit
         )
         if result.isError():
             uri = config.plc.get_base() + str(register)
@@ -76,14 +108,15 @@ class ModbusClient():
         return decoder.decode_16bit_int()
 
 
-    def read_double_holding_register(self, register: int, address_offset: int = 400001) -> int:
+    def read_double_holding_register(self, register: int, address_offset: int = 400001, unit: int = 0) -> int:
         """
         Returns the value at the double holding register.
         Raises: exception if a modbus error occurs. The exception will be raised with the error message
         """
         result: ReadHoldingRegistersResponse  = self.client.read_holding_registers(
             address = register - address_offset,
-            count = 2
+            count = 2,
+            slave = unit
         )
         if result.isError():
             uri = config.plc.get_base() + str(register)
@@ -96,22 +129,24 @@ class ModbusClient():
         return decoder.decode_32bit_int()
 
 
-    def write_single_holding_register(self, register: int, value: int, address_offset: int = 400001) -> WriteSingleRegisterResponse:
+    def write_single_holding_register(self, register: int, value: int, address_offset: int = 400001, unit: int = 0) -> WriteSingleRegisterResponse:
         """ Write the 16-bit int to the holding register """
         return self.client.write_register(
             address = register - address_offset,
-            value = value
+            value = value,
+            slave = unit
         )
 
 
-    def write_double_holding_register(self, register: int, value: int, address_offset: int = 400001) -> WriteMultipleRegistersResponse:
+    def write_double_holding_register(self, register: int, value: int, address_offset: int = 400001, unit: int = 0) -> WriteMultipleRegistersResponse:
         """ Write the 32-bit int to a pair of holding registers """
         builder = BinaryPayloadBuilder(byteorder=Endian.Big, wordorder=Endian.Little)
         builder.add_32bit_int(value)
         return self.client.write_registers(
             address = register - address_offset,
             values = builder.build(),
-            skip_encode = True
+            skip_encode = True,
+            slave = unit
         )
 
 
@@ -119,7 +154,11 @@ class ModbusClient():
         """
         Method used to read a value from a plc telemetry endpoint
         """
-        with self.lock:
+        unit = config.plc.get_unit_id(form)
+        if self.is_unavailable(unit):
+            return
+
+        with self.lock.hold(unit):
             try:
                 # Open or reconnect to modbus+tcp server
                 if not self.client.connect() or not self.client.is_socket_open():
@@ -130,6 +169,7 @@ class ModbusClient():
                 table: str = form['modbus:entity']
                 register, quantity = parse_href(form['href'])
                 scale = form.get('scale', 1)
+                self.throttle(quantity)
 
                 # Read the specified quantity of registers from the PLC. Default is 1.
                 readings = []
@@ -138,55 +178,89 @@ class ModbusClient():
                     _register = register + index
                     # Read a single coil (i.e. boolean/bit access) value. Usually in the adress range 00001-09999
                     if is_coil(table):
-                        readings.append(self.read_coil(register=_register))
+                        readings.append(self.read_coil(register=_register, unit=unit))
                     # Read single word holding register (16 bit access). Usually in the address range 40001-404500
                     elif is_single_word(table, register=_register):
-                        readings.append(self.read_single_holding_register(register=_register) * scale)
+                        readings.append(self.read_single_holding_register(register=_register, unit=unit) * scale)
                     # reading double word holding register (32 bit access). Usually in the address range 416385-418383
                     elif is_double_word(table, register=_register):
                         # double words require 2 registers to be read, so need to perform skip if this is not the first index
                         _register += index + 1 if index > 0 else 0
-                        readings.append(self.read_double_holding_register(register=_register) * scale)
+                        readings.append(self.read_double_holding_register(register=_register, unit=unit) * scale)
 
                 # Return the reading(s) requested in the form
+                self.unavailable_until.pop(unit, None)
                 return readings[0] if len(readings) == 1 else readings
             except Exception:
                 uri = config.plc.get_base() + str(form.get('href'))
-                logging.exception(f"[ModbusClient] Error reading {uri}")
+                logging.exception(f"[ModbusClient] Error reading {uri} of unit {unit}")
+                self.back_off(unit)
 
 
     def write(self, form: dict, value: int) -> None | WriteSingleCoilResponse | WriteSingleRegisterResponse | WriteMultipleRegistersResponse | List[Union[ None, WriteSingleCoilResponse, WriteSingleRegisterResponse, WriteMultipleRegistersResponse]]:
         """
         Method used to set a value at a plc telemetry endpoint
         """
-        with self.lock:
+        with self.lock.hold(config.plc.get_unit_id(form)):
             try:
                 # Open or reconnect to modbus+tcp server
                 if not self.client.connect() or not self.client.is_socket_open():
                     logging.error(f"[ModbusClient] unable to connect to {config.plc.get_base()}")
                     return
 
-                # Parse the form attributes for writing the property
-                table: str = form['modbus:entity']
-                register, quantity = parse_href(form['href'])
-
-                # Write the value provided to the specified number of registers. Default is 1.
-                responses = []
-                for index in range(quantity):
-                    # Calculate the current register to write the value to given the starting address and index
-                    _register = register if index == 0 else register + index
-                    # Write the value to a single coil (i.e. boolean/bit access) value. Usually in the adress range 00001-09999
-                    if is_coil(table):
-                        responses.append(self.write_single_coil(_register, value))
-                    # Write the value to a single word holding register (16 bit access). Usually in the address range 40001-404500
-                    elif is_single_word(table, _register):
-                        responses.append(self.write_single_holding_register(_register, value))
-                    # Write the value to a double word holding register (32 bit access). Usually in the address range 416385-418383
-                    elif is_double_word(table, _register):
-                        responses.append(self.write_double_holding_register(_register, value))
-
-                # Return the responses(s) generated from the requests in the form
-                return responses[0] if len(responses) == 1 else responses
+                return self.write_form(form, value)
             except Exception:
                 uri = config.plc.get_base() + str(form.get('href'))
                 logging.exception(f"[ModbusClient] Error writing value {value} to {uri}")
+
+
+    def write_many(self, writes: List[tuple[dict, int]]) -> List[None | WriteSingleCoilResponse | WriteSingleRegisterResponse | WriteMultipleRegistersResponse | list]:
+        """
+        Method used to set a batch of values in a single session.
+        The connection is opened once and held for the whole batch, so other reads and writes can not interleave.
+        Returns the response(s) of each write in order, None for the writes that failed.
+        """
+        with self.lock.hold(config.plc.get_unit_id(writes[0][0]) if writes else None):
+            # Open or reconnect to modbus+tcp server
+            if not self.client.connect() or not self.client.is_socket_open():
+                logging.error(f"[ModbusClient] unable to connect to {config.plc.get_base()}")
+                return [None] * len(writes)
+
+            responses = []
+            for form, value in writes:
+                try:
+                    responses.append(self.write_form(form, value))
+                except Exception:
+                    uri = config.plc.get_base() + str(form.get('href'))
+                    logging.exception(f"[ModbusClient] Error writing value {value} to {uri}")
+                    responses.append(None)
+            return responses
+
+
+    def write_form(self, form: dict, value: int) -> WriteSingleCoilResponse | WriteSingleRegisterResponse | WriteMultipleRegistersResponse | List[Union[ None, WriteSingleCoilResponse, WriteSingleRegisterResponse, WriteMultipleRegistersResponse]]:
+        """
+        Writes the value to the registers of the form. The caller must hold the lock and an open connection.
+        """
+        # Parse the form attributes for writing the property
+        table: str = form['modbus:entity']
+        register, quantity = parse_href(form['href'])
+        unit = config.plc.get_unit_id(form)
+        self.throttle(quantity)
+
+        # Write the value provided to the specified number of registers. Default is 1.
+        responses = []
+        for index in range(quantity):
+            # Calculate the current register to write the value to given the starting address and index
+            _register = register if index == 0 else register + index
+            # Write the value to a single coil (i.e. boolean/bit access) value. Usually in the adress range 00001-09999
+            if is_coil(table):
+                responses.append(self.write_single_coil(_register, value, unit=unit))
+            # Write the value to a single word holding register (16 bit access). Usually in the address range 40001-404500
+            elif is_single_word(table, _register):
+                responses.append(self.write_single_holding_register(_register, value, unit=unit))
+            # Write the value to a double word holding register (32 bit access). Usually in the address range 416385-418383
+            elif is_double_word(table, _register):
+                responses.append(self.write_double_holding_register(_register, value, unit=unit))
+
+        # Return the responses(s) generated from the requests in the form
+        return responses[0] if len(responses) == 1 else responses
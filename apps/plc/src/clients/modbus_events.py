@@ -5,33 +5,45 @@ import logging
 
 _lock = threading.Lock()
 _queues = {}
+_dropped = 0
+""" The number of events dropped because a subscriber fell behind """
 
 logger = logging.getLogger()
 
 def publish_event(name: str, value: int | List[int] | None, timestamp: int):
     """
     Publish an event to all subscribers. This function is thread-safe.
+    The publisher never waits for a subscriber: the oldest event of a subscriber that fell behind
+    (e.g. a telemetry publisher blocked on kafka) is dropped, so a slow subscriber can not stall the polling.
     """
-    global _queues, _lock
+    global _queues, _lock, _dropped
 
     with _lock:
-        for thread_id, queue in _queues.items():
+        for thread_id, events in _queues.items():
             try:
-                queue.put((name, value, timestamp))
+                events.put_nowait((name, value, timestamp))
             except queue.Full:
-                logger.warning(f"Queue for thread {thread_id} is full. Dropping event.")
+                try:
+                    events.get_nowait()
+                except queue.Empty:
+                    pass
+                events.put_nowait((name, value, timestamp))
+                if _dropped % 1000 == 0:
+                    logger.warning(f"Queue for thread {thread_id} is full. Dropping the oldest events ({_dropped} dropped so far).")
+                _dropped += 1
 
 
-def subscribe(thread_id: int, timeout=1) -> tuple[str, int | List[int] | None] | None:
+def subscribe(thread_id: int, timeout=1, maxsize: int = 100) -> tuple[str, int | List[int] | None] | None:
     """
     Subscribes to the events if not already subscribed and listens for events.
+    The subscriber buffers up to maxsize events, the oldest events are dropped once it falls further behind.
     This function is thread-safe during subscription.
     """
     global _queues, _lock
 
     with _lock:
         if thread_id not in _queues:
-            _queues[thread_id] = queue.Queue(maxsize=100)
+            _queues[thread_id] = queue.Queue(maxsize=maxsize)
 
     try:
         return _queues[thread_id].get(timeout=timeout)
@@ -48,4 +60,20 @@ def unsubscribe(thread_id: int):
 
     with _lock:
         if thread_id in _queues:
-            del _queues[thread_id]
\ No newline at end of file
+            del _queues[thread_id]
+
+
+def subscribers() -> int:
+    """
+    Returns the number of subscribers to the events.
+    """
+    with _lock:
+        return len(_queues)
+
+
+def dropped() -> int:
+    """
+    Returns the number of events dropped because a subscriber fell behind.
+    """
+    with _lock:
+        return _dropped
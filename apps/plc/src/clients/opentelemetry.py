@@ -1,21 +1,124 @@
 import time
 import logging
+import threading
 
 from collections.abc import Iterable, Callable
 
-from opentelemetry.metrics import CallbackOptions, Observation, Histogram
+from opentelemetry.metrics import CallbackOptions, Observation, Histogram, Counter
 from opentelemetry.sdk.metrics import MeterProvider, Meter
 from opentelemetry.sdk.resources import Resource, SERVICE_NAME, KUBERNETES_POD_UID, KUBERNETES_POD_NAME, KUBERNETES_NAMESPACE_NAME
 from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import (
     OTLPMetricExporter,
 )
-from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader, ConsoleMetricExporter
+from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader, ConsoleMetricExporter, MetricExporter, MetricExportResult, MetricsData
+from opentelemetry.exporter.otlp.proto.common.metrics_encoder import encode_metrics
+from opentelemetry.proto.collector.metrics.v1.metrics_service_pb2 import ExportMetricsServiceRequest
 
 from config import config
+from clients.spool import MappedQueue
 from utilities.config import required_env
+from utilities.ratelimit import TokenBucket
 
 logger = logging.getLogger()
 
+_spool: MappedQueue | None = None
+""" The on-disk queue of the metric batches that could not be exported, shared by every client instance """
+
+
+def get_spool() -> MappedQueue | None:
+    """ Returns the on-disk queue of failed metric exports, None if store-and-forward is disabled """
+    global _spool
+    if _spool is None and config.spool.path:
+        _spool = MappedQueue(path=config.spool.path, capacity=config.spool.capacity_bytes)
+    return _spool
+
+
+class StoreAndForwardMetricExporter(MetricExporter):
+    """
+    Wraps the OTLP exporter to buffer the metric batches while the collector is unreachable.
+    Batches that fail to export are spilled to a bounded, memory-mapped on-disk queue.
+    A replay thread sends them to the collector oldest-first once it is reachable again, rate limited in bytes per second
+    so a reconnect does not saturate the uplink. While the queue holds batches, new batches are queued behind them to keep the order.
+    """
+
+    def __init__(self, exporter: OTLPMetricExporter, spool: MappedQueue):
+        super().__init__(
+            preferred_temporality=exporter._preferred_temporality,
+            preferred_aggregation=exporter._preferred_aggregation,
+        )
+        self.exporter = exporter
+        self.spool = spool
+        self.rate_limiter = TokenBucket(
+            rate=config.spool.replay_bytes_per_second,
+            burst=config.spool.replay_bytes_per_second,
+        )
+        self.stop_event = threading.Event()
+        self.wakeup = threading.Event()
+        self.replayer = threading.Thread(target=self.replay, daemon=True, name='otlp_replay')
+        self.replayer.start()
+
+
+    def export(self, metrics_data: MetricsData, timeout_millis: float = 10_000, **kwargs) -> MetricExportResult:
+        if len(self.spool) == 0:
+            result = self.exporter.export(metrics_data, timeout_millis=timeout_millis, **kwargs)
+            if result is MetricExportResult.SUCCESS:
+                return result
+
+        if not self.spool.put(encode_metrics(metrics_data).SerializeToString()):
+            logger.error('[StoreAndForwardMetricExporter] metric batch is larger than the spool, dropping it')
+            return MetricExportResult.FAILURE
+
+        self.spool.flush()
+        self.wakeup.set()
+        return MetricExportResult.SUCCESS
+
+
+    def send(self, payload: bytes):
+        """
+        Sends an encoded batch to the collector, raising if it fails.
+        export() only takes the MetricsData of the SDK and the spooled batch is already encoded, so this goes through the
+        gRPC stub, headers and timeout of the exporter, which are private to OTLPExporterMixin.
+        They are relied on as of opentelemetry-exporter-otlp 1.20.0, pinned in the Pipfile; check them when upgrading.
+        """
+        self.exporter._client.Export(
+            request=ExportMetricsServiceRequest.FromString(payload),
+            metadata=self.exporter._headers,
+            timeout=self.exporter._timeout,
+        )
+
+
+    def replay(self):
+        """ Sends the spooled batches to the collector oldest-first """
+        while not self.stop_event.is_set():
+            record = self.spool.head_record()
+            if record is None:
+                self.wakeup.wait(config.spool.retry_interval)
+                self.wakeup.clear()
+                continue
+
+            sequence, _, payload = record
+            self.rate_limiter.acquire(len(payload))
+            try:
+                self.send(payload)
+                # a put() on a full spool may have dropped the batch while it was sent, the batch now at the head was not sent
+                self.spool.pop(sequence)
+            except Exception as e:
+                logger.warning(f'[StoreAndForwardMetricExporter] collector unreachable, {len(self.spool)} batches spooled: {e}')
+                self.stop_event.wait(config.spool.retry_interval)
+
+
+    def force_flush(self, timeout_millis: float = 10_000) -> bool:
+        return self.exporter.force_flush(timeout_millis=timeout_millis)
+
+
+    def shutdown(self, timeout_millis: float = 30_000, **kwargs) -> None:
+        # the exporter is shared by the metric readers of every polling time, so it may be shut down more than once
+        if self.stop_event.is_set():
+            return
+        self.stop_event.set()
+        self.wakeup.set()
+        self.exporter.shutdown(timeout_millis=timeout_millis, **kwargs)
+
 
 class OpenTelemetryClient:
     """
@@ -65,10 +168,16 @@ class OpenTelemetryClient:
             insecure = os.getenv('OTEL_EXPORTER_OTLP_METRICS_INSECURE')
             """
 
+            if get_spool() is not None:
+                exporters[-1] = StoreAndForwardMetricExporter(exporter=exporters[-1], spool=get_spool())
+                """
+                The batches that fail to export while the collector is unreachable are stored on disk and forwarded once it is back
+                """
+
         if not exporters:
             raise Exception("No exporters configured! Please set OTEL_METRICS_EXPORTER to 'console' or 'otlp' or both 'console,otlp'")  
 
-        self.providers: dict[int, MeterProvider] = {}
+        self.providers: dict[float, MeterProvider] = {}
         """
         MeterProvider is the entry point of the API. It provides access to Meters.
         The providers are tied to the resource and the configured PeriodicExportingMetricReader(s)
@@ -76,48 +185,71 @@ class OpenTelemetryClient:
         note: using a single provider with multiple periodic metric readers will result in the metrics being collected on each periodic readers interval (i.e this would break the configured polling times)
         """
 
-        for polling_time in config.plc.get_polling_times():
-
-            metric_readers = [
-                PeriodicExportingMetricReader(
-                    exporter = exporter,
-                    export_interval_millis = int(polling_time * 1E3),
-                    export_timeout_millis= int(polling_time * 1E3),
-                )
-                for exporter in exporters
-            ]
-            """ The metric readers collect metrics based on a user-configurable time interval, and passes the metrics to the configured exporter """
-
-            self.providers[polling_time] = MeterProvider(
-                metric_readers = metric_readers,
-                resource = resource,
-            )
-            """ The MeterProvider is the entry point of the API. It provides access to Meters. """
+        self.resource = resource
+        self.exporters = exporters
+        self.meters_lock = threading.Lock()
 
-        self.meters: dict[int, Meter] = {
-            polling_time: provider.get_meter(
-                name = config.plc.name,
-                version = config.plc.spec['version'],
-            )
-            for (polling_time, provider) in self.providers.items()
-        }
+        self.meters: dict[float, Meter] = {}
         """
         The meter is responsible for creating instruments which are then used to produce measurements
         The meters are also unique to each polling time the PLC will sample over as they inherit the MeterProvider
         """
 
+        for polling_time in config.plc.get_polling_times():
+            self.add_meter(polling_time)
+
         self.record_uptime()
         """ The service uptime is reported in seconds as a health metric """
 
         self.histogram: Histogram = self.record_latency()
         """ The service will profile response times / latency  of the modbus+tcp client requests """
 
+        self.writes: Counter = self.record_writes()
+        """ The service counts the writes it applied, skipped or coalesced """
+
+        self.datapoints: Counter = self.record_datapoints()
+        """ The service counts the datapoints of the properties it emitted or suppressed (report-by-exception) """
+
+        self.jitter: Histogram = self.record_jitter()
+        """ The service profiles how late the sampled properties are read against their schedule """
+
+        if get_spool() is not None:
+            self.record_spool()
+            """ The depth, size and replay lag of the store-and-forward queue are reported as health metrics """
 
-    def get_meter(self, polling_time: int) -> Meter:
+
+    def add_meter(self, polling_time: float):
+        """ Adds the provider and meter of a polling time, which export the metrics of the meter at the polling time """
+        metric_readers = [
+            PeriodicExportingMetricReader(
+                exporter = exporter,
+                export_interval_millis = int(polling_time * 1E3),
+                export_timeout_millis= int(polling_time * 1E3),
+            )
+            for exporter in self.exporters
+        ]
+        """ The metric readers collect metrics based on a user-configurable time interval, and passes the metrics to the configured exporter """
+
+        self.providers[polling_time] = MeterProvider(
+            metric_readers = metric_readers,
+            resource = self.resource,
+        )
+        """ The MeterProvider is the entry point of the API. It provides access to Meters. """
+
+        self.meters[polling_time] = self.providers[polling_time].get_meter(
+            name = config.plc.name,
+            version = config.plc.spec['version'],
+        )
+
+
+    def get_meter(self, polling_time: float) -> Meter:
         """
-        returns the meter for the given polling time
+        returns the meter for the given polling time, a polling time added by a reload of the spec gets a new meter
         """
-        return self.meters[polling_time]
+        with self.meters_lock:
+            if polling_time not in self.meters:
+                self.add_meter(polling_time)
+            return self.meters[polling_time]
 
 
     def record_uptime(self):
@@ -152,6 +284,71 @@ class OpenTelemetryClient:
         )
 
 
+    def record_jitter(self) -> Histogram:
+        """ Creates a histogram to record the scheduling jitter of the sampled properties """
+        meter = self.get_meter(polling_time=max(config.plc.get_polling_times()))
+        return meter.create_histogram(
+            name=f'{config.plc.name}.sampling.jitter',
+            unit="ms",
+            description=f"The delay between the scheduled and the actual start of a sample of the {config.plc.name} plc properties in milliseconds"
+        )
+
+
+    def record_writes(self) -> Counter:
+        """ Creates a counter to record the outcome of the write requests """
+        meter = self.get_meter(polling_time=max(config.plc.get_polling_times()))
+        return meter.create_counter(
+            name=f'{config.plc.name}.modbus.writes',
+            unit="1",
+            description=f"The number of write requests of the {config.plc.name} plc service by outcome (applied, skipped, coalesced)"
+        )
+
+
+    def record_datapoints(self) -> Counter:
+        """ Creates a counter to record the datapoints of the observed properties that were emitted or suppressed """
+        meter = self.get_meter(polling_time=max(config.plc.get_polling_times()))
+        return meter.create_counter(
+            name=f'{config.plc.name}.datapoints',
+            unit="1",
+            description=f"The number of datapoints of the {config.plc.name} plc properties by outcome (emitted, suppressed)"
+        )
+
+
+    def record_spool(self):
+        """ Records the state of the store-and-forward queue of failed metric exports """
+        meter = self.get_meter(polling_time=max(config.plc.get_polling_times()))
+        spool = get_spool()
+
+        def depth_callback(options: CallbackOptions) -> Iterable[Observation]:
+            return [Observation(value = len(spool))]
+
+        def bytes_callback(options: CallbackOptions) -> Iterable[Observation]:
+            return [Observation(value = spool.size())]
+
+        def lag_callback(options: CallbackOptions) -> Iterable[Observation]:
+            oldest = spool.oldest()
+            return [Observation(value = time.time() - oldest if oldest is not None else 0)]
+
+        meter.create_observable_gauge(
+            name = f'{config.plc.name}.otlp.spool.depth',
+            description = 'The number of metric batches waiting to be replayed to the collector',
+            unit = '1',
+            callbacks = [depth_callback]
+        )
+        meter.create_observable_gauge(
+            name = f'{config.plc.name}.otlp.spool.size',
+            description = 'The bytes on disk used by the metric batches waiting to be replayed to the collector',
+            unit = 'By',
+            callbacks = [bytes_callback]
+        )
+        meter.create_observable_gauge(
+            name = f'{config.plc.name}.otlp.spool.lag',
+            description = 'The age of the oldest metric batch waiting to be replayed to the collector',
+            unit = 's',
+            callbacks = [lag_callback]
+        )
+
+
     def shutdown(self):
         """
         Shutdown the clients provider
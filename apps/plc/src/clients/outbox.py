@@ -0,0 +1,270 @@
+import os
+import struct
+import zlib
+import bisect
+import logging
+import threading
+
+logger = logging.getLogger()
+
+_HEADER = struct.Struct('>QII')
+""" Record header: offset (uint64), payload length (uint32), payload crc32 (uint32) """
+
+_SEGMENT_SUFFIX = '.log'
+_CHECKPOINT_FILE = 'checkpoint'
+
+
+class Outbox:
+    """
+    A durable, append-only write-ahead log for events that must survive a Kafka outage or a pod restart.
+
+    Records are appended to segment files named after the offset of their first record.
+    Appends are flushed to the OS immediately and fsync'd in batches (every `fsync_batch` records or
+    `fsync_interval_ms` milliseconds, whichever comes first).
+    The consumer reads records from the last checkpointed offset and commits offsets once they were acknowledged,
+    which gives at-least-once delivery. Fully acknowledged segments are deleted, and if the log grows beyond `max_bytes`
+    the oldest segments are dropped so disk usage stays bounded.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        segment_bytes: int = 1024 * 1024,
+        max_bytes: int = 64 * 1024 * 1024,
+        fsync_interval_ms: int = 100,
+        fsync_batch: int = 32,
+    ):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync_interval = fsync_interval_ms / 1E3
+        self.fsync_batch = fsync_batch
+
+        self.lock = threading.Lock()
+        self.appended = threading.Condition(self.lock)
+
+        self._unsynced = 0
+        self._sync_timer: threading.Timer | None = None
+        self._cursor: tuple[int, int, int] | None = None
+        """ The reader position as (segment base offset, file position, offset) to avoid rescanning segments """
+
+        os.makedirs(self.directory, exist_ok=True)
+        self.segments: list[int] = sorted(
+            int(file[:-len(_SEGMENT_SUFFIX)])
+            for file in os.listdir(self.directory)
+            if file.endswith(_SEGMENT_SUFFIX)
+        )
+        """ The base offsets of the segments on disk, oldest first """
+
+        self.next_offset = self._recover()
+        """ The offset that will be assigned to the next appended record """
+
+        self.committed = min(max(self._read_checkpoint(), self._first_offset()), self.next_offset)
+        """ The offset of the next record to deliver, every record before it has been acknowledged """
+
+        if not self.segments:
+            self.segments.append(self.next_offset)
+        self._file = open(self._segment_path(self.segments[-1]), 'ab')
+
+
+    def _segment_path(self, base_offset: int) -> str:
+        return os.path.join(self.directory, f'{base_offset:020d}{_SEGMENT_SUFFIX}')
+
+
+    def _first_offset(self) -> int:
+        return self.segments[0] if self.segments else 0
+
+
+    def _recover(self) -> int:
+        """
+        Scans the active segment for the last valid record and truncates a torn tail left by a crash.
+        Returns the next offset to assign.
+        """
+        if not self.segments:
+            return self._read_checkpoint()
+
+        path = self._segment_path(self.segments[-1])
+        next_offset, position = self.segments[-1], 0
+        with open(path, 'rb') as f:
+            for offset, _, end in self._scan(f):
+                next_offset, position = offset + 1, end
+
+        if position != os.path.getsize(path):
+            logger.warning(f'[Outbox] truncating torn tail of {path} at byte {position}')
+            with open(path, 'r+b') as f:
+                f.truncate(position)
+                os.fsync(f.fileno())
+
+        return next_offset
+
+
+    @staticmethod
+    def _scan(f):
+        """ Yields (offset, payload, end position) for each valid record of the segment file """
+        while True:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                return
+            offset, length, crc = _HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                return
+            yield offset, payload, f.tell()
+
+
+    def _read_checkpoint(self) -> int:
+        try:
+            with open(os.path.join(self.directory, _CHECKPOINT_FILE), 'rt') as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+
+    def _write_checkpoint(self, offset: int):
+        """ Atomically replaces the checkpoint file """
+        path = os.path.join(self.directory, _CHECKPOINT_FILE)
+        with open(path + '.tmp', 'wt') as f:
+            f.write(str(offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+
+
+    def append(self, payload: bytes) -> int:
+        """ Appends the payload to the log and returns its offset """
+        with self.lock:
+            offset = self.next_offset
+            self._file.write(_HEADER.pack(offset, len(payload), zlib.crc32(payload)))
+            self._file.write(payload)
+            self._file.flush()
+            self.next_offset += 1
+
+            self._unsynced += 1
+            if self._unsynced >= self.fsync_batch:
+                self._sync()
+            elif self._sync_timer is None:
+                self._sync_timer = threading.Timer(self.fsync_interval, self.sync)
+                self._sync_timer.daemon = True
+                self._sync_timer.start()
+
+            if self._file.tell() >= self.segment_bytes:
+                self._roll()
+
+            self.appended.notify_all()
+            return offset
+
+
+    def sync(self):
+        """ Forces the unsynced records of the active segment to disk """
+        with self.lock:
+            self._sync()
+
+
+    def _sync(self):
+        if self._sync_timer is not None:
+            self._sync_timer.cancel()
+            self._sync_timer = None
+        if self._unsynced:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+
+
+    def _roll(self):
+        """ Starts a new segment and enforces the disk usage bound """
+        self._sync()
+        self._file.close()
+        self.segments.append(self.next_offset)
+        self._file = open(self._segment_path(self.next_offset), 'ab')
+
+        while len(self.segments) > 1 and self._disk_usage() > self.max_bytes:
+            dropped = self.segments.pop(0)
+            os.remove(self._segment_path(dropped))
+            if self.committed < self.segments[0]:
+                logger.warning(f'[Outbox] disk limit of {self.max_bytes} bytes reached, dropped {self.segments[0] - self.committed} unacknowledged records')
+                self.committed = self.segments[0]
+                self._cursor = None
+
+
+    def _disk_usage(self) -> int:
+        return sum(os.path.getsize(self._segment_path(base)) for base in self.segments)
+
+
+    def read(self, max_records: int = 100, timeout: float | None = None) -> list[tuple[int, bytes]]:
+        """
+        Returns up to `max_records` (offset, payload) tuples starting at the committed offset.
+        Blocks up to `timeout` seconds if there is nothing to deliver.
+        """
+        with self.lock:
+            if self.committed >= self.next_offset:
+                self.appended.wait(timeout)
+
+            offset = self.committed
+            if offset >= self.next_offset:
+                return []
+
+            if self._cursor is not None and self._cursor[2] == offset:
+                base, position, _ = self._cursor
+            else:
+                base, position = self.segments[bisect.bisect_right(self.segments, offset) - 1], 0
+
+            records = []
+            while len(records) < max_records and offset < self.next_offset:
+                with open(self._segment_path(base), 'rb') as f:
+                    f.seek(position)
+                    for record_offset, payload, end in self._scan(f):
+                        position = end
+                        if record_offset < offset:
+                            continue
+                        records.append((record_offset, payload))
+                        offset = record_offset + 1
+                        if len(records) >= max_records:
+                            break
+
+                # move on to the next segment once this one is exhausted
+                index = self.segments.index(base)
+                if len(records) < max_records and index + 1 < len(self.segments):
+                    base, position = self.segments[index + 1], 0
+                else:
+                    break
+
+            # a batch that ends on the last record of a rolled segment leaves the cursor on the next segment,
+            # so the reader does not reopen a segment the commit of the batch removes
+            index = self.segments.index(base)
+            if index + 1 < len(self.segments) and position >= os.path.getsize(self._segment_path(base)):
+                base, position = self.segments[index + 1], 0
+
+            self._cursor = (base, position, offset)
+            return records
+
+
+    def rewind(self):
+        """ Restarts reading from the committed offset, e.g after a failed delivery """
+        with self.lock:
+            self._cursor = None
+
+
+    def commit(self, offset: int):
+        """ Acknowledges every record up to and including the offset """
+        with self.lock:
+            if offset < self.committed:
+                return
+            self.committed = offset + 1
+            self._write_checkpoint(self.committed)
+
+            # remove segments in which every record was acknowledged
+            while len(self.segments) > 1 and self.segments[1] <= self.committed:
+                os.remove(self._segment_path(self.segments.pop(0)))
+            if self._cursor is not None and self._cursor[0] < self.segments[0]:
+                self._cursor = None
+
+
+    def lag(self) -> int:
+        """ Returns the number of records that have not been acknowledged yet """
+        return self.next_offset - self.committed
+
+
+    def close(self):
+        """ Syncs and closes the active segment """
+        with self.lock:
+            self._sync()
+            self._file.close()
@@ -0,0 +1,175 @@
+import os
+import mmap
+import time
+import struct
+import threading
+
+_HEADER = struct.Struct('>8sQQQQQ')
+""" File header: magic, capacity, head position, tail position, record count, sequence number of the head record """
+
+_RECORD = struct.Struct('>Id')
+""" Record header: payload length (uint32), time the record was spooled in unix seconds (float64) """
+
+_MAGIC = b'PLCSPOOL'
+_WRAP = 0xFFFFFFFF
+""" Marks the end of the used region when the next record did not fit before the end of the file """
+
+_DATA_START = 64
+""" The records start after the header, aligned to a cache line """
+
+
+class MappedQueue:
+    """
+    A bounded FIFO queue of byte records in a memory-mapped file.
+    The file is a ring buffer: records are appended at the tail and consumed from the head,
+    and once the file is full the oldest records are dropped to make room for new ones.
+    The positions are kept in the header of the file, so the queue survives a restart of the process.
+    """
+
+    def __init__(self, path: str, capacity: int):
+        self.path = path
+        self.lock = threading.Lock()
+        self.dropped = 0
+        """ The number of records dropped because the queue was full """
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size != capacity:
+                os.ftruncate(fd, capacity)
+            self.mm = mmap.mmap(fd, capacity)
+        finally:
+            os.close(fd)
+
+        magic, stored_capacity, self.head, self.tail, self.count, self.sequence = _HEADER.unpack_from(self.mm, 0)
+        """ The sequence number of the oldest record, incremented every time a record is removed from the head """
+        if magic != _MAGIC or stored_capacity != capacity:
+            self.capacity = capacity
+            self.head = self.tail = _DATA_START
+            self.count = 0
+            self.sequence = 0
+            self._write_header()
+        self.capacity = capacity
+
+
+    def _write_header(self):
+        _HEADER.pack_into(self.mm, 0, _MAGIC, self.capacity, self.head, self.tail, self.count, self.sequence)
+
+
+    def _fits(self, size: int) -> bool:
+        if self.count == 0:
+            self.head = self.tail = _DATA_START
+            return size <= self.capacity - _DATA_START
+        if self.tail == self.head:
+            return False
+        if self.tail > self.head:
+            return size <= self.capacity - self.tail or size <= self.head - _DATA_START
+        return self.tail + size <= self.head
+
+
+    def _locate_head(self) -> int:
+        """ Returns the position of the oldest record, following the wrap marker if there is one """
+        if self.capacity - self.head < _RECORD.size or struct.unpack_from('>I', self.mm, self.head)[0] == _WRAP:
+            return _DATA_START
+        return self.head
+
+
+    def _drop(self):
+        position = self._locate_head()
+        length, _ = _RECORD.unpack_from(self.mm, position)
+        self.head = position + _RECORD.size + length
+        self.count -= 1
+        self.sequence += 1
+
+
+    def put(self, payload: bytes, timestamp: float | None = None) -> bool:
+        """
+        Appends the record, dropping the oldest records if the queue is full.
+        Returns False if the record is larger than the queue.
+        """
+        size = _RECORD.size + len(payload)
+        if size > self.capacity - _DATA_START:
+            return False
+
+        with self.lock:
+            while not self._fits(size):
+                self._drop()
+                self.dropped += 1
+
+            if self.tail + size > self.capacity:
+                if self.capacity - self.tail >= 4:
+                    struct.pack_into('>I', self.mm, self.tail, _WRAP)
+                self.tail = _DATA_START
+
+            _RECORD.pack_into(self.mm, self.tail, len(payload), timestamp if timestamp is not None else time.time())
+            self.mm[self.tail + _RECORD.size:self.tail + size] = payload
+            self.tail += size
+            self.count += 1
+            self._write_header()
+            return True
+
+
+    def head_record(self) -> tuple[int, float, bytes] | None:
+        """
+        Returns the sequence number, time and payload of the oldest record without removing it, None if the queue is empty.
+        The sequence number is passed to pop() to remove the record only if it was not dropped in the meantime.
+        """
+        with self.lock:
+            if self.count == 0:
+                return None
+            position = self._locate_head()
+            length, timestamp = _RECORD.unpack_from(self.mm, position)
+            start = position + _RECORD.size
+            return self.sequence, timestamp, bytes(self.mm[start:start + length])
+
+
+    def peek(self) -> tuple[float, bytes] | None:
+        """ Returns the time and payload of the oldest record without removing it, None if the queue is empty """
+        record = self.head_record()
+        return record[1:] if record else None
+
+
+    def pop(self, sequence: int | None = None) -> bool:
+        """
+        Removes the oldest record. If a sequence number is given, the record is removed only if it is still the oldest one,
+        since a put() on a full queue may have dropped it and the record now at the head has not been consumed.
+        Returns True if a record was removed.
+        """
+        with self.lock:
+            if self.count == 0 or (sequence is not None and sequence != self.sequence):
+                return False
+            self._drop()
+            self._write_header()
+            return True
+
+
+    def __len__(self) -> int:
+        return self.count
+
+
+    def size(self) -> int:
+        """ Returns the number of bytes used by the records """
+        with self.lock:
+            if self.count == 0:
+                return 0
+            if self.tail > self.head:
+                return self.tail - self.head
+            return (self.capacity - self.head) + (self.tail - _DATA_START)
+
+
+    def oldest(self) -> float | None:
+        """ Returns the time the oldest record was spooled, None if the queue is empty """
+        record = self.peek()
+        return record[0] if record else None
+
+
+    def flush(self):
+        """ Writes the dirty pages of the file to disk """
+        with self.lock:
+            self.mm.flush()
+
+
+    def close(self):
+        with self.lock:
+            self.mm.flush()
+            self.mm.close()
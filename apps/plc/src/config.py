@@ -2,8 +2,8 @@ import os
 import ast
 from distutils.util import strtobool
 
-from utilities.config import required_env
-from models.config import Config, KubernetesAttributes, PLC, Flask, ModbusClient, KafkaConfig
+from utilities.config import required_env, load_spec
+from models.config import Config, KubernetesAttributes, PLC, Flask, ModbusClient, KafkaConfig, OutboxConfig, TelemetryConfig, CommandsConfig, WritesConfig, HistoryConfig, SpoolConfig, LeaseConfig
 
 config = None
 
@@ -12,12 +12,46 @@ def get_config() -> Config:
     return config
 
 
-def initialize():
+def get_shard_specs() -> dict | None:
+    """
+    Returns the PLCs hosted by the service when it runs as a shard, by name with the port and spec of each PLC.
+    The specs are read from SHARD_SPECS_FILE if set (the mounted ConfigMap of the shard), SHARD_SPECS otherwise.
+    None if the service hosts the single PLC of NAME and SPEC
+    """
+    specs_file = os.getenv('SHARD_SPECS_FILE', '')
+    if specs_file:
+        return load_spec(specs_file)
+    specs = os.getenv('SHARD_SPECS')
+    return ast.literal_eval(specs) if specs else None
+
+
+def shard_path(path: str, name: str) -> str:
+    """ Returns the path of a file or directory of the PLC within a shard, so the PLCs of a shard do not share it """
+    root, extension = os.path.splitext(path)
+    return f'{root}-{name}{extension}' if path else path
+
+
+def initialize(name: str | None = None, spec: dict | None = None, port: int | None = None):
+    """
+    Initializes the configuration from the environment.
+    A shard initializes the configuration of each of its PLCs with the name, spec and port of the PLC
+    """
     global config
+    sharded = name is not None
+
+    # the spec is read from SPEC_FILE if set (a mounted ConfigMap the spec is reloaded from), SPEC otherwise,
+    # a PLC of a shard reloads its spec from its entry in SHARD_SPECS_FILE
+    spec_file = os.getenv('SHARD_SPECS_FILE', '') if sharded else os.getenv('SPEC_FILE', '')
+    if not sharded:
+        spec = load_spec(spec_file) if spec_file else ast.literal_eval(required_env('SPEC'))
 
     plc_config = PLC(
-        name = required_env('NAME'),
-        spec = ast.literal_eval(required_env('SPEC')),
+        name = name if sharded else required_env('NAME'),
+        spec = spec,
+        min_export_interval = float(os.getenv('PLC_MIN_EXPORT_INTERVAL', 1.0)),
+        spec_file = spec_file,
+        reload_interval = float(os.getenv('SPEC_RELOAD_INTERVAL', 5.0)),
+        sharded = sharded,
     )
 
     modbus_client_config = ModbusClient(
@@ -28,10 +62,19 @@ def initialize():
         coil_table = os.getenv('PLC_COIL_TABLE', 'Coil'),
         holding_register_table = os.getenv('PLC_HOLDING_REGISTER_TABLE', 'HoldingRegister'),
         timeout = float(os.getenv('PLC_TIMEOUT', 1.0)),
+        max_transactions_per_second = float(os.getenv('PLC_MAX_TRANSACTIONS_PER_SECOND', 0)),
+        unit_backoff = float(os.getenv('PLC_UNIT_BACKOFF', 10.0)),
     )
 
     flask_config = Flask(
-        port = int(os.getenv('FLASK_PORT', 5000)),
+        port = port if sharded else int(os.getenv('FLASK_PORT', 5000)),
+        server = os.getenv('HTTP_SERVER', 'waitress'),
+        threads = int(os.getenv('HTTP_THREADS', 16)),
+        connection_limit = int(os.getenv('HTTP_CONNECTION_LIMIT', 100)),
+        channel_timeout = int(os.getenv('HTTP_CHANNEL_TIMEOUT', 60)),
+        shutdown_timeout = float(os.getenv('HTTP_SHUTDOWN_TIMEOUT', 5.0)),
+        max_event_subscribers = int(os.getenv('HTTP_MAX_EVENT_SUBSCRIBERS', 8)),
+        workers = int(os.getenv('HTTP_WORKERS', 0)),
     )
 
     k8s_attributes = KubernetesAttributes(
@@ -47,11 +90,67 @@ def initialize():
         retries = int(os.getenv('KAFKA_RETRIES', 5)),
     )
 
+    outbox_config = OutboxConfig(
+        directory = shard_path(os.getenv('EVENTS_OUTBOX_DIR', ''), name) if sharded else os.getenv('EVENTS_OUTBOX_DIR', ''),
+        segment_bytes = int(os.getenv('EVENTS_OUTBOX_SEGMENT_BYTES', 1024 * 1024)),
+        max_bytes = int(os.getenv('EVENTS_OUTBOX_MAX_BYTES', 64 * 1024 * 1024)),
+        fsync_interval_ms = int(os.getenv('EVENTS_OUTBOX_FSYNC_INTERVAL_MS', 100)),
+        fsync_batch = int(os.getenv('EVENTS_OUTBOX_FSYNC_BATCH', 32)),
+        batch_size = int(os.getenv('EVENTS_OUTBOX_BATCH_SIZE', 100)),
+    )
+
+    telemetry_config = TelemetryConfig(
+        topic = os.getenv('KAFKA_TELEMETRY_TOPIC', ''),
+        linger_ms = int(os.getenv('KAFKA_TELEMETRY_LINGER_MS', 100)),
+        batch_size = int(os.getenv('KAFKA_TELEMETRY_BATCH_SIZE', 64 * 1024)),
+        compression_type = os.getenv('KAFKA_TELEMETRY_COMPRESSION_TYPE') or None,
+    )
+
+    commands_config = CommandsConfig(
+        topic = os.getenv('KAFKA_COMMANDS_TOPIC', ''),
+        group_id = os.getenv('KAFKA_COMMANDS_GROUP_ID', f'plc.{plc_config.name}'),
+        poll_window_ms = int(os.getenv('KAFKA_COMMANDS_POLL_WINDOW_MS', 500)),
+        max_records = int(os.getenv('KAFKA_COMMANDS_MAX_RECORDS', 500)),
+        max_attempts = int(os.getenv('KAFKA_COMMANDS_MAX_ATTEMPTS', 3)),
+    )
+
+    writes_config = WritesConfig(
+        debounce_ms = int(os.getenv('WRITE_DEBOUNCE_MS', 0)),
+        compare_max_age_ms = int(os.getenv('WRITE_COMPARE_MAX_AGE_MS', 0)),
+    )
+
+    history_config = HistoryConfig(
+        memory_bytes = int(os.getenv('HISTORY_MEMORY_BYTES', 8 * 1024 * 1024)),
+        samples_per_chunk = int(os.getenv('HISTORY_SAMPLES_PER_CHUNK', 128)),
+        default_window = float(os.getenv('HISTORY_DEFAULT_WINDOW', 600)),
+    )
+
+    spool_config = SpoolConfig(
+        path = shard_path(os.getenv('OTEL_SPOOL_PATH', ''), name) if sharded else os.getenv('OTEL_SPOOL_PATH', ''),
+        capacity_bytes = int(os.getenv('OTEL_SPOOL_CAPACITY_BYTES', 64 * 1024 * 1024)),
+        replay_bytes_per_second = int(os.getenv('OTEL_SPOOL_REPLAY_BYTES_PER_SECOND', 256 * 1024)),
+        retry_interval = float(os.getenv('OTEL_SPOOL_RETRY_INTERVAL', 10)),
+    )
+
+    lease_config = LeaseConfig(
+        name = '' if sharded else os.getenv('LEASE_NAME', ''),
+        duration = float(os.getenv('LEASE_DURATION_SECONDS', 15)),
+        renew_deadline = float(os.getenv('LEASE_RENEW_DEADLINE_SECONDS', 10)),
+        retry_interval = float(os.getenv('LEASE_RETRY_INTERVAL_SECONDS', 2)),
+    )
+
     config = Config(
         plc = plc_config,
         flask = flask_config,
         k8s = k8s_attributes,
         kafka = kafka_config,
+        outbox = outbox_config,
+        telemetry = telemetry_config,
+        commands = commands_config,
+        writes = writes_config,
+        history = history_config,
+        spool = spool_config,
+        lease = lease_config,
         modbus_client = modbus_client_config,
         debug = strtobool(os.getenv('DEBUG', 'False')),
         environment = required_env('ENVIRONMENT'),
@@ -1,4 +1,7 @@
+import os
+import sys
 import time
+import signal
 import logging
 
 import config
@@ -11,6 +14,23 @@ if __name__ == '__main__':
     Multiple of these PLC servients work together to build the system that runs feed automations and manages IIoT data.
     """
 
+    # host many PLCs in a process per PLC if the service runs as a shard
+    specs = config.get_shard_specs()
+    if specs is not None:
+        logging.basicConfig(level=logging.INFO)
+
+        from shard import Shard
+        shard = Shard(specs, specs_file=os.getenv('SHARD_SPECS_FILE', ''), reload_interval=float(os.getenv('SPEC_RELOAD_INTERVAL', 5.0)))
+        shard.start()
+
+        def stop_shard(signum, frame):
+            logging.getLogger().info(f'received signal {signum}, stopping the shard')
+            shard.stop()
+            sys.exit(0)
+
+        signal.signal(signal.SIGTERM, stop_shard)
+        shard.supervise()
+
     # initialize the configuration
     config.initialize()
 
@@ -22,6 +42,14 @@ if __name__ == '__main__':
     import services
     services.start()
 
+    def shutdown(signum, frame):
+        """ Kubernetes sends SIGTERM before it kills the pod, stop the services gracefully """
+        logger.info(f'received signal {signum}, shutting down')
+        services.stop()
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, shutdown)
+
     while True:
         logger.debug('PLC main loop')
         time.sleep(100)
\ No newline at end of file
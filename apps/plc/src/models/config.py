@@ -13,6 +13,18 @@ class PLC:
     spec: dict
     """ The spec of the PLC which defines the base URI and properties """
 
+    min_export_interval: float = 1.0
+    """ The shortest interval in seconds metrics are exported at, faster properties are sampled and aggregated per interval """
+
+    spec_file: str = ''
+    """ The json file the spec was loaded from, the file is watched and changes to the properties are applied without a restart """
+
+    reload_interval: float = 5.0
+    """ The interval in seconds the spec file is checked for changes at """
+
+    sharded: bool = False
+    """ True if the PLC is hosted by a shard, its spec is its entry in the spec file of the shard """
+
     def __str__(self):
         return self.name
 
@@ -32,16 +44,97 @@ class PLC:
             if 'observeproperty' in property['forms'][0]['op']
         ]
 
-    def get_polling_times(self) -> set[int]:
-        """ Returns the polling times of the PLC device """
+    def get_debounce_times(self, default: float) -> dict[str, float]:
+        """ Returns the debounce time in seconds of every writable property that coalesces its writes """
+        debounce_times = {}
+        for name, property in self.spec['properties'].items():
+            form = property['forms'][0]
+            if 'writeproperty' in form['op'] and float(form.get('modbus:debounceTime', default)) > 0:
+                debounce_times[name] = float(form.get('modbus:debounceTime', default))
+
+        return debounce_times
+
+    def get_sampling_times(self) -> dict[str, float]:
+        """
+        Returns the sampling time in seconds of every observable property that is sampled faster than it is exported.
+        The samples of these properties are aggregated per export interval.
+        A property polled faster than the minimum export interval is sampled at its polling time
+        """
+        sampling_times = {}
+        for name in self.get_all_observable_properties():
+            form = self.get_property_form(name)
+            sampling_time = min(float(form.get('modbus:samplingTime', form['modbus:pollingTime'])), float(form['modbus:pollingTime']))
+            if sampling_time < self.get_export_interval(name):
+                sampling_times[name] = sampling_time
+
+        return sampling_times
+
+    def get_adaptive_polling(self) -> dict[str, tuple[float, float]]:
+        """
+        Returns the minimum and maximum polling time in seconds of every observable property that is polled adaptively.
+        The bounds default to the polling time and ten polling times
+        """
+        adaptive = {}
+        for name in self.get_all_observable_properties():
+            form = self.get_property_form(name)
+            if form.get('modbus:adaptive', False):
+                polling_time = float(form['modbus:pollingTime'])
+                minimum = float(form.get('modbus:minPollingTime', polling_time))
+                adaptive[name] = (minimum, max(minimum, float(form.get('modbus:maxPollingTime', 10 * polling_time))))
+
+        return adaptive
+
+    def get_exception_reporting(self) -> dict[str, tuple[float, float | None]]:
+        """
+        Returns the deadband and heartbeat in seconds of every observable property that is reported by exception.
+        A property that only declares a deadband gets a heartbeat of ten polling intervals,
+        a property that only declares a heartbeat is reported on any change.
+        """
+        reporting = {}
+        for name in self.get_all_observable_properties():
+            form = self.get_property_form(name)
+            if 'modbus:deadband' in form or 'modbus:heartbeat' in form:
+                reporting[name] = (
+                    float(form.get('modbus:deadband', 0)),
+                    float(form.get('modbus:heartbeat', 10 * float(form['modbus:pollingTime']))),
+                )
+
+        return reporting
+
+    def get_export_interval(self, property_name: str) -> float:
+        """ Returns the interval in seconds the property is exported at, its polling time bounded by the minimum export interval """
+        return max(float(self.get_property_form(property_name)['modbus:pollingTime']), self.min_export_interval)
+
+    def get_polling_times(self) -> set[float]:
+        """ Returns the export intervals of the PLC device, the polling times bounded by the minimum export interval """
 
         polling_times = []
         for property in self.spec['properties'].values():
             if 'modbus:pollingTime' in property['forms'][0]:
-                polling_times.append(int(property['forms'][0]['modbus:pollingTime']))
+                polling_times.append(max(float(property['forms'][0]['modbus:pollingTime']), self.min_export_interval))
 
         return set(polling_times)
 
+    def get_unit_id(self, form: dict | None = None) -> int:
+        """
+        Returns the unit ID (slave ID) a form is addressed to. The unit ID is taken from modbus:unitID,
+        the unit of an absolute href (modbus+tcp://{address}:{port}/{unitID}/{address}) or the unit of the base URI.
+        Returns 0 if none of them defines a unit ID
+        """
+        if form is not None:
+            if 'modbus:unitID' in form:
+                return int(form['modbus:unitID'])
+            match = re.search(pattern=r"//[^/]+/(\d+)/", string=str(form.get('href', '')))
+            if match:
+                return int(match.group(1))
+
+        match = re.search(pattern=r"//[^/]+/(\d+)", string=self.spec["base"])
+        return int(match.group(1)) if match else 0
+
+    def get_unit_ids(self) -> set[int]:
+        """ Returns the unit IDs addressed by the properties of the PLC device """
+        return {self.get_unit_id(property['forms'][0]) for property in self.spec['properties'].values()}
+
     def get_host(self) -> str:
         """ Returns the host IP address of the PLC device """
         return re.search(pattern=r"//(.+):", string=self.spec["base"]).group(1)
@@ -86,6 +179,12 @@ class ModbusClient:
     timeout: float
     """ The timeout for the modbus client """
 
+    max_transactions_per_second: float = 0
+    """ The maximum modbus transactions per second sent to the PLC device. Unlimited if 0 """
+
+    unit_backoff: float = 10.0
+    """ The time in seconds the reads of a unit that failed to respond are skipped when several units share the connection """
+
 
 @dataclass(frozen=True)
 class KubernetesAttributes:
@@ -133,6 +232,33 @@ class Flask:
     defaults to ``'0.0.0.0'`` to have the server available externally
     """
 
+    server: str = "waitress"
+    """
+    the WSGI server that serves the api. ``'waitress'`` is a production server with a bounded thread pool,
+    ``'werkzeug'`` is the flask development server that spawns a thread per connection
+    """
+
+    threads: int = 16
+    """ the number of worker threads that handle requests """
+
+    connection_limit: int = 100
+    """ the maximum number of simultaneous connections, further connections wait in the listen backlog """
+
+    channel_timeout: int = 60
+    """ the time in seconds an idle keep-alive connection is held open """
+
+    shutdown_timeout: float = 5.0
+    """ the time in seconds in-flight requests are given to complete on shutdown """
+
+    max_event_subscribers: int = 8
+    """ the maximum number of concurrent event stream subscribers, each subscriber holds a worker thread """
+
+    workers: int = 0
+    """
+    the number of http worker processes. If 0 the api is served by threads of the PLC process,
+    otherwise the PLC process is a gateway that owns the modbus connection and the workers serve the api
+    """
+
 @dataclass(frozen=True)
 class KafkaConfig:
     """The Kafka configuration"""
@@ -150,6 +276,128 @@ class KafkaConfig:
     """ The Kafka retries """
 
 
+@dataclass(frozen=True)
+class TelemetryConfig:
+    """The Kafka telemetry stream configuration"""
+
+    topic: str
+    """ The Kafka topic the sampled telemetry is streamed to. The stream is disabled if empty """
+
+    linger_ms: int
+    """ The time in milliseconds the producer waits to batch records and to complete a polling cycle """
+
+    batch_size: int
+    """ The maximum size in bytes of a producer batch """
+
+    compression_type: str | None
+    """ The compression codec of the producer batches (e.g 'gzip', 'lz4'). None to disable compression """
+
+
+@dataclass(frozen=True)
+class CommandsConfig:
+    """The Kafka write commands configuration"""
+
+    topic: str
+    """ The Kafka topic the write commands are consumed from. The consumer is disabled if empty """
+
+    group_id: str
+    """ The Kafka consumer group of the PLC service """
+
+    poll_window_ms: int
+    """ The time in milliseconds the consumer waits to batch commands before they are applied """
+
+    max_records: int
+    """ The maximum number of commands applied in a batch """
+
+    max_attempts: int = 3
+    """ The number of times a batch with a failed write is delivered before it is dropped """
+
+
+@dataclass(frozen=True)
+class WritesConfig:
+    """The write coalescing configuration"""
+
+    debounce_ms: int
+    """
+    The window in milliseconds in which writes to the same property are coalesced, only the last value is written.
+    Writes are applied immediately if 0. Properties can override the window with modbus:debounceTime in seconds
+    """
+
+    compare_max_age_ms: int
+    """ Writes of a value that was read within this many milliseconds are skipped. Disabled if 0 """
+
+
+@dataclass(frozen=True)
+class HistoryConfig:
+    """The in-memory time-series history configuration"""
+
+    memory_bytes: int
+    """ The memory budget in bytes shared by the history of all observed properties. The history is disabled if 0 """
+
+    samples_per_chunk: int
+    """ The number of samples compressed together, larger chunks compress better but are slower to query """
+
+    default_window: float
+    """ The time in seconds a history query covers when since is not given """
+
+
+@dataclass(frozen=True)
+class SpoolConfig:
+    """The store-and-forward configuration of the OTLP metric exports"""
+
+    path: str
+    """ The memory-mapped file that buffers the failed metric exports. Store-and-forward is disabled if empty """
+
+    capacity_bytes: int
+    """ The size of the file, the oldest batches are dropped once it is full """
+
+    replay_bytes_per_second: int
+    """ The rate at which the buffered batches are replayed to the collector """
+
+    retry_interval: float
+    """ The time in seconds between attempts to reach the collector while batches are buffered """
+
+
+@dataclass(frozen=True)
+class LeaseConfig:
+    """The leader election configuration of the active and standby replicas of the PLC service"""
+
+    name: str
+    """ The name of the kubernetes Lease the replicas elect the active replica with. The service runs without a standby if empty """
+
+    duration: float
+    """ The time in seconds after its last renewal the lease is taken over by the standby """
+
+    renew_deadline: float
+    """ The time in seconds the active replica keeps polling while it fails to renew the lease """
+
+    retry_interval: float
+    """ The time in seconds between the attempts to acquire or renew the lease """
+
+
+@dataclass(frozen=True)
+class OutboxConfig:
+    """The durable events outbox configuration"""
+
+    directory: str
+    """ The directory of the write-ahead log. The outbox is disabled if empty """
+
+    segment_bytes: int
+    """ The size in bytes after which a new segment file is started """
+
+    max_bytes: int
+    """ The maximum disk usage in bytes, the oldest segments are dropped beyond this limit """
+
+    fsync_interval_ms: int
+    """ The maximum time in milliseconds an appended record may wait before it is fsync'd """
+
+    fsync_batch: int
+    """ The number of appended records after which the segment is fsync'd immediately """
+
+    batch_size: int
+    """ The maximum number of records drained to Kafka before the offset is checkpointed """
+
+
 @dataclass(frozen=True)
 class Config:
     """The configuration for the service"""
@@ -163,6 +411,27 @@ class Config:
     kafka: KafkaConfig
     """ The Kafka configurations """
 
+    outbox: OutboxConfig
+    """ The durable events outbox configurations """
+
+    telemetry: TelemetryConfig
+    """ The Kafka telemetry stream configurations """
+
+    commands: CommandsConfig
+    """ The Kafka write commands configurations """
+
+    writes: WritesConfig
+    """ The write coalescing configurations """
+
+    history: HistoryConfig
+    """ The in-memory time-series history configurations """
+
+    spool: SpoolConfig
+    """ The store-and-forward configurations of the OTLP metric exports """
+
+    lease: LeaseConfig
+    """ The leader election configurations of the active and standby replicas """
+
     plc: PLC
     """ The PLC CR configurations """
 
@@ -1,22 +1,173 @@
+import os
+import signal
+import logging
+import threading
+
 from services.plc import PLC
-from services.flask import HttpServer
+from services.flask import HttpServer, reload as reload_api
 from services.events import EventsConsumer
+from services.telemetry import TelemetryPublisher
+from services.commands import CommandsConsumer
+from services.writer import WriteBehind
+from services.gateway import GatewayServer, WorkerPool, create_table
+from services.watcher import SpecWatcher
+from services.standby import Standby
+from config import config
+from utilities.specdiff import diff_specs
+
+logger = logging.getLogger()
 
 plc = None
 http_server = None
 events = None
+telemetry = None
+commands = None
+writer = None
+workers = None
+gateway = None
+watcher = None
+standby = None
 
 def start():
     """ starts the flask server and the PLC servient """
-    global http_server, plc, events
+    global http_server, plc, events, telemetry, commands, writer, workers, gateway, watcher, standby
+
+    # fork the http workers before any thread is started, the workers serve the api from separate processes
+    if config.flask.workers > 0:
+        workers = WorkerPool(create_table())
+        workers.start()
 
     events = EventsConsumer()
     events.start()
 
-    # start the flask server
-    http_server = HttpServer()
-    http_server.start()
+    # stream the sampled telemetry to kafka if a topic is configured
+    if config.telemetry.topic:
+        telemetry = TelemetryPublisher()
+        telemetry.start()
+
+    # start the flask server, unless the api is served by the http workers
+    if workers is None:
+        http_server = HttpServer()
+        http_server.start()
 
     # start monitoring all properties of the PLC
     plc = PLC()
 
+    # publish the values to the http workers and serve their reads and writes
+    if workers is not None:
+        plc.table = workers.table
+        gateway = GatewayServer(workers.address, workers.authkey)
+        gateway.start()
+
+    # poll once and connect the exporters right away, instead of waiting for the first export and readiness probe
+    threading.Thread(target=warm_up, daemon=True, name='warm_up').start()
+
+    # coalesce the writes to debounced properties
+    writer = WriteBehind()
+    if writer.debounce_times:
+        writer.start()
+    else:
+        writer = None
+
+    # apply the write commands from kafka if a topic is configured, a standby joins the consumer group once it is active
+    if config.commands.topic:
+        commands = CommandsConsumer()
+        if plc.active.is_set():
+            commands.start()
+
+    # apply the changes of the spec file without a restart
+    if config.plc.spec_file:
+        watcher = SpecWatcher()
+        watcher.start()
+
+    # elect the active replica if the PLC runs with a standby
+    if config.lease.name:
+        standby = Standby()
+        standby.start()
+
+
+def warm_up():
+    """ Takes the first sample of every property and creates the opentelemetry client if the PLC is reachable """
+    try:
+        plc.poll()
+        plc.check_readiness()
+    except:
+        logger.exception(f'failed to warm up the plc {config.plc.name}')
+
+
+def promote():
+    """ Makes the replica active once it holds the lease, it starts polling and applying the write commands """
+    logger.info(f'{config.k8s.pod_name} is the active replica of plc {config.plc.name}')
+    plc.active.set()
+    standby.label('active')
+    if commands is not None and commands.ident is None:
+        commands.start()
+
+
+def demote():
+    """
+    Stops polling once the replica lost the lease, the standby takes over once the lease expires.
+    The service is restarted to rejoin as the standby
+    """
+    logger.warning(f'{config.k8s.pod_name} lost the lease of plc {config.plc.name}, restarting as the standby')
+    plc.active.clear()
+    os.kill(os.getpid(), signal.SIGTERM)
+
+
+def reload(spec: dict) -> bool:
+    """
+    Applies a changed spec of the PLC to the running services, without reconnecting to the PLC.
+    Only the properties that were added, removed or changed are rescheduled.
+    Returns False if the change can not be applied in place and the service has to be restarted
+    """
+    global writer
+
+    diff = diff_specs(config.plc.spec, spec)
+    if not diff:
+        return True
+
+    # the value table shared with the http workers is sized for the properties the workers were forked with
+    if diff.restart or workers is not None:
+        return False
+
+    # the properties are replaced as a whole, so a reader iterating over them never sees a partial spec
+    config.plc.spec['properties'] = spec['properties']
+    logger.info(f'reloading the spec: {len(diff.added)} added, {len(diff.removed)} removed and {len(diff.changed)} changed properties')
+
+    plc.reload(diff)
+    reload_api()
+    if telemetry is not None:
+        telemetry.reload()
+
+    if writer is not None:
+        writer.reload()
+    elif config.plc.get_debounce_times(default=config.writes.debounce_ms / 1E3):
+        writer = WriteBehind()
+        writer.start()
+    return True
+
+
+
+def stop():
+    """ gracefully stops the services, in-flight requests and pending writes are completed first """
+    if http_server is not None:
+        http_server.stop()
+
+    if workers is not None:
+        workers.stop()
+        gateway.stop()
+
+    for service in (watcher, writer, commands, telemetry, events):
+        if service is not None and service.ident is not None:
+            service.stop()
+            service.join(timeout=config.flask.shutdown_timeout)
+
+    if plc is not None:
+        if plc.opentelemetry_client is not None:
+            plc.opentelemetry_client.shutdown()
+        plc.modbus_client.close()
+
+    # release the lease once the PLC is no longer touched, so the standby takes over without waiting for it to expire
+    if standby is not None:
+        standby.stop()
+        standby.join(timeout=config.flask.shutdown_timeout)
@@ -0,0 +1,178 @@
+import time
+import logging
+import threading
+
+import clients.events as events
+from clients.brokers import connect
+import services
+from config import config
+from services.plc import is_write_successful
+from utilities.commands import collapse
+
+logger = logging.getLogger()
+
+
+class CommandsConsumer(threading.Thread):
+    """
+    Consumes write commands for this PLC from the kafka commands topic.
+
+    A command is a cloudevent whose data names the target PLC and one or more writes:
+        {
+            "context": { "id": "...", "type": "plc.write.command", ... },
+            "data": { "plc": "hvdp", "writes": [{ "property": "setpoint", "value": 12 }] }
+        }
+    a single write may also be given as data.property and data.value.
+
+    The commands received in a poll window are batched, writes superseded by a later write to the same property are collapsed,
+    and the remaining writes are applied in a single modbus session. Every applied write emits a plc.write.event
+    that carries the id of the command as correlation id.
+
+    The delivery is at least once, up to max_attempts per batch: the offsets are only committed once every write of the batch
+    was applied. If a write fails or the batch can not be processed, the partitions are rewound to the start of the batch
+    and it is redelivered, the writes that were applied are skipped as the PLC already holds their value. A batch that still
+    fails after max_attempts is logged, counted as failed and committed, so a command the PLC rejects does not block the topic.
+    """
+
+    def __init__(self):
+        super().__init__(daemon=True, name='commands_consumer')
+
+        self.consumer = None
+        """ The kafka consumer, connected in the background """
+        self.attempts = 0
+        """ The number of times the current batch failed """
+        self.stop_event = threading.Event()
+
+
+    def stop(self):
+        self.stop_event.set()
+
+
+    def run(self):
+        # kafka is imported and bootstrapped on this thread, the polling starts without waiting for the brokers
+        from kafka import KafkaConsumer
+
+        logger.info(f'initializing kafka commands consumer at {config.kafka.brokers}')
+        self.consumer = connect(
+            factory = lambda: KafkaConsumer(
+                config.commands.topic,
+                bootstrap_servers=config.kafka.brokers,
+                group_id=config.commands.group_id,
+                enable_auto_commit=False,
+                auto_offset_reset='latest',
+            ),
+            name = 'commands consumer',
+            stop_event = self.stop_event,
+        )
+        if self.consumer is None:
+            return
+
+        try:
+            while not self.stop_event.is_set():
+                batch = {}
+                try:
+                    batch = self.poll()
+                    records = [record for partition in batch.values() for record in partition]
+                    if not records:
+                        continue
+
+                    if self.apply(self.collapse(records)):
+                        self.consumer.commit()
+                        self.attempts = 0
+                        continue
+                except:
+                    logger.exception('failed to process write commands from kafka')
+                    if not batch:
+                        self.stop_event.wait(1)
+                        continue
+
+                self.retry(batch)
+        finally:
+            self.consumer.close()
+
+
+    def poll(self) -> dict:
+        """ Returns the records received within the poll window by partition, up to max_records """
+        batch, count = {}, 0
+        deadline = time.monotonic() + config.commands.poll_window_ms / 1E3
+        while count < config.commands.max_records and not self.stop_event.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            polled = self.consumer.poll(timeout_ms=max(1, int(remaining * 1E3)), max_records=config.commands.max_records - count)
+            for partition, records in polled.items():
+                batch.setdefault(partition, []).extend(records)
+                count += len(records)
+        return batch
+
+
+    def retry(self, batch: dict):
+        """ Rewinds the partitions to the start of the failed batch, or commits it once it failed max_attempts times """
+        self.attempts += 1
+        if self.attempts >= config.commands.max_attempts:
+            count = sum(len(records) for records in batch.values())
+            logger.error(f'dropping a batch of {count} write commands that failed {self.attempts} times')
+            services.plc.record_write('failed')
+            self.attempts = 0
+            try:
+                self.consumer.commit()
+            except:
+                logger.exception('failed to commit the dropped write commands')
+            return
+
+        logger.warning(f'redelivering a batch of write commands (attempt {self.attempts + 1} of {config.commands.max_attempts})')
+        assignment = self.consumer.assignment()
+        for partition, records in batch.items():
+            # a partition revoked by a rebalance is redelivered from its committed offset to its new owner
+            if partition in assignment:
+                self.consumer.seek(partition, records[0].offset)
+        self.stop_event.wait(1)
+
+
+    def collapse(self, records: list) -> dict[str, tuple[int, str | None]]:
+        """
+        Returns the writes addressed to this PLC as { property: (value, correlation id) }.
+        Records are in offset order, so a later write to the same property supersedes an earlier one.
+        A malformed record or write is skipped, so it does not hold back the offsets of the valid writes of the batch
+        """
+        writes, coalesced = collapse(records, plc=config.plc.name, is_valid=self.is_valid)
+        for _ in range(coalesced):
+            services.plc.record_write('coalesced')
+        return writes
+
+
+    def is_valid(self, name: str, value) -> bool:
+        """ Returns True if the property exists, is writable and the value is an integer """
+        if name not in config.plc.spec['properties'] or type(value) is not int:
+            return False
+        return 'writeproperty' in config.plc.get_property_form(name)['op']
+
+
+    def apply(self, writes: dict[str, tuple[int, str | None]]) -> bool:
+        """
+        Applies the writes in a single modbus session and emits an audit event for each write that succeeded.
+        Returns False if any write failed
+        """
+        for name, (value, correlation_id) in list(writes.items()):
+            if services.plc.is_unchanged(name, value):
+                logger.info(f'skipping write command {correlation_id}: {name} already holds {value}')
+                services.plc.record_write('skipped')
+                del writes[name]
+
+        if not writes:
+            return True
+
+        results = services.plc.writeproperties({name: value for name, (value, _) in writes.items()})
+
+        succeeded = True
+        for name, result in results.items():
+            value, correlation_id = writes[name]
+            if not is_write_successful(result):
+                logger.error(f'failed to apply write command {correlation_id}: {name} => {value} ({result})')
+                succeeded = False
+                continue
+
+            logger.info(f'applied write command {correlation_id}: {name} => {value}')
+            services.plc.record_write('applied')
+            events.push_event(name, value, correlation_id=correlation_id)
+
+        return succeeded
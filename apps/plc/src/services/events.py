@@ -2,9 +2,9 @@ import threading
 import json
 import logging
 
-from kafka import KafkaProducer
-
 import clients.events as events
+from clients.brokers import connect
+from clients.outbox import Outbox
 from config import config
 
 class EventsConsumer(threading.Thread):
@@ -12,15 +12,8 @@ class EventsConsumer(threading.Thread):
 
     def __init__(self):
         super().__init__(daemon=True, name='events_consumer')
-
-        logging.info(f'initializing kafka producer at {config.kafka.brokers}')
-
-        self.producer = KafkaProducer(
-            bootstrap_servers=config.kafka.brokers,
-            max_block_ms=config.kafka.max_block_ms,
-            retries=config.kafka.retries,
-            acks='all',
-        )
+        self.producer = None
+        """ The kafka producer, connected in the background. The events are queued or kept in the outbox until it is """
         self.stop_event = threading.Event()
 
 
@@ -29,6 +22,28 @@ class EventsConsumer(threading.Thread):
 
 
     def run(self):
+        # kafka is imported and bootstrapped on this thread, the polling starts without waiting for the brokers
+        from kafka import KafkaProducer
+
+        logging.info(f'initializing kafka producer at {config.kafka.brokers}')
+        self.producer = connect(
+            factory = lambda: KafkaProducer(
+                bootstrap_servers=config.kafka.brokers,
+                max_block_ms=config.kafka.max_block_ms,
+                retries=config.kafka.retries,
+                acks='all',
+            ),
+            name = 'events producer',
+            stop_event = self.stop_event,
+        )
+        if self.producer is None:
+            return
+
+        outbox = events.get_outbox()
+        if outbox is not None:
+            self.drain(outbox)
+            return
+
         while not self.stop_event.is_set():
             try:
                 event = events.listen()
@@ -41,4 +56,36 @@ class EventsConsumer(threading.Thread):
                     future = self.producer.send(config.kafka.events_topic, cloudevent)
                     future.get()
             except:
-                logging.exception('failed to publish event to kafka')
\ No newline at end of file
+                logging.exception('failed to publish event to kafka')
+
+
+    def drain(self, outbox: Outbox):
+        """
+        Publishes the records of the durable outbox to kafka with at-least-once semantics.
+        Records are read from the last checkpointed offset, and the offset is only committed
+        once kafka has acknowledged every record of the batch.
+        After a restart, delivery resumes from the last acknowledged record.
+        """
+        logging.info(f'draining events outbox at {outbox.directory}, {outbox.lag()} records pending')
+
+        while not self.stop_event.is_set():
+            try:
+                records = outbox.read(max_records=config.outbox.batch_size, timeout=5)
+                if not records:
+                    continue
+
+                futures = [
+                    self.producer.send(config.kafka.events_topic, payload)
+                    for _, payload in records
+                ]
+                self.producer.flush()
+                for future in futures:
+                    future.get()
+            except:
+                logging.exception(f'failed to publish events from offset {outbox.committed} to kafka, retrying')
+                outbox.rewind()
+                self.stop_event.wait(1)
+                continue
+
+            outbox.commit(records[-1][0])
+            logging.info(f'published events {records[0][0]}..{records[-1][0]} to kafka')
@@ -1,28 +1,64 @@
 import logging
 import threading
 import json
+import time
 
 from flask import Flask, Response, request, jsonify
+from waitress.server import create_server
 from http import HTTPStatus
 
 import clients.events as events
 import clients.modbus_events as modbus_events
-from clients.opentelemetry import OpenTelemetryClient
 import services
 from config import config
-from utilities.ping import fast_ping
+from utilities.encoding import Schema, encode_snapshot
+from utilities.timeseries import downsample, lttb
+from utilities.prometheus import MetricsRenderer
+import utilities.stats as stats
 
 app = Flask(__name__)
 logger = logging.getLogger()
 
+_schema = Schema(list(config.plc.spec['properties'].keys()))
+""" The schema of the binary snapshots and telemetry frames, identified by the hash of the property names """
+
+SNAPSHOT_MIMETYPE = 'application/vnd.kube-plc.snapshot'
+
+_observable = set(config.plc.get_all_observable_properties())
+
+_metrics = MetricsRenderer(
+    plc = config.plc.name,
+    units = {name: property.get('unit', '') for name, property in config.plc.spec['properties'].items()},
+)
+""" Renders the cached samples in the Prometheus exposition format, only the series that changed are rebuilt """
+
+
+def reload():
+    """ Rebuilds the schema, the observed properties and the metrics renderer after a reload of the spec """
+    global _schema, _observable, _metrics
+    _schema = Schema(list(config.plc.spec['properties'].keys()))
+    _observable = set(config.plc.get_all_observable_properties())
+    _metrics = MetricsRenderer(
+        plc = config.plc.name,
+        units = {name: property.get('unit', '') for name, property in config.plc.spec['properties'].items()},
+    )
+
+
+_event_subscribers = threading.BoundedSemaphore(config.flask.max_event_subscribers)
+""" Bounds the number of concurrent event stream subscribers """
+
 
 class HttpServer(threading.Thread):
     """
     Creates a new flask HTTP server.
+    In production the app is served by waitress with a bounded pool of worker threads, keep-alive connections
+    and a graceful shutdown. All workers share the single in-process modbus client of the PLC servient.
     """
 
     def __init__(self):
         super().__init__(daemon=True, name='http_server')
+        self.server = None
+        self.stopping = False
 
 
     def run(self):
@@ -31,14 +67,46 @@ class HttpServer(threading.Thread):
         app.debug = False
 
         try:
-            app.run(
+            if config.flask.server == 'werkzeug':
+                app.run(
+                    host=config.flask.host,
+                    port=config.flask.port,
+                    threaded=True,
+                    debug=False
+                )
+                return
+
+            self.server = create_server(
+                app,
                 host=config.flask.host,
                 port=config.flask.port,
-                threaded=True,
-                debug=False
+                threads=config.flask.threads,
+                connection_limit=config.flask.connection_limit,
+                channel_timeout=config.flask.channel_timeout,
+                ident=config.plc.name,
             )
+            logger.info(f'serving on http://{config.flask.host}:{config.flask.port} with {config.flask.threads} threads')
+            self.server.run()
         except KeyboardInterrupt:
             logger.info('Flask got interrupt. Quitting.')
+        except OSError:
+            # the listening socket is closed on shutdown
+            if not self.stopping:
+                raise
+
+
+    def stop(self):
+        """
+        Stops accepting connections and waits for the in-flight requests to complete.
+        The werkzeug development server can not be stopped gracefully.
+        """
+        if self.server is None:
+            return
+
+        logger.info('shutting down the http server')
+        self.stopping = True
+        self.server.close()
+        self.server.task_dispatcher.shutdown(cancel_pending=False, timeout=config.flask.shutdown_timeout)
 
 
 @app.route("/livez")
@@ -63,28 +131,61 @@ def readiness():
     Current Otel pacakge handling of this is to raise an exception thats handled internally, this results in that metric reader never being called again
     """
 
-    if fast_ping(ip_address=config.plc.get_host()):
-        if services.plc.opentelemetry_client is None:
-            logger.info(f"Recreating opentelemetry client now that plc {config.plc.name} - {config.plc.get_host()} is reachable!")
-            services.plc.opentelemetry_client = OpenTelemetryClient()
-            services.plc.observeallproperties()
+    if services.plc.check_readiness():
         return Response('Service is ready!', status=HTTPStatus.OK)
 
-    # if the plc is not reachable, then the service is not ready and we will shutdown the opentelemtry provider
-    if services.plc.opentelemetry_client is not None:
-        logger.warning(f"Shutting down the opentelemetry client because the plc {config.plc.name} - {config.plc.get_host()} is unreachable!")
-        services.plc.opentelemetry_client.shutdown()
-        services.plc.opentelemetry_client = None
+    # if the plc is not reachable, then the service is not ready and the opentelemtry provider is shut down
     return Response('PLC connection is down, service is not ready!', status=HTTPStatus.SERVICE_UNAVAILABLE)
 
 
+@app.before_request
+def standby():
+    """
+    The standby replica does not touch the PLC, its reads and writes are rejected.
+    The service of the PLC routes to the active replica, this guards the requests sent to the pod directly
+    """
+    if config.lease.name and request.endpoint in ('read', 'write', 'form') and not services.plc.is_active():
+        return Response('The replica is the standby, the PLC is served by the active replica', status=HTTPStatus.SERVICE_UNAVAILABLE)
+
+
+@app.route("/metrics")
+def metrics() -> Response:
+    """
+    Prometheus scrape endpoint. Renders the last sample of every observable property, the uptime
+    and the modbus latency from memory, a scrape never reads from the PLC.
+    """
+    version, entries = services.plc.snapshot()
+    body = _metrics.render(
+        version = version,
+        entries = {name: sample for name, sample in entries.items() if name in _observable},
+        uptime = stats.uptime(),
+        latency = services.plc.get_latency(),
+        buckets = stats.LATENCY_BUCKETS,
+    )
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+
+@app.route("/api/stats", methods=["GET"])
+def get_stats() -> Response:
+    """
+    Returns a summary of the polling health of the PLC from memory: the poll cycle duration and overruns,
+    the modbus error rate and latency percentiles, the link budget and the event stream subscribers of this process and the events they dropped.
+    """
+    return jsonify({**services.plc.get_stats(), 'subscribers': modbus_events.subscribers(), 'dropped_events': modbus_events.dropped()}), HTTPStatus.OK
+
+
 @app.route("/api/events", methods=["GET"])
 def subevents():
     """
     Listen to the event stream of the observable properties
     as SSE (Server-Sent Events).
+    Each subscriber holds a worker thread for the lifetime of the stream, so the number of subscribers is bounded
+    to keep threads available for the other endpoints.
     """
 
+    if not _event_subscribers.acquire(blocking=False):
+        return Response("Too many event stream subscribers", status=HTTPStatus.SERVICE_UNAVAILABLE)
+
     def _events():
         thread_id = threading.current_thread().ident
         logger.info(f"Subscribing to events for thread {thread_id}")
@@ -105,7 +206,63 @@ def subevents():
             logger.info(f"Unsubscribing from events for thread {thread_id}")
             modbus_events.unsubscribe(thread_id)
 
-    return Response(_events(), mimetype='text/event-stream')
+    response = Response(_events(), mimetype='text/event-stream')
+    response.call_on_close(_event_subscribers.release)
+    return response
+
+
+@app.route("/api/telemetry/schema", methods=["GET"])
+def telemetry_schema() -> Response:
+    """
+    Endpoint to resolve the property indices of the frames streamed to the kafka telemetry topic.
+    """
+    if not config.telemetry.topic:
+        return Response("Telemetry stream is not enabled", status=HTTPStatus.NOT_FOUND)
+
+    return jsonify(_schema.to_dict()), HTTPStatus.OK
+
+
+@app.route("/api/plc/snapshot", methods=["GET"])
+def snapshot() -> Response:
+    """
+    Endpoint to get the last value and timestamp of every property, served from memory without touching the PLC.
+    The snapshot is JSON unless the binary encoding is requested with ?format=binary or the Accept header
+    application/vnd.kube-plc.snapshot, the properties of a binary snapshot are resolved through the schema
+    of the X-Schema-Hash header. An unchanged snapshot is answered with 304 if its ETag is sent in If-None-Match.
+    """
+    format = request.args.get('format')
+    if format is None:
+        format = 'binary' if request.accept_mimetypes.best == SNAPSHOT_MIMETYPE else 'json'
+    if format not in ('binary', 'json'):
+        return Response("Invalid format", status=HTTPStatus.BAD_REQUEST)
+
+    version, entries = services.plc.snapshot()
+    etag = f'{_schema.hash:016x}-{version:x}-{format}'
+    headers = {'ETag': f'"{etag}"', 'X-Schema-Hash': f'{_schema.hash:016x}', 'Vary': 'Accept'}
+
+    if etag in request.if_none_match:
+        return Response(status=HTTPStatus.NOT_MODIFIED, headers=headers)
+
+    if format == 'binary':
+        return Response(encode_snapshot(_schema, entries), mimetype=SNAPSHOT_MIMETYPE, headers=headers)
+
+    body = {name: {'value': value, 'timestamp': timestamp} for name, (value, timestamp) in entries.items()}
+    return Response(json.dumps(body), mimetype='application/json', headers=headers)
+
+
+@app.route("/api/plc/snapshot/schema", methods=["GET"])
+@app.route("/api/plc/snapshot/schema/<hash>", methods=["GET"])
+def snapshot_schema(hash: str | None = None) -> Response:
+    """
+    Endpoint to resolve the property indices of a binary snapshot. The schema is immutable for a given hash.
+    """
+    if hash is not None and hash != f'{_schema.hash:016x}':
+        return Response(f"Schema {hash} not found", status=HTTPStatus.NOT_FOUND)
+
+    response = jsonify(_schema.to_dict())
+    if hash is not None:
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
 
 
 @app.route("/api/plc/<property>", methods=["GET"])
@@ -124,7 +281,7 @@ def read(property: str) -> Response:
         return Response(f"Property {property} is not readable", status=HTTPStatus.METHOD_NOT_ALLOWED)
 
     # confirm that the PLC resource is available
-    if not services.plc.modbus_client.client.is_socket_open():
+    if not services.plc.is_connected():
         return Response(f"PLC resource is not available, service is not ready!", status=HTTPStatus.SERVICE_UNAVAILABLE)
 
     # if all checks pass, then attempt to read the property
@@ -140,6 +297,51 @@ def read(property: str) -> Response:
     return jsonify({ "value": value }), HTTPStatus.OK
 
 
+@app.route("/api/plc/<property>/history", methods=["GET"])
+def history(property: str) -> Response:
+    """
+    Endpoint to query the recent samples of an observed property from the in-memory history.
+    query parameters:
+        since        start of the range in unix seconds (default: the default window before until)
+        until        end of the range in unix seconds (default: now)
+        points       the maximum number of points to return, the series is downsampled if it has more samples
+        aggregation  'lttb' (default) or 'minmax' to return the min, max and avg of each bucket, applies if downsampled
+    """
+
+    if services.plc.history is None:
+        return Response("History is not enabled", status=HTTPStatus.NOT_FOUND)
+
+    # confirm that the property is observed
+    if property not in services.plc.history.series:
+        return Response(f"Property {property} is not observed", status=HTTPStatus.NOT_FOUND)
+
+    try:
+        until = float(request.args.get('until', time.time()))
+        since = float(request.args.get('since', until - config.history.default_window))
+        points = int(request.args['points']) if 'points' in request.args else None
+    except ValueError:
+        return Response("Invalid query parameters", status=HTTPStatus.BAD_REQUEST)
+
+    aggregation = request.args.get('aggregation', 'lttb')
+    if aggregation not in ('lttb', 'minmax') or (points is not None and points < 1):
+        return Response("Invalid query parameters", status=HTTPStatus.BAD_REQUEST)
+
+    # lttb always keeps the first and last samples and picks at least one in between
+    if aggregation == 'lttb' and points is not None and points < 3:
+        return Response("lttb needs at least 3 points", status=HTTPStatus.BAD_REQUEST)
+
+    timestamps, values = services.plc.history.query(property, since, until)
+
+    if points is None or len(timestamps) <= points:
+        return jsonify({'property': property, 'aggregation': 'raw', 'timestamps': timestamps, 'values': values}), HTTPStatus.OK
+
+    if aggregation == 'minmax':
+        return jsonify({'property': property, 'aggregation': aggregation, **downsample(timestamps, values, points)}), HTTPStatus.OK
+
+    timestamps, values = lttb(timestamps, values, points)
+    return jsonify({'property': property, 'aggregation': aggregation, 'timestamps': timestamps, 'values': values}), HTTPStatus.OK
+
+
 @app.route("/api/plc/<property>", methods=["PUT"])
 def write(property: str) -> Response:
     """
@@ -156,7 +358,7 @@ def write(property: str) -> Response:
         return Response(f"Property {property} is not writable", status=HTTPStatus.METHOD_NOT_ALLOWED)
 
     # confirm that the PLC resource is available
-    if not services.plc.modbus_client.client.is_socket_open():
+    if not services.plc.is_connected():
         return Response(f"PLC resource is not available, service is not ready!", status=HTTPStatus.SERVICE_UNAVAILABLE)
 
     # confirm that the request body is valid
@@ -166,6 +368,16 @@ def write(property: str) -> Response:
     if not request_dict or not type(request_dict.get("value")) is int:
         return Response("Invalid request body", status=HTTPStatus.BAD_REQUEST)
 
+    # coalesce the write with later writes to the property if it is debounced, the write is applied once the window closes
+    if services.writer is not None and services.writer.is_debounced(property):
+        coalesced = services.writer.submit(property, request_dict["value"])
+        return Response(f"Write to property {property} accepted{' (coalesced)' if coalesced else ''}", status=HTTPStatus.ACCEPTED)
+
+    # skip the write if the property already holds the value
+    if services.plc.is_unchanged(property, request_dict["value"]):
+        services.plc.record_write('skipped')
+        return Response(f"Property {property} already holds the value, write skipped", status=HTTPStatus.OK)
+
     # if all checks pass, then attempt to write value to the property
     result = services.plc.writeproperty(name=property, value=request_dict["value"])
 
@@ -180,6 +392,7 @@ def write(property: str) -> Response:
     if result.isError():
         return Response(f"Failed to write property {property}", status=HTTPStatus.INTERNAL_SERVER_ERROR)
 
+    services.plc.record_write('applied')
     events.push_event(property, request_dict["value"])
 
     # success
@@ -194,7 +407,7 @@ def form() -> Response:
     """
 
     # confirm that the PLC resource is available
-    if not services.plc.modbus_client.client.is_socket_open():
+    if not services.plc.is_connected():
         return Response(f"PLC resource is not available, service is not ready!", status=HTTPStatus.SERVICE_UNAVAILABLE)
 
     # confirm that the request body is valid
@@ -218,9 +431,9 @@ def form() -> Response:
     readings = None
     responses = None
     if 'readproperty' in op:
-        readings = services.plc.modbus_client.read(form)
+        readings = services.plc.readform(form)
     if 'writeproperty' in op:
-        responses = services.plc.modbus_client.write(form, value=form['value'])
+        responses = services.plc.writeform(form, value=form['value'])
 
     thread = threading.current_thread()
     logger.info(f"[{thread.name}] {form} => readings: {readings}, responses: {responses}")
@@ -0,0 +1,135 @@
+import os
+import signal
+import socket
+import logging
+import tempfile
+import threading
+import multiprocessing
+from multiprocessing.connection import Listener, Connection
+
+import clients.events as events
+import services
+from clients.gateway import to_remote
+from services.worker import serve
+from config import config
+from utilities.valuetable import ValueTable
+from utilities.modbus import parse_href
+
+logger = logging.getLogger()
+
+
+def create_table() -> ValueTable:
+    """ Creates the shared value table with a slot for every property of the PLC """
+    return ValueTable(
+        properties = sorted(config.plc.spec['properties'].keys()),
+        width = max(parse_href(property['forms'][0]['href'])[1] for property in config.plc.spec['properties'].values()),
+    )
+
+
+class GatewayServer(threading.Thread):
+    """
+    Serves the reads and writes of the http worker processes in the gateway process that owns the modbus connection.
+    Each worker thread holds a connection to the gateway, every connection is served by its own thread
+    so a slow modbus request of one worker does not hold up the others.
+    """
+
+    def __init__(self, address: str, authkey: bytes):
+        super().__init__(daemon=True, name='gateway_server')
+        self.address = address
+        if os.path.exists(address):
+            os.unlink(address)
+        self.listener = Listener(address, family='AF_UNIX', authkey=authkey)
+        self.stopping = False
+
+        self.handlers = {
+            'is_connected': lambda: services.plc.is_connected(),
+            'is_active': lambda: services.plc.is_active(),
+            'check_readiness': lambda: services.plc.check_readiness(),
+            'get_latency': lambda: services.plc.get_latency(),
+            'get_stats': lambda: services.plc.get_stats(),
+            'readproperty': lambda name: services.plc.readproperty(name),
+            'writeproperty': lambda name, value: to_remote(services.plc.writeproperty(name=name, value=value)),
+            'readform': lambda form: services.plc.readform(form),
+            'writeform': lambda form, value: to_remote(services.plc.writeform(form, value)),
+            'is_unchanged': lambda name, value: services.plc.is_unchanged(name, value),
+            'record_write': lambda outcome: services.plc.record_write(outcome),
+            'query_history': lambda name, since, until: services.plc.history.query(name, since, until),
+            'submit_write': lambda name, value: services.writer.submit(name, value),
+            'push_event': lambda *args: events.push_event(*args),
+        }
+        """ The methods the http workers can call """
+
+
+    def stop(self):
+        self.stopping = True
+        self.listener.close()
+
+
+    def run(self):
+        logger.info(f'serving the http workers at {self.address}')
+        while not self.stopping:
+            try:
+                connection = self.listener.accept()
+            except:
+                if not self.stopping:
+                    logger.exception('failed to accept a connection from an http worker')
+                continue
+            threading.Thread(target=self.serve, args=(connection,), daemon=True, name='gateway_connection').start()
+
+
+    def serve(self, connection: Connection):
+        with connection:
+            while True:
+                try:
+                    method, args = connection.recv()
+                except (EOFError, OSError):
+                    return
+
+                try:
+                    connection.send(('ok', self.handlers[method](*args)))
+                except:
+                    logger.exception(f'failed to serve {method} for an http worker')
+                    connection.send(('error', f'{method} failed'))
+
+
+class WorkerPool:
+    """
+    Serves the api from several http worker processes that accept connections on a single pre-bound socket.
+    The workers are forked before the gateway starts its threads, they do not open connections to the PLC
+    but read the latest values from the shared value table and forward reads and writes to the gateway.
+    """
+
+    def __init__(self, table: ValueTable):
+        self.table = table
+        self.address = os.path.join(tempfile.gettempdir(), f'plc-{config.plc.name}-gateway.sock')
+        self.authkey = os.urandom(32)
+        self.processes: list[multiprocessing.Process] = []
+
+        self.socket = socket.create_server((config.flask.host, config.flask.port), backlog=config.flask.connection_limit)
+        """ The listening socket is inherited by every worker, the kernel distributes the connections """
+
+
+    def start(self):
+        context = multiprocessing.get_context('fork')
+        for index in range(config.flask.workers):
+            process = context.Process(
+                target = serve,
+                args = (self.socket, self.table, self.address, self.authkey),
+                name = f'http_worker_{index}',
+                daemon = True,
+            )
+            process.start()
+            self.processes.append(process)
+        logger.info(f'started {len(self.processes)} http workers on port {config.flask.port}')
+
+
+    def stop(self):
+        """ Stops the workers, each worker completes its in-flight requests first """
+        for process in self.processes:
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+        for process in self.processes:
+            process.join(timeout=config.flask.shutdown_timeout)
+        self.socket.close()
+        self.table.close()
+        self.table.unlink()
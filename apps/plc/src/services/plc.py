@@ -1,15 +1,28 @@
 import logging
+import math
 import time
+import threading
 from collections.abc import Iterable, Callable
+from typing import TYPE_CHECKING
 
-from opentelemetry.sdk.metrics import Meter
 from opentelemetry.metrics import CallbackOptions, Observation, Histogram
 
 from config import config
 from clients.modbus import ModbusClient
-from clients.opentelemetry import OpenTelemetryClient
+
+if TYPE_CHECKING:
+    # the sdk and the exporters are imported once the PLC is reachable, see check_readiness
+    from opentelemetry.sdk.metrics import Meter
 import clients.modbus_events as modbus_events
 from utilities.time import profile
+from utilities.modbus import is_coil, parse_href
+from utilities.timeseries import History
+from utilities.deadband import ExceptionReporter
+from utilities.valuetable import ValueTable
+from utilities.ping import fast_ping
+from utilities.specdiff import SpecDiff
+import utilities.stats as stats
+from services.sampler import Sampler
 
 logger = logging.getLogger()
 
@@ -26,22 +39,128 @@ class PLC:
         """ Initialize the open telemetry client and the modbus client """
         self.modbus_client = ModbusClient()
         self.opentelemetry_client = None
+        self.readiness_lock = threading.Lock()
+        self.observed: set[tuple[str, float]] = set()
+        """ The properties that have a gauge and the export interval of the gauge """
+
+        self.active = threading.Event()
+        """ Set while the replica polls the PLC, a standby replica only polls once it holds the lease """
+        if not config.lease.name:
+            self.active.set()
+
+        self.values: dict[str, tuple[int | float | list, float]] = {}
+        """ The last value read or written of each property and the time it was recorded """
+        self.values_lock = threading.Lock()
+        self.version = 0
+        """ Incremented whenever a value is recorded, identifies a snapshot of the values """
+
+        self.history: History | None = History(
+            properties = config.plc.get_all_observable_properties(),
+            budget_bytes = config.history.memory_bytes,
+            samples_per_chunk = config.history.samples_per_chunk,
+        ) if config.history.memory_bytes else None
+        """ The compressed recent samples of the observed properties """
+
+        self.table: ValueTable | None = None
+        """ The shared memory table the latest values are published to when http workers run in separate processes """
+
+        self.reporters: dict[str, ExceptionReporter] = {
+            name: ExceptionReporter(deadband=deadband, heartbeat=heartbeat)
+            for name, (deadband, heartbeat) in config.plc.get_exception_reporting().items()
+        }
+        """ Suppresses the datapoints of the properties reported by exception until they change or their heartbeat is due """
+
+        self.sampler = Sampler(self)
+        """ Samples the properties that are sampled faster than they are exported or polled adaptively """
+        if self.sampler.is_sampling():
+            self.sampler.start()
 
 
     def observeallproperties(self):
         """ Observes all properties of the PLC device """
         for property in config.plc.get_all_observable_properties():
             self.observeproperty(property)
+        self.observepolling()
 
 
     def observeproperty(self, name: str):
-        """ Observes a single property of the PLC device """
+        """
+        Observes a single property of the PLC device.
+        A property has a single gauge per export interval, the gauge of a property that was removed
+        or moved to another export interval by a reload of the spec does not export it anymore
+        """
+        interval = config.plc.get_export_interval(name)
+        if (name, interval) in self.observed:
+            return
+        self.observed.add((name, interval))
+
         property: dict = config.plc.get_property(name)
-        meter: Meter = self.opentelemetry_client.get_meter(polling_time=property['forms'][0]['modbus:pollingTime'])
+        meter: Meter = self.opentelemetry_client.get_meter(polling_time=interval)
         meter.create_observable_gauge(
             name = name,
             unit = property.get('unit', ''),
-            callbacks = [self.get_observable_callback(name)]
+            callbacks = [self.get_property_callback(name, interval)]
+        )
+
+
+    def get_property_callback(self, name: str, interval: float) -> Callable[[CallbackOptions], Iterable[Observation]]:
+        """ Function for acquiring the callback of the gauge of a property, which reads the property or exports its aggregated samples """
+        observable_callback = self.get_observable_callback(name)
+        aggregate_callback = self.get_aggregate_callback(name)
+
+        def property_callback(options: CallbackOptions) -> Iterable[Observation]:
+            if not self.active.is_set():
+                return []
+            property = config.plc.spec['properties'].get(name)
+            if property is None or 'observeproperty' not in property['forms'][0]['op'] or config.plc.get_export_interval(name) != interval:
+                return []
+            if name in self.sampler.windows:
+                return aggregate_callback(options)
+            return observable_callback(options)
+
+        return property_callback
+
+
+    def observepolling(self):
+        """ Observes the effective interval and achieved rate of the sampled and adaptive properties and the link budget they use """
+        meter: Meter = self.opentelemetry_client.get_meter(polling_time=max(config.plc.get_polling_times()))
+
+        def interval_callback(options: CallbackOptions) -> Iterable[Observation]:
+            return [
+                Observation(value=self.sampler.effective_interval(name), attributes={'property': name})
+                for name in self.sampler.windows
+            ]
+
+        def rate_callback(options: CallbackOptions) -> Iterable[Observation]:
+            return [
+                Observation(value=rate, attributes={'property': name})
+                for name, rate in self.sampler.rates().items()
+            ]
+
+        def budget_callback(options: CallbackOptions) -> Iterable[Observation]:
+            observations = [Observation(value=self.sampler.budget(), attributes={'budget': 'used'})]
+            if config.modbus_client.max_transactions_per_second > 0:
+                observations.append(Observation(value=config.modbus_client.max_transactions_per_second, attributes={'budget': 'limit'}))
+            return observations
+
+        # the gauges export nothing while no property is sampled, a reload of the spec may start sampling
+        meter.create_observable_gauge(
+            name = f'{config.plc.name}.polling.interval',
+            unit = 's',
+            description = f'The interval the sampled and adaptive properties of the {config.plc.name} plc are read at',
+            callbacks = [interval_callback]
+        )
+        meter.create_observable_gauge(
+            name = f'{config.plc.name}.sampling.rate',
+            unit = '1/s',
+            description = f'The achieved samples per second of the sampled and adaptive properties of the {config.plc.name} plc',
+            callbacks = [rate_callback]
+        )
+        meter.create_observable_gauge(
+            name = f'{config.plc.name}.modbus.budget',
+            unit = '1/s',
+            description = f'The modbus transactions per second the {config.plc.name} plc properties are scheduled for (used) and the cap (limit)',
+            callbacks = [budget_callback]
         )
 
 
@@ -50,9 +169,13 @@ class PLC:
         def readproperty_callback(options: CallbackOptions) -> Iterable[Observation]:
             """ Callback function for reading a property """
 
+            start = time.monotonic()
             value = self.readproperty(name)
+            stats.cycles.record(config.plc.get_export_interval(name), start, time.monotonic())
+            self.publish(name, value, time.time())
 
-            modbus_events.publish_event(name, value, time.time())
+            if not self.is_reported(name, value):
+                return []
 
             return [
                 Observation(
@@ -63,18 +186,261 @@ class PLC:
 
         return readproperty_callback
 
+
+    def get_aggregate_callback(self, name: str) -> Callable[[CallbackOptions], Iterable[Observation]]:
+        """ Function for acquiring a callback to export the aggregated samples of a sampled property as an observable gauge """
+        def aggregate_callback(options: CallbackOptions) -> Iterable[Observation]:
+            """ Callback function for exporting the min, max, mean and last sample of the window """
+            # the window is replaced when a reload of the spec changes the property
+            window = self.sampler.windows.get(name)
+            aggregates = window.drain() if window is not None else None
+            if aggregates is None:
+                return []
+
+            extremes = (aggregates['min'], aggregates['max']) if 'min' in aggregates else None
+            if not self.is_reported(name, aggregates['last'], extremes):
+                return []
+
+            return [
+                Observation(
+                    value = aggregates[aggregation],
+                    attributes = {'aggregation': aggregation}
+                )
+                for aggregation in ('min', 'max', 'mean', 'last')
+                if aggregation in aggregates
+            ]
+
+        return aggregate_callback
+
+
+    def reload(self, diff: SpecDiff):
+        """
+        Applies the properties added, removed or changed by a reload of the spec.
+        The state of the unchanged properties is kept and the modbus connection to the PLC is not touched
+        """
+        stale = diff.removed | diff.changed
+        fresh = diff.added | diff.changed
+        observable = fresh & set(config.plc.get_all_observable_properties())
+
+        reporting = config.plc.get_exception_reporting()
+        for name in stale:
+            self.reporters.pop(name, None)
+        for name in fresh & reporting.keys():
+            deadband, heartbeat = reporting[name]
+            self.reporters[name] = ExceptionReporter(deadband=deadband, heartbeat=heartbeat)
+
+        with self.values_lock:
+            for name in stale:
+                self.values.pop(name, None)
+            self.version += 1
+
+        if self.history is not None:
+            for name in stale:
+                self.history.remove(name)
+            for name in observable:
+                self.history.add(name)
+
+        self.modbus_client.multi_unit = len(config.plc.get_unit_ids()) > 1
+        self.sampler.reload(diff.changed)
+
+        if self.opentelemetry_client is not None:
+            for name in observable:
+                self.observeproperty(name)
+
+
+    def poll(self):
+        """
+        Reads every observed property once and publishes the samples, without waiting for the first export.
+        The service polls once on start, so the api, the history and the event subscribers have values right away
+        """
+        if not self.active.is_set():
+            return
+
+        start = time.monotonic()
+        for name in config.plc.get_all_observable_properties():
+            try:
+                value = self.readproperty(name)
+                if value is not None:
+                    self.publish(name, value, time.time())
+            except:
+                logger.exception(f'failed to poll {name}')
+        logger.info(f'polled the plc {config.plc.name} in {(time.monotonic() - start) * 1E3:.0f} ms')
+
+
+    def is_reported(self, name: str, value, extremes: tuple | None = None) -> bool:
+        """ Returns True if the datapoint of the property is exported, and counts it as emitted or suppressed """
+        reporter = self.reporters.get(name)
+        reported = reporter is None or reporter.should_report(value, time.monotonic(), extremes)
+
+        if self.opentelemetry_client is not None:
+            self.opentelemetry_client.datapoints.add(1, attributes={"outcome": "emitted" if reported else "suppressed"})
+        return reported
+
+
+    def publish(self, name: str, value, timestamp: float):
+        """ Publishes a sample of a property to the event subscribers, the history and the shared value table """
+        modbus_events.publish_event(name, value, timestamp)
+
+        if self.table is not None:
+            self.table.write(name, value, timestamp)
+
+        if self.history is not None:
+            self.history.append(name, value, timestamp)
+
+    def is_active(self) -> bool:
+        """ Returns True if the replica polls and writes to the PLC, False while it is the standby """
+        return self.active.is_set()
+
+
+    def is_connected(self) -> bool:
+        """ Returns True if the modbus connection to the PLC device is open """
+        return self.modbus_client.client.is_socket_open()
+
+
+    def check_readiness(self) -> bool:
+        """
+        Returns True if the PLC device is reachable.
+        The opentelemetry client is shut down while the PLC is unreachable and recreated once it is reachable again
+        """
+        # the probes and the warm up of the service check the readiness concurrently, only one of them creates the client
+        with self.readiness_lock:
+            if fast_ping(ip_address=config.plc.get_host()):
+                if self.opentelemetry_client is None:
+                    from clients.opentelemetry import OpenTelemetryClient
+                    logger.info(f"Recreating opentelemetry client now that plc {config.plc.name} - {config.plc.get_host()} is reachable!")
+                    self.opentelemetry_client = OpenTelemetryClient()
+                    self.observed = set()
+                    self.observeallproperties()
+                return True
+
+            if self.opentelemetry_client is not None:
+                logger.warning(f"Shutting down the opentelemetry client because the plc {config.plc.name} - {config.plc.get_host()} is unreachable!")
+                self.opentelemetry_client.shutdown()
+                self.opentelemetry_client = None
+            return False
+
+
+    def readform(self, form: dict):
+        """ Reads the registers of an arbitrary form """
+        return self.modbus_client.read(form)
+
+
+    def writeform(self, form: dict, value: int):
+        """ Writes the value to the registers of an arbitrary form """
+        return self.modbus_client.write(form, value=value)
+
+
     @profile()
     def writeproperty(self, name: str, value: int):
         """ Writes a property value to the PLC resource """
-        return self.modbus_client.write(
+        result = self.modbus_client.write(
             form = config.plc.get_property_form(name),
             value = value
         )
+        stats.outcomes.record(error=not is_write_successful(result))
+        if is_write_successful(result):
+            self.remember(name, self.expected_reading(name, value))
+        return result
+
+
+    @profile()
+    def writeproperties(self, values: dict[str, int]) -> dict:
+        """ Writes a batch of property values to the PLC resource in a single modbus session """
+        responses = self.modbus_client.write_many([
+            (config.plc.get_property_form(name), value)
+            for name, value in values.items()
+        ])
+        for name, response in zip(values.keys(), responses):
+            stats.outcomes.record(error=not is_write_successful(response))
+            if is_write_successful(response):
+                self.remember(name, self.expected_reading(name, values[name]))
+        return dict(zip(values.keys(), responses))
 
 
     @profile()
     def readproperty(self, name: str):
         """ Reads a property value on the PLC resource """
-        return self.modbus_client.read(
+        value = self.modbus_client.read(
             form = config.plc.get_property_form(name)
         )
+        stats.outcomes.record(error=value is None)
+        if value is not None:
+            self.remember(name, value)
+        return value
+
+
+    def remember(self, name: str, value: int | float | list):
+        """ Records the value the property is known to hold """
+        with self.values_lock:
+            self.values[name] = (value, time.time())
+            self.version += 1
+
+
+    def snapshot(self) -> tuple[int, dict[str, tuple[int | float | list, float]]]:
+        """ Returns the version and a copy of the last value and timestamp of every property, without touching the PLC """
+        with self.values_lock:
+            return self.version, dict(self.values)
+
+
+    def get_latency(self) -> dict[str, tuple[list[int], float, int]]:
+        """ Returns the cumulative latency histogram of the modbus requests by function name """
+        return stats.latency.snapshot()
+
+
+    def get_stats(self) -> dict:
+        """ Returns a summary of the poll cycles, the modbus requests and their latency, and the link budget """
+        return {
+            'uptime': stats.uptime(),
+            'cycles': stats.cycles.summary(),
+            'modbus': {
+                **stats.outcomes.summary(),
+                'p50_ms': stats.latency.quantile(0.5),
+                'p99_ms': stats.latency.quantile(0.99),
+            },
+            'budget': {
+                'used': self.sampler.budget(),
+                'limit': config.modbus_client.max_transactions_per_second or None,
+            },
+        }
+
+
+    def expected_reading(self, name: str, value: int) -> int | float | list:
+        """ Returns the value a read of the property yields after the value was written """
+        form: dict = config.plc.get_property_form(name)
+        reading = value if is_coil(form['modbus:entity']) else value * form.get('scale', 1)
+        _, quantity = parse_href(form['href'])
+        return reading if quantity == 1 else [reading] * quantity
+
+
+    def is_unchanged(self, name: str, value: int) -> bool:
+        """
+        Returns True if the property was read or written recently and already holds the value.
+        Always False if compare-before-write is disabled.
+        """
+        max_age = config.writes.compare_max_age_ms / 1E3
+        if max_age <= 0:
+            return False
+
+        with self.values_lock:
+            current, timestamp = self.values.get(name, (None, 0))
+        if current is None or time.time() - timestamp > max_age:
+            return False
+
+        expected = self.expected_reading(name, value)
+        if isinstance(expected, list):
+            return isinstance(current, list) and len(current) == len(expected) and all(map(math.isclose, current, expected))
+        return not isinstance(current, list) and math.isclose(current, expected)
+
+
+    def record_write(self, outcome: str):
+        """ Counts a write request by its outcome (applied, skipped, coalesced or failed) """
+        if self.opentelemetry_client is not None:
+            self.opentelemetry_client.writes.add(1, attributes={"outcome": outcome})
+
+
+def is_write_successful(result) -> bool:
+    """ Returns True if the modbus response(s) of a write report no error """
+    if result is None:
+        return False
+    results = result if type(result) is list else [result]
+    return all(r is not None and not r.isError() for r in results)
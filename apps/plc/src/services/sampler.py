@@ -0,0 +1,234 @@
+import time
+import heapq
+import logging
+import threading
+
+from config import config
+from utilities.window import Window
+from utilities.modbus import parse_href
+from utilities.adaptive import AdaptiveInterval, fit_to_budget
+import utilities.stats as stats
+
+logger = logging.getLogger()
+
+
+class Sampler(threading.Thread):
+    """
+    Samples the properties that declare a modbus:samplingTime shorter than their modbus:pollingTime,
+    the properties polled faster than the minimum export interval, and the properties that are polled adaptively (modbus:adaptive).
+    The samples are aggregated into a window per property which the observable gauge drains on every export,
+    so short transients are captured without multiplying the exported datapoints.
+    Sampling is scheduled against the monotonic clock and only runs while the PLC is reachable,
+    the delay of every sample against its schedule is recorded as jitter.
+
+    The interval of an adaptive property shrinks while its value changes and grows while it is stable,
+    and all adaptive intervals are stretched when they would exceed the transactions per second left on the link.
+    """
+
+    def __init__(self, plc):
+        super().__init__(daemon=True, name='sampler')
+        self.plc = plc
+        self.adaptive = {}
+        self.windows = {}
+        self.samples = {}
+        self.measured = time.monotonic()
+        self.samples_lock = threading.Lock()
+
+        self.scale = 1.0
+        """ The factor the adaptive intervals are stretched by to fit the link budget """
+
+        self.configure()
+
+        self.changed: set[str] = set()
+        """ The properties changed by the reloads of the spec the sampling thread has not applied yet """
+        self.reload_lock = threading.Lock()
+        self.stale = threading.Event()
+        self.wakeup = threading.Event()
+        self.stop_event = threading.Event()
+
+
+    def configure(self, changed: frozenset[str] = frozenset()):
+        """
+        Derives the sampled properties and their intervals from the spec.
+        The interval controller and the aggregation window of a property that did not change are kept
+        """
+        sampling_times: dict[str, float] = config.plc.get_sampling_times()
+        reporting = config.plc.get_exception_reporting()
+
+        self.sampling_times: dict[str, float] = sampling_times
+        """ The sampling time in seconds of each sampled property """
+
+        self.adaptive: dict[str, AdaptiveInterval] = {
+            name: self.adaptive[name]
+            if name in self.adaptive and name not in changed else
+            AdaptiveInterval(minimum, maximum, tolerance=reporting.get(name, (0, None))[0])
+            for name, (minimum, maximum) in config.plc.get_adaptive_polling().items()
+            if name not in sampling_times
+        }
+        """ The interval controller of each adaptively polled property """
+
+        self.costs: dict[str, int] = {
+            name: parse_href(config.plc.get_property_form(name)['href'])[1]
+            for name in config.plc.get_all_observable_properties()
+        }
+        """ The modbus transactions of a single read of each observed property """
+
+        self.fixed_rate: float = sum(
+            self.costs[name] / sampling_times.get(name, float(config.plc.get_property_form(name)['modbus:pollingTime']))
+            for name in self.costs
+            if name not in self.adaptive
+        )
+        """ The transactions per second of the properties polled or sampled at a fixed rate """
+
+        self.windows: dict[str, Window] = {
+            name: self.windows[name] if name in self.windows and name not in changed else Window()
+            for name in (*sampling_times, *self.adaptive)
+        }
+        """ The aggregation window of each sampled property """
+
+        with self.samples_lock:
+            self.samples: dict[str, int] = {name: self.samples.get(name, 0) for name in self.windows}
+            """ The number of samples taken of each property since the achieved rates were last measured """
+
+
+    def reload(self, changed: frozenset[str]):
+        """
+        Applies a reloaded spec. The running sampling thread applies it between two samples,
+        so the schedule is only ever touched by the thread. The thread is started if sampling begins with the reload
+        """
+        if self.ident is None:
+            self.configure(changed)
+            if self.is_sampling():
+                self.start()
+            return
+
+        with self.reload_lock:
+            self.changed |= changed
+        self.stale.set()
+        self.wakeup.set()
+
+
+    def stop(self):
+        self.stop_event.set()
+        self.wakeup.set()
+
+
+    def is_sampling(self) -> bool:
+        """ Returns True if any property is sampled or polled adaptively """
+        return bool(self.windows)
+
+
+    def effective_interval(self, name: str) -> float:
+        """ Returns the interval in seconds the property is currently read at """
+        if name in self.adaptive:
+            controller = self.adaptive[name]
+            return min(controller.maximum, controller.interval * self.scale)
+        return self.sampling_times[name]
+
+
+    def budget(self) -> float:
+        """ Returns the transactions per second the sampled, adaptive and polled properties currently demand """
+        return self.fixed_rate + sum(
+            self.costs[name] / self.effective_interval(name)
+            for name in self.adaptive
+        )
+
+
+    def run(self):
+        schedule = self.reschedule([], frozenset())
+
+        while not self.stop_event.is_set():
+            if self.stale.is_set():
+                self.stale.clear()
+                with self.reload_lock:
+                    changed, self.changed = frozenset(self.changed), set()
+                self.configure(changed)
+                schedule = self.reschedule(schedule, changed)
+                logger.info(f'rescheduled {len(schedule)} sampled properties after a reload of the spec')
+
+            if not schedule:
+                self.wakeup.wait()
+                self.wakeup.clear()
+                continue
+
+            due, name = schedule[0]
+            delay = due - time.monotonic()
+            if delay > 0:
+                self.wakeup.wait(delay)
+                self.wakeup.clear()
+                continue
+
+            # the PLC is unreachable while the opentelemetry client is shut down by the readiness probe,
+            # a standby replica does not sample until it is active
+            if self.plc.opentelemetry_client is None or not self.plc.active.is_set():
+                heapq.heapreplace(schedule, (self.next_due(due, self.effective_interval(name)), name))
+                continue
+
+            self.record_jitter(name, time.monotonic() - due)
+
+            value = None
+            try:
+                value = self.plc.readproperty(name)
+                self.windows[name].add(value)
+                self.plc.publish(name, value, time.time())
+            except:
+                logger.exception(f'failed to sample {name}')
+
+            if name in self.adaptive:
+                self.adapt(name, value)
+                heapq.heapreplace(schedule, (time.monotonic() + self.effective_interval(name), name))
+            else:
+                heapq.heapreplace(schedule, (self.next_due(due, self.sampling_times[name]), name))
+
+
+    def reschedule(self, schedule: list[tuple[float, str]], changed: frozenset[str]) -> list[tuple[float, str]]:
+        """ Returns the schedule of the sampled properties, the unchanged properties keep their deadline and the others are due now """
+        now = time.monotonic()
+        deadlines = {name: due for due, name in schedule if name not in changed}
+        schedule = [(deadlines.get(name, now), name) for name in self.windows]
+        heapq.heapify(schedule)
+        return schedule
+
+
+    def record_jitter(self, name: str, lateness: float):
+        """ Counts the sample and records how late it was started against its schedule, a sample late by more than its interval is an overrun """
+        with self.samples_lock:
+            self.samples[name] += 1
+
+        if lateness > self.effective_interval(name):
+            stats.cycles.overrun()
+
+        if self.plc.opentelemetry_client is not None:
+            self.plc.opentelemetry_client.jitter.record(lateness * 1E3, attributes={'property': name})
+
+
+    def rates(self) -> dict[str, float]:
+        """ Returns the achieved samples per second of each property since the rates were last measured """
+        with self.samples_lock:
+            now = time.monotonic()
+            elapsed = max(now - self.measured, 1E-9)
+            rates = {name: count / elapsed for name, count in self.samples.items()}
+            self.samples = dict.fromkeys(self.samples, 0)
+            self.measured = now
+        return rates
+
+
+    def adapt(self, name: str, value):
+        """ Adapts the interval of the property to the sample and stretches the adaptive intervals to the link budget """
+        self.adaptive[name].update(value)
+        self.scale = fit_to_budget(
+            intervals = {name: controller.interval for name, controller in self.adaptive.items()},
+            costs = self.costs,
+            fixed_rate = self.fixed_rate,
+            capacity = config.modbus_client.max_transactions_per_second,
+        )
+
+
+    @staticmethod
+    def next_due(due: float, interval: float) -> float:
+        """ Returns the next deadline on the grid of the interval, skipping the deadlines that were missed """
+        now = time.monotonic()
+        due += interval
+        if due < now:
+            due += ((now - due) // interval + 1) * interval
+        return due
@@ -0,0 +1,56 @@
+import logging
+import threading
+
+import services
+from config import config
+from clients.kubernetes import KubernetesClient, KubernetesLease
+from utilities.election import LeaderElector
+
+logger = logging.getLogger()
+
+ROLE_LABEL = 'plc.foreveroceans.io/role'
+""" The label of the pod of the active replica, the service of the PLC only selects the active replica """
+
+
+class Standby(threading.Thread):
+    """
+    Runs the leader election between the active and the standby replica of the PLC service.
+    Both replicas start all services, so the standby is warm: its modules are imported, its spec is compiled and
+    its exporters and kafka producers are connected. Only the replica holding the lease polls and writes to the PLC,
+    it labels its pod as active so the service of the PLC routes to it.
+    """
+
+    def __init__(self):
+        super().__init__(daemon=True, name='standby')
+        self.stop_event = threading.Event()
+        # a request must not take longer than a retry, so a slow api server does not push a renewal past its deadline
+        self.client = KubernetesClient(timeout=config.lease.retry_interval)
+        self.elector = LeaderElector(
+            lease = KubernetesLease(self.client, namespace=config.k8s.namespace, name=config.lease.name),
+            identity = config.k8s.pod_name,
+            duration = config.lease.duration,
+            renew_deadline = config.lease.renew_deadline,
+            retry_interval = config.lease.retry_interval,
+            on_started_leading = services.promote,
+            on_stopped_leading = services.demote,
+        )
+
+
+    def stop(self):
+        """ Stops the election, the lease is released if this replica is active so the standby takes over right away """
+        self.stop_event.set()
+
+
+    def label(self, role: str):
+        """ Labels the pod with its role, a failure is logged as the role of the replica is decided by the lease """
+        try:
+            self.client.label_pod(config.k8s.namespace, config.k8s.pod_name, {ROLE_LABEL: role})
+        except:
+            logger.exception(f'failed to label the pod {config.k8s.pod_name} as {role}')
+
+
+    def run(self):
+        # the pod keeps the label of a container that was active before it restarted
+        self.label('standby')
+        logger.info(f'{config.k8s.pod_name} is standing by for the lease {config.lease.name}')
+        self.elector.run(self.stop_event)
@@ -0,0 +1,141 @@
+import time
+import logging
+import threading
+
+import clients.modbus_events as modbus_events
+from clients.brokers import connect
+from config import config
+from utilities.encoding import Schema, encode_frame
+
+logger = logging.getLogger()
+
+
+class TelemetryPublisher(threading.Thread):
+    """
+    Streams the sampled telemetry to kafka.
+    The publisher subscribes to the samples published by the observable callbacks and batches them per polling cycle,
+    so every polling group of the PLC produces a single record per tick in a compact binary encoding.
+    """
+
+    def __init__(self):
+        super().__init__(daemon=True, name='telemetry_publisher')
+
+        self.producer = None
+        """ The kafka producer, connected in the background """
+        self.stop_event = threading.Event()
+
+        self.stale = threading.Event()
+        """ Set by a reload of the spec, the publisher rebuilds its schema and polling groups before the next sample """
+        self.batches: dict[float, tuple[float, dict]] = {}
+        """ The open batch of each polling group as (timestamp of the first sample, samples by property name) """
+
+        self.configure()
+
+
+    def configure(self):
+        """ Derives the schema and the polling groups of the frames from the spec """
+        self.schema = Schema(list(config.plc.spec['properties'].keys()))
+        """ The schema that maps the property names to their index in a frame """
+
+        self.groups: dict[str, float] = {
+            name: config.plc.get_property_form(name)['modbus:pollingTime']
+            for name in config.plc.get_all_observable_properties()
+        }
+        self.groups.update(config.plc.get_sampling_times())
+        """ The polling group (polling or sampling time) of each observable property """
+
+        self.group_sizes: dict[float, int] = {}
+        for polling_time in self.groups.values():
+            self.group_sizes[polling_time] = self.group_sizes.get(polling_time, 0) + 1
+
+
+    def reload(self):
+        """ Applies a reloaded spec, the open batches are published with the schema they were recorded with """
+        self.stale.set()
+
+
+    def stop(self):
+        self.stop_event.set()
+
+
+    def run(self):
+        # kafka is imported and bootstrapped on this thread, the polling starts without waiting for the brokers
+        from kafka import KafkaProducer
+
+        logger.info(f'initializing kafka telemetry producer at {config.kafka.brokers}')
+        self.producer = connect(
+            factory = lambda: KafkaProducer(
+                bootstrap_servers=config.kafka.brokers,
+                max_block_ms=config.kafka.max_block_ms,
+                retries=config.kafka.retries,
+                linger_ms=config.telemetry.linger_ms,
+                batch_size=config.telemetry.batch_size,
+                compression_type=config.telemetry.compression_type,
+                acks=1,
+            ),
+            name = 'telemetry producer',
+            stop_event = self.stop_event,
+        )
+        if self.producer is None:
+            return
+
+        thread_id = threading.current_thread().ident
+        linger = config.telemetry.linger_ms / 1E3
+        try:
+            while not self.stop_event.is_set():
+                if self.stale.is_set():
+                    self.stale.clear()
+                    for polling_time in list(self.batches):
+                        self.publish(polling_time)
+                    self.configure()
+
+                # buffer two cycles of every polling group, the oldest samples are dropped while kafka blocks a send
+                event = modbus_events.subscribe(thread_id, timeout=linger, maxsize=max(100, 2 * len(self.groups)))
+                if event is not None:
+                    self.record(*event)
+                self.flush_stale(linger)
+        finally:
+            modbus_events.unsubscribe(thread_id)
+            self.producer.flush()
+
+
+    def record(self, name: str, value, timestamp: float):
+        """ Adds the sample to the batch of its polling group, the batch is published once the cycle is complete """
+        polling_time = self.groups.get(name)
+        if polling_time is None:
+            return
+
+        # a second sample of the same property means the previous cycle is over
+        if polling_time in self.batches and name in self.batches[polling_time][1]:
+            self.publish(polling_time)
+
+        _, samples = self.batches.setdefault(polling_time, (timestamp, {}))
+        samples[name] = value
+
+        if len(samples) == self.group_sizes[polling_time]:
+            self.publish(polling_time)
+
+
+    def flush_stale(self, linger: float):
+        """ Publishes the batches of cycles that did not complete, e.g. because the collection was interrupted """
+        now = time.time()
+        for polling_time, (started, _) in list(self.batches.items()):
+            if now - started > max(linger, polling_time / 2):
+                self.publish(polling_time)
+
+
+    def publish(self, polling_time: float):
+        """ Encodes the batch of the polling group into a single frame and sends it to the telemetry topic """
+        timestamp, samples = self.batches.pop(polling_time)
+        try:
+            self.producer.send(
+                config.telemetry.topic,
+                key=bytes(config.plc.name, 'utf-8'),
+                value=encode_frame(self.schema, timestamp, samples),
+                headers=[
+                    ('content-type', b'application/vnd.kube-plc.telemetry'),
+                    ('schema', bytes(f'{self.schema.hash:016x}', 'utf-8')),
+                ],
+            )
+        except:
+            logger.exception(f'failed to publish telemetry of polling group {polling_time}s to kafka')
@@ -0,0 +1,53 @@
+import os
+import signal
+import hashlib
+import logging
+import threading
+
+import services
+from config import config
+from utilities.config import load_spec
+
+logger = logging.getLogger()
+
+
+class SpecWatcher(threading.Thread):
+    """
+    Watches the spec file of the PLC and applies the changes to its properties without restarting the service.
+    A ConfigMap volume is updated by swapping a symlink to a new directory, so the content of the file is compared
+    on every check rather than relying on file events. A change that can not be applied in place
+    (e.g. the base URI of the device) stops the service, kubernetes (or the shard of the PLC) restarts it with the new spec.
+    """
+
+    def __init__(self):
+        super().__init__(daemon=True, name='spec_watcher')
+        self.digest: str | None = None
+        """ The sha256 of the content of the spec file when it was last checked """
+        self.stop_event = threading.Event()
+
+
+    def stop(self):
+        self.stop_event.set()
+
+
+    def run(self):
+        while not self.stop_event.wait(config.plc.reload_interval):
+            try:
+                self.check()
+            except:
+                logger.exception(f'failed to reload the spec from {config.plc.spec_file}')
+
+
+    def check(self):
+        """ Reloads the spec if the content of the file changed """
+        with open(config.plc.spec_file, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        if digest == self.digest:
+            return
+
+        self.digest = digest
+        # the spec file of a shard changes with the spec of any of its PLCs, an unchanged spec is not reloaded
+        spec = load_spec(config.plc.spec_file, name=config.plc.name if config.plc.sharded else None)
+        if not services.reload(spec):
+            logger.warning('the spec changed outside of the properties, restarting the service to apply it')
+            os.kill(os.getpid(), signal.SIGTERM)
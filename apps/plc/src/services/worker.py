@@ -0,0 +1,86 @@
+import signal
+import socket
+import logging
+import threading
+
+from waitress.server import create_server
+
+import clients.events as events
+import clients.modbus_events as modbus_events
+import services
+from clients.gateway import GatewayClient, RemotePLC, RemoteWriter
+from services.flask import app
+from config import config
+from utilities.valuetable import ValueTable
+
+logger = logging.getLogger()
+
+
+class TableWatcher(threading.Thread):
+    """
+    Publishes the values the gateway writes to the shared value table to the event subscribers of the http worker,
+    so the event stream of a worker is served without a round trip to the gateway.
+    """
+
+    def __init__(self, table: ValueTable, interval: float = 0.05):
+        super().__init__(daemon=True, name='table_watcher')
+        self.table = table
+        self.interval = interval
+        self.sequences = {name: table.sequence(name) for name in table.properties}
+        self.stop_event = threading.Event()
+
+
+    def stop(self):
+        self.stop_event.set()
+
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            for name, sequence in self.sequences.items():
+                if self.table.sequence(name) == sequence:
+                    continue
+
+                entry = self.table.read(name)
+                if entry is not None:
+                    value, timestamp, self.sequences[name] = entry
+                    modbus_events.publish_event(name, value, timestamp)
+
+
+def serve(sock: socket.socket, table: ValueTable, address: str, authkey: bytes):
+    """
+    The entrypoint of an http worker process.
+    The worker serves the api on the socket bound by the gateway and forwards the PLC operations to the gateway.
+    """
+    client = GatewayClient(address, authkey)
+    services.plc = RemotePLC(client, table)
+    debounce_times = config.plc.get_debounce_times(default=config.writes.debounce_ms / 1E3)
+    services.writer = RemoteWriter(client, debounce_times) if debounce_times else None
+
+    # the audit events of the writes are published by the gateway
+    events.set_forwarder(lambda *args: client.call('push_event', *args))
+
+    watcher = TableWatcher(table)
+    watcher.start()
+
+    server = create_server(
+        app,
+        sockets=[sock],
+        threads=config.flask.threads,
+        connection_limit=config.flask.connection_limit,
+        channel_timeout=config.flask.channel_timeout,
+        ident=config.plc.name,
+    )
+
+    def shutdown(signum, frame):
+        server.close()
+        server.task_dispatcher.shutdown(cancel_pending=False, timeout=config.flask.shutdown_timeout)
+
+    signal.signal(signal.SIGTERM, shutdown)
+
+    try:
+        server.run()
+    except OSError:
+        # the listening socket is closed on shutdown
+        pass
+    finally:
+        watcher.stop()
@@ -0,0 +1,120 @@
+import time
+import logging
+import threading
+
+import clients.events as events
+import services
+from config import config
+from services.plc import is_write_successful
+
+logger = logging.getLogger()
+
+
+class WriteBehind(threading.Thread):
+    """
+    Coalesces the writes to a property within its debounce window.
+    The first write to a property opens the window, later writes within the window only replace the pending value,
+    so a burst of writes (e.g a slider on an HMI) results in a single modbus write of the last value.
+    The window is not extended by later writes, which bounds the delay of a write to the debounce time.
+    """
+
+    def __init__(self):
+        super().__init__(daemon=True, name='write_behind')
+
+        self.debounce_times: dict[str, float] = config.plc.get_debounce_times(default=config.writes.debounce_ms / 1E3)
+        """ The debounce window in seconds of each property that coalesces its writes """
+
+        self.pending: dict[str, tuple[int, float]] = {}
+        """ The pending value of each property and the time at which it is due to be written """
+
+        self.condition = threading.Condition()
+        self.stop_event = threading.Event()
+
+
+    def stop(self):
+        self.stop_event.set()
+        with self.condition:
+            self.condition.notify()
+
+
+    def reload(self):
+        """
+        Applies the debounce times of a reloaded spec. The pending writes of the properties that are no longer debounced
+        are written right away, the pending writes of the removed properties are dropped
+        """
+        with self.condition:
+            self.debounce_times = config.plc.get_debounce_times(default=config.writes.debounce_ms / 1E3)
+            for name, (value, due) in list(self.pending.items()):
+                if name not in config.plc.spec['properties']:
+                    logger.warning(f'dropping the pending write {name} => {value}, the property was removed from the spec')
+                    del self.pending[name]
+                elif name not in self.debounce_times:
+                    self.pending[name] = (value, time.monotonic())
+            self.condition.notify()
+
+
+    def is_debounced(self, name: str) -> bool:
+        """ Returns True if the writes to the property are coalesced """
+        return name in self.debounce_times
+
+
+    def submit(self, name: str, value: int) -> bool:
+        """
+        Queues the value to be written once the debounce window of the property closes.
+        Returns True if the value superseded a pending write.
+        """
+        with self.condition:
+            coalesced = name in self.pending
+            due = self.pending[name][1] if coalesced else time.monotonic() + self.debounce_times[name]
+            self.pending[name] = (value, due)
+            self.condition.notify()
+
+        if coalesced:
+            services.plc.record_write('coalesced')
+        return coalesced
+
+
+    def run(self):
+        while not self.stop_event.is_set():
+            with self.condition:
+                now = time.monotonic()
+                ready = [name for name, (_, due) in self.pending.items() if due <= now]
+                if not ready:
+                    timeout = min((due for _, due in self.pending.values()), default=now + 1) - now
+                    self.condition.wait(timeout)
+                    continue
+                writes = [(name, self.pending.pop(name)[0]) for name in ready]
+
+            self.apply_all(writes)
+
+        # write the pending values without waiting for their window on shutdown
+        with self.condition:
+            writes = [(name, value) for name, (value, _) in self.pending.items()]
+            self.pending.clear()
+        self.apply_all(writes)
+
+
+    def apply_all(self, writes: list[tuple[str, int]]):
+        """ Applies the writes in order """
+        for name, value in writes:
+            try:
+                self.apply(name, value)
+            except:
+                logger.exception(f'failed to write {value} to {name}')
+
+
+    def apply(self, name: str, value: int):
+        """ Writes the value unless the property already holds it, the audit event reflects the applied value """
+        if services.plc.is_unchanged(name, value):
+            logger.info(f'skipping write of {name} => {value}, the property already holds the value')
+            services.plc.record_write('skipped')
+            return
+
+        result = services.plc.writeproperty(name=name, value=value)
+        if not is_write_successful(result):
+            logger.error(f'failed to write {name} => {value} ({result})')
+            return
+
+        logger.info(f'applied coalesced write {name} => {value}')
+        services.plc.record_write('applied')
+        events.push_event(name, value)
@@ -0,0 +1,158 @@
+import gc
+import sys
+import hashlib
+import time
+import signal
+import logging
+import importlib
+import threading
+import multiprocessing
+
+import config
+from utilities.config import load_spec
+from utilities.specdiff import diff_shard
+
+logger = logging.getLogger()
+
+PRELOAD = (
+    'flask',
+    'waitress.server',
+    'pymodbus.client',
+    'opentelemetry.sdk.metrics',
+    'opentelemetry.sdk.metrics.export',
+    'opentelemetry.exporter.otlp.proto.grpc.metric_exporter',
+    'kafka',
+)
+""" The dependencies of the services, imported once by the shard and shared copy-on-write by the processes of its PLCs """
+
+
+def preload():
+    """ Imports the dependencies of the services before the processes of the PLCs are forked """
+    for module in PRELOAD:
+        importlib.import_module(module)
+
+    # move the preloaded objects out of the generations the garbage collector scans,
+    # so a PLC process does not write to (and copy) the pages it shares with the shard
+    gc.freeze()
+
+
+def serve(name: str, spec: dict, port: int):
+    """
+    The entrypoint of the process of a PLC in the shard.
+    The process runs the services of a single PLC, with its own modbus client, polling and api on the port of the PLC.
+    """
+    # the handler of the shard is inherited by a restarted process
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    config.initialize(name=name, spec=spec, port=port)
+
+    import services
+    services.start()
+
+    def shutdown(signum, frame):
+        services.stop()
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, shutdown)
+
+    while True:
+        time.sleep(100)
+
+
+class Shard:
+    """
+    Hosts many PLCs in a single pod, with a process per PLC.
+    The services bind the configuration of a single PLC when they are imported, so the shard preloads their
+    dependencies and forks a process per PLC that initializes the configuration of its PLC before importing them.
+    Each PLC still runs its own services (threads, api, kafka producer, opentelemetry exporter), the shard only shares
+    the pod and the pages of the interpreter and the preloaded dependencies, see benchmarks/memory.py.
+    A PLC process that exits is restarted.
+    The specs of a shard read from a file (the mounted ConfigMap of the shard) are reloaded: the processes of the PLCs
+    added, removed or moved to another port are started or stopped, the other PLCs reload their own spec in place.
+    """
+
+    def __init__(self, specs: dict[str, dict], specs_file: str = '', reload_interval: float = 5.0):
+        self.specs = specs
+        """ The port and spec of each PLC of the shard by name """
+        self.specs_file = specs_file
+        """ The json file the specs were loaded from, the file is checked for PLCs added, removed or moved every reload interval """
+        self.reload_interval = reload_interval
+        self.digest: str | None = None
+        """ The sha256 of the content of the specs file when it was last checked """
+        self.processes: dict[str, multiprocessing.Process] = {}
+        self.context = multiprocessing.get_context('fork')
+        self.stop_event = threading.Event()
+
+
+    def start(self):
+        preload()
+        for name in sorted(self.specs):
+            self.spawn(name)
+        logger.info(f'started {len(self.processes)} plcs in the shard')
+
+
+    def spawn(self, name: str):
+        process = self.context.Process(
+            target = serve,
+            args = (name, self.specs[name]['spec'], self.specs[name]['port']),
+            name = f'plc_{name}',
+            daemon = False,
+        )
+        process.start()
+        self.processes[name] = process
+
+
+    def supervise(self, interval: float = 1.0):
+        """ Restarts the PLC processes that exited and reloads the specs of the shard until the shard is stopped """
+        reloaded = time.monotonic()
+        while not self.stop_event.wait(interval):
+            if self.specs_file and time.monotonic() - reloaded >= self.reload_interval:
+                reloaded = time.monotonic()
+                try:
+                    self.reload()
+                except:
+                    logger.exception(f'failed to reload the specs of the shard from {self.specs_file}')
+
+            for name, process in list(self.processes.items()):
+                if not process.is_alive():
+                    logger.warning(f'the process of plc {name} exited with {process.exitcode}, restarting it')
+                    self.spawn(name)
+
+
+    def reload(self):
+        """ Starts and stops the processes of the PLCs added, removed or moved to another port if the content of the specs file changed """
+        with open(self.specs_file, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        if digest == self.digest:
+            return
+
+        specs = load_spec(self.specs_file)
+        diff = diff_shard(self.specs, specs)
+        self.digest = digest
+        # a PLC restarted by the supervisor, e.g. after a change of its spec that can not be applied in place, starts with its latest spec
+        self.specs = specs
+        if not diff:
+            return
+
+        logger.info(f'reloading the specs of the shard: {len(diff.added)} added, {len(diff.removed)} removed and {len(diff.moved)} moved plcs')
+        for name in diff.removed | diff.moved:
+            self.terminate(name)
+        for name in sorted(diff.added | diff.moved):
+            self.spawn(name)
+
+
+    def terminate(self, name: str, timeout: float = 10.0):
+        """ Stops the process of a PLC, the PLC stops its services gracefully """
+        process = self.processes.pop(name)
+        if process.is_alive():
+            process.terminate()
+        process.join(timeout=timeout)
+
+
+    def stop(self, timeout: float = 10.0):
+        """ Stops the PLC processes, each PLC stops its services gracefully """
+        self.stop_event.set()
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+        for process in self.processes.values():
+            process.join(timeout=timeout)
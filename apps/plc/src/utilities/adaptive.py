@@ -0,0 +1,58 @@
+class AdaptiveInterval:
+    """
+    Adapts the polling interval of a property to its rate of change.
+    The interval is halved whenever a sample moved more than the tolerance away from the previous sample,
+    and grows by half while the samples are stable, bounded by the minimum and maximum interval.
+    """
+
+    def __init__(self, minimum: float, maximum: float, tolerance: float = 0, backoff: float = 1.5):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.tolerance = tolerance
+        """ The change between two samples that is considered stable """
+
+        self.backoff = backoff
+        """ The factor the interval grows by after a stable sample """
+
+        self.interval = minimum
+        """ The interval in seconds the property is polled at, before it is stretched to fit the link budget """
+
+        self.previous = None
+
+
+    def update(self, value) -> float:
+        """ Adapts the interval to the sample and returns the new interval, failed reads (None) keep the interval """
+        if value is None:
+            return self.interval
+
+        if self.previous is not None:
+            if self.has_changed(value):
+                self.interval = max(self.minimum, self.interval / 2)
+            else:
+                self.interval = min(self.maximum, self.interval * self.backoff)
+
+        self.previous = value
+        return self.interval
+
+
+    def has_changed(self, value) -> bool:
+        if isinstance(value, list) or isinstance(self.previous, list):
+            if not isinstance(value, list) or not isinstance(self.previous, list) or len(value) != len(self.previous):
+                return True
+            return any(abs(v - p) > self.tolerance for v, p in zip(value, self.previous))
+        return abs(value - self.previous) > self.tolerance
+
+
+def fit_to_budget(intervals: dict[str, float], costs: dict[str, int], fixed_rate: float, capacity: float) -> float:
+    """
+    Returns the factor (>= 1) the adaptive intervals have to be stretched by so the transactions per second
+    of the adaptive properties fit in the capacity of the link that is left by the fixed-rate properties.
+    The costs are the modbus transactions of a single read of each property. A capacity of 0 is unlimited.
+    """
+    if capacity <= 0:
+        return 1.0
+
+    demand = sum(costs[name] / interval for name, interval in intervals.items())
+    # the adaptive properties keep a minimal share of the link even if the fixed-rate properties exceed the capacity
+    available = max(capacity - fixed_rate, capacity * 0.1)
+    return max(1.0, demand / available)
@@ -0,0 +1,66 @@
+import json
+import logging
+from collections.abc import Callable, Iterable
+
+logger = logging.getLogger()
+
+
+def parse_command(payload: bytes) -> tuple[str | None, str | None, list]:
+    """
+    Returns the target PLC, the correlation id and the writes of a write command, a write is a dict of a property and a value.
+    Raises ValueError if the command is not a cloudevent whose data is an object with a list of writes
+    """
+    try:
+        command = json.loads(payload)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f'not json: {e}')
+    if not isinstance(command, dict):
+        raise ValueError('not an object')
+
+    context = command.get('context', {})
+    data = command.get('data', {})
+    if not isinstance(context, dict) or not isinstance(data, dict):
+        raise ValueError('context and data must be objects')
+
+    writes = data.get('writes', [data])
+    if not isinstance(writes, list):
+        raise ValueError('writes must be a list')
+    return data.get('plc'), context.get('id'), writes
+
+
+def collapse(records: Iterable, plc: str, is_valid: Callable[[str, int], bool]) -> tuple[dict[str, tuple[int, str | None]], int]:
+    """
+    Returns the writes of the records addressed to the PLC as { property: (value, correlation id) } and the number of writes
+    superseded by a later write to the same property. Records are in offset order and have an offset and a value.
+    A malformed record or write is logged and skipped, the other writes of the batch are kept
+    """
+    writes: dict[str, tuple[int, str | None]] = {}
+    coalesced = 0
+    for record in records:
+        try:
+            target, correlation_id, entries = parse_command(record.value)
+        except ValueError as e:
+            logger.warning(f'skipping malformed write command at offset {record.offset} ({e}): {record.value}')
+            continue
+
+        if target != plc:
+            continue
+
+        for write in entries:
+            if not isinstance(write, dict) or not isinstance(write.get('property'), str):
+                logger.warning(f'skipping malformed write of command {correlation_id}: {write}')
+                continue
+
+            name, value = write['property'], write.get('value')
+            if not is_valid(name, value):
+                logger.warning(f'skipping invalid write command {correlation_id}: {write}')
+                continue
+
+            if name in writes:
+                logger.info(f'write {writes[name][1]} to {name} superseded by {correlation_id}')
+                coalesced += 1
+                # re-insert so the write is applied in the order of the latest command
+                del writes[name]
+            writes[name] = (value, correlation_id)
+
+    return writes, coalesced
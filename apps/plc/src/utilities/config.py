@@ -19,4 +19,14 @@ def load_schema(file: str) -> dict:
     Loads the json schema as a dictionary
     """
     with open(file, 'r') as f:
-        return json.load(f)
\ No newline at end of file
+        return json.load(f)
+
+
+def load_spec(file: str, name: str | None = None) -> dict:
+    """
+    Loads the spec of a PLC from a json file, e.g. the spec.json key of a ConfigMap mounted as a volume.
+    The file of a shard holds the port and spec of each of its PLCs by name, the spec of the named PLC is returned
+    """
+    with open(file, 'r') as f:
+        spec = json.load(f)
+    return spec[name]['spec'] if name is not None else spec
@@ -0,0 +1,51 @@
+from typing import List
+
+
+class ExceptionReporter:
+    """
+    Decides whether a sample of a property is reported (report-by-exception).
+    A sample is reported when it moves outside the deadband around the last reported value,
+    or when the heartbeat interval elapsed since the last report, so a quiet property still proves it is alive.
+    """
+
+    def __init__(self, deadband: float, heartbeat: float | None):
+        self.deadband = deadband
+        """ The absolute change from the last reported value that has to be exceeded to report a sample """
+
+        self.heartbeat = heartbeat
+        """ The maximum time in seconds between two reports, None to only report on change """
+
+        self.reported: float | List[float] | None = None
+        self.reported_at: float | None = None
+
+
+    def should_report(self, value: 'float | List[float] | None', now: float, extremes: tuple[float, float] | None = None) -> bool:
+        """
+        Returns True if the sample must be reported and records it as the last reported value.
+        The extremes (min, max) of an aggregated window are also compared against the deadband,
+        so a transient within the window is reported even if the window ended where it started.
+        """
+        if value is None:
+            return False
+
+        if self.reported is None or self.is_heartbeat_due(now) or self.is_outside_deadband(value, extremes):
+            self.reported, self.reported_at = value, now
+            return True
+
+        return False
+
+
+    def is_heartbeat_due(self, now: float) -> bool:
+        return self.heartbeat is not None and now - self.reported_at >= self.heartbeat
+
+
+    def is_outside_deadband(self, value: 'float | List[float]', extremes: tuple[float, float] | None) -> bool:
+        if isinstance(value, list) or isinstance(self.reported, list):
+            if not isinstance(value, list) or not isinstance(self.reported, list) or len(value) != len(self.reported):
+                return True
+            return any(abs(v - r) > self.deadband for v, r in zip(value, self.reported))
+
+        candidates = (value, *extremes) if extremes else (value,)
+        if self.deadband == 0:
+            return any(candidate != self.reported for candidate in candidates)
+        return any(abs(candidate - self.reported) > self.deadband for candidate in candidates)
@@ -0,0 +1,181 @@
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+from collections.abc import Callable
+
+logger = logging.getLogger()
+
+
+def microtime() -> str:
+    """ Returns the current time in the MicroTime format of the kubernetes api """
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+class MemoryLease:
+    """
+    A lease held in memory with the optimistic concurrency of a kubernetes Lease,
+    an update of a stale version is rejected. Used to run the election within a single process
+    """
+
+    def __init__(self):
+        self.record: dict | None = None
+        self.version = 0
+        self.lock = threading.Lock()
+
+
+    def get(self) -> tuple[dict, str] | None:
+        with self.lock:
+            return None if self.record is None else (dict(self.record), str(self.version))
+
+
+    def create(self, record: dict) -> bool:
+        with self.lock:
+            if self.record is not None:
+                return False
+            self.record, self.version = dict(record), 1
+            return True
+
+
+    def update(self, record: dict, version: str) -> bool:
+        with self.lock:
+            if str(self.version) != version:
+                return False
+            self.record, self.version = dict(record), self.version + 1
+            return True
+
+
+class LeaderElector:
+    """
+    Elects a single leader among the replicas of a PLC service through a lease, as the kubernetes client-go leader election.
+
+    The leader renews the lease every retry interval. A candidate takes the lease over once its record did not change for
+    the lease duration, measured on the clock of the candidate so the clocks of the replicas do not have to agree.
+    The leader stops leading once it failed to renew the lease for the renew deadline, which is shorter than the
+    lease duration, so it has stopped before any candidate can take over and there is never more than one leader.
+    A leader that stops gracefully releases the lease and a candidate takes over on its next retry.
+    """
+
+    def __init__(
+        self,
+        lease,
+        identity: str,
+        duration: float = 15.0,
+        renew_deadline: float = 10.0,
+        retry_interval: float = 2.0,
+        on_started_leading: Callable[[], None] | None = None,
+        on_stopped_leading: Callable[[], None] | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        # a leader notices a failed renewal up to a retry interval late and the renewal itself may take up to a retry interval
+        if renew_deadline + 2 * retry_interval >= duration:
+            raise ValueError('the renew deadline and two retry intervals must add up to less than the lease duration')
+
+        self.lease = lease
+        """ The lease backend, which gets, creates and updates the lease record with optimistic concurrency """
+        self.identity = identity
+        self.duration = duration
+        self.renew_deadline = renew_deadline
+        self.retry_interval = retry_interval
+        self.on_started_leading = on_started_leading
+        self.on_stopped_leading = on_stopped_leading
+        self.clock = clock
+
+        self.observed: dict | None = None
+        """ The lease record last observed """
+        self.observed_time = 0.0
+        """ The time on the local clock the observed record was first seen """
+        self.leading = False
+
+
+    def is_leader(self) -> bool:
+        return self.leading
+
+
+    def observe(self, record: dict):
+        if record != self.observed:
+            self.observed = record
+            self.observed_time = self.clock()
+
+
+    def try_acquire_or_renew(self) -> bool:
+        """ Acquires or renews the lease, returns True if the candidate holds the lease """
+        now = microtime()
+        current = self.lease.get()
+
+        if current is None:
+            record = {
+                'holderIdentity': self.identity,
+                'leaseDurationSeconds': int(self.duration),
+                'acquireTime': now,
+                'renewTime': now,
+                'leaseTransitions': 0,
+            }
+            if not self.lease.create(record):
+                return False
+            self.observe(record)
+            return True
+
+        record, version = current
+        self.observe(record)
+        holder = record.get('holderIdentity')
+        if holder and holder != self.identity and self.clock() < self.observed_time + self.duration:
+            return False
+
+        renewed = {**record, 'holderIdentity': self.identity, 'leaseDurationSeconds': int(self.duration), 'renewTime': now}
+        if holder != self.identity:
+            renewed.update(acquireTime=now, leaseTransitions=record.get('leaseTransitions', 0) + 1)
+        if not self.lease.update(renewed, version):
+            return False
+        self.observe(renewed)
+        return True
+
+
+    def release(self):
+        """ Gives up the lease so a candidate takes over without waiting for it to expire """
+        current = self.lease.get()
+        if current is None or current[0].get('holderIdentity') != self.identity:
+            return
+        record, version = current
+        self.lease.update({**record, 'holderIdentity': '', 'leaseDurationSeconds': 1, 'renewTime': microtime()}, version)
+
+
+    def attempt(self) -> bool:
+        """ Tries to acquire or renew the lease, an error of the backend counts as a failed attempt """
+        try:
+            return self.try_acquire_or_renew()
+        except:
+            logger.exception(f'failed to acquire or renew the lease as {self.identity}')
+            return False
+
+
+    def run(self, stop_event: threading.Event):
+        """ Campaigns for the lease until acquired, then leads until the lease is lost or the stop event is set """
+        while not self.attempt():
+            if stop_event.wait(self.retry_interval):
+                return
+
+        logger.info(f'{self.identity} acquired the lease and started leading')
+        self.leading = True
+        if self.on_started_leading is not None:
+            self.on_started_leading()
+
+        renewed = self.clock()
+        while not stop_event.wait(self.retry_interval):
+            if self.attempt():
+                renewed = self.clock()
+            elif self.clock() - renewed > self.renew_deadline or self.observed.get('holderIdentity') != self.identity:
+                # the lease was not renewed in time or another replica holds it
+                break
+
+        self.leading = False
+        if stop_event.is_set():
+            try:
+                self.release()
+            except:
+                logger.exception(f'failed to release the lease as {self.identity}')
+            return
+
+        logger.warning(f'{self.identity} failed to renew the lease for {self.renew_deadline}s and stopped leading')
+        if self.on_stopped_leading is not None:
+            self.on_stopped_leading()
@@ -0,0 +1,158 @@
+import struct
+import hashlib
+from typing import List
+
+MAGIC = b'PT'
+""" Identifies a packed telemetry frame """
+
+VERSION = 1
+""" The version of the frame layout """
+
+_FRAME_HEADER = struct.Struct('>2sBQdH')
+""" magic, version, schema hash (uint64), timestamp in seconds (float64), number of entries (uint16) """
+
+SNAPSHOT_MAGIC = b'PS'
+""" Identifies a packed snapshot """
+
+_SNAPSHOT_HEADER = struct.Struct('>2sBQH')
+""" magic, version, schema hash (uint64), number of entries (uint16) """
+
+
+class Schema:
+    """
+    A fixed schema that maps every property of the PLC spec to an index.
+    Consumers resolve the indices of a frame through the schema with the same hash.
+    """
+
+    def __init__(self, properties: List[str]):
+        self.properties: List[str] = sorted(properties)
+        """ The property names ordered by their index """
+
+        self.indices: dict[str, int] = {name: index for index, name in enumerate(self.properties)}
+        """ The index of each property name """
+
+        digest = hashlib.sha256('\n'.join(self.properties).encode('utf-8')).digest()
+        self.hash: int = int.from_bytes(digest[:8], 'big')
+        """ Identifies the schema, frames encoded with a different schema hash can not be decoded with this schema """
+
+
+    def to_dict(self) -> dict:
+        """ Returns the JSON representation of the schema """
+        return {
+            'hash': f'{self.hash:016x}',
+            'version': VERSION,
+            'properties': self.properties,
+        }
+
+
+def _pack_values(value, counts: list, values: list):
+    if value is None:
+        counts.append(0)
+    elif isinstance(value, list):
+        counts.append(len(value))
+        values.extend(value)
+    else:
+        counts.append(1)
+        values.append(value)
+
+
+def _unpack_value(values: tuple, position: int, count: int):
+    if count == 0:
+        return None
+    if count == 1:
+        return values[position]
+    return list(values[position:position + count])
+
+
+def encode_frame(schema: Schema, timestamp: float, samples: dict[str, 'int | float | List[int | float] | None']) -> bytes:
+    """
+    Packs the samples of a polling cycle into a single binary frame.
+
+    layout (big endian):
+        header   magic, version, schema hash, timestamp, entry count (n)
+        indices  n x uint16 property index
+        counts   n x uint16 number of values of the property (0 if the read failed)
+        values   sum(counts) x float64
+    """
+    indices, counts, values = [], [], []
+    for name, value in samples.items():
+        indices.append(schema.indices[name])
+        _pack_values(value, counts, values)
+
+    n = len(indices)
+    return b''.join((
+        _FRAME_HEADER.pack(MAGIC, VERSION, schema.hash, timestamp, n),
+        struct.pack(f'>{n}H', *indices),
+        struct.pack(f'>{n}H', *counts),
+        struct.pack(f'>{len(values)}d', *values),
+    ))
+
+
+def decode_frame(schema: Schema, frame: bytes) -> tuple[float, dict[str, 'float | List[float] | None']]:
+    """ Unpacks a frame produced by encode_frame and returns the timestamp and the samples by property name """
+    magic, version, schema_hash, timestamp, n = _FRAME_HEADER.unpack_from(frame)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f'not a telemetry frame (magic={magic}, version={version})')
+    if schema_hash != schema.hash:
+        raise ValueError(f'frame schema {schema_hash:016x} does not match {schema.hash:016x}')
+
+    offset = _FRAME_HEADER.size
+    indices = struct.unpack_from(f'>{n}H', frame, offset)
+    counts = struct.unpack_from(f'>{n}H', frame, offset + 2 * n)
+    values = struct.unpack_from(f'>{sum(counts)}d', frame, offset + 4 * n)
+
+    samples, position = {}, 0
+    for index, count in zip(indices, counts):
+        samples[schema.properties[index]] = _unpack_value(values, position, count)
+        position += count
+
+    return timestamp, samples
+
+
+def encode_snapshot(schema: Schema, entries: dict[str, tuple['int | float | List[int | float] | None', float]]) -> bytes:
+    """
+    Packs the latest value and timestamp of every property into a single binary snapshot.
+
+    layout (big endian):
+        header      magic, version, schema hash, entry count (n)
+        indices     n x uint16 property index
+        counts      n x uint16 number of values of the property (0 if the read failed)
+        timestamps  n x float64 time the value was recorded in unix seconds
+        values      sum(counts) x float64
+    """
+    indices, counts, timestamps, values = [], [], [], []
+    for name, (value, timestamp) in entries.items():
+        indices.append(schema.indices[name])
+        timestamps.append(timestamp)
+        _pack_values(value, counts, values)
+
+    n = len(indices)
+    return b''.join((
+        _SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, VERSION, schema.hash, n),
+        struct.pack(f'>{n}H', *indices),
+        struct.pack(f'>{n}H', *counts),
+        struct.pack(f'>{n}d', *timestamps),
+        struct.pack(f'>{len(values)}d', *values),
+    ))
+
+
+def decode_snapshot(schema: Schema, snapshot: bytes) -> dict[str, tuple['float | List[float] | None', float]]:
+    """ Unpacks a snapshot produced by encode_snapshot and returns the value and timestamp by property name """
+    magic, version, schema_hash, n = _SNAPSHOT_HEADER.unpack_from(snapshot)
+    if magic != SNAPSHOT_MAGIC or version != VERSION:
+        raise ValueError(f'not a snapshot (magic={magic}, version={version})')
+    if schema_hash != schema.hash:
+        raise ValueError(f'snapshot schema {schema_hash:016x} does not match {schema.hash:016x}')
+
+    offset = _SNAPSHOT_HEADER.size
+    indices = struct.unpack_from(f'>{n}H', snapshot, offset)
+    counts = struct.unpack_from(f'>{n}H', snapshot, offset + 2 * n)
+    timestamps = struct.unpack_from(f'>{n}d', snapshot, offset + 4 * n)
+    values = struct.unpack_from(f'>{sum(counts)}d', snapshot, offset + 12 * n)
+
+    entries, position = {}, 0
+    for index, count, timestamp in zip(indices, counts, timestamps):
+        entries[schema.properties[index]] = (_unpack_value(values, position, count), timestamp)
+        position += count
+
+    return entries
@@ -0,0 +1,60 @@
+import threading
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+from typing import Hashable
+
+
+class RoundRobinLock:
+    """
+    A lock that is granted to the keys waiting for it in turn.
+    The modbus units behind a shared gateway connection take turns on the connection, so a busy or slow unit can not
+    starve the other units. The threads waiting with the same key are granted the lock in the order they arrived.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.held = False
+        self.queues: OrderedDict[Hashable, deque] = OrderedDict()
+        """ The waiting threads of each key, the key at the front of the round is granted the lock next """
+
+
+    def acquire(self, key: Hashable):
+        token = object()
+        with self.condition:
+            if not self.held and not self.queues:
+                self.held = True
+                return
+
+            self.queues.setdefault(key, deque()).append(token)
+            while self.held or next(iter(self.queues)) != key or self.queues[key][0] is not token:
+                self.condition.wait()
+
+            self.queues[key].popleft()
+            if self.queues[key]:
+                # the key goes to the back of the round once it had its turn
+                self.queues.move_to_end(key)
+            else:
+                del self.queues[key]
+            self.held = True
+
+
+    def release(self):
+        with self.condition:
+            self.held = False
+            self.condition.notify_all()
+
+
+    @contextmanager
+    def hold(self, key: Hashable):
+        """ Holds the lock for the key within the context """
+        self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+    def waiting(self) -> dict[Hashable, int]:
+        """ Returns the number of threads waiting for the lock with each key """
+        with self.condition:
+            return {key: len(queue) for key, queue in self.queues.items()}
@@ -0,0 +1,90 @@
+import threading
+from typing import List
+
+
+def escape(value: str) -> str:
+    """ Escapes a label value of the text exposition format """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_value(value: float) -> str:
+    if value != value:
+        return 'NaN'
+    if value in (float('inf'), float('-inf')):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRenderer:
+    """
+    Renders the cached samples of the PLC properties in the Prometheus text exposition format.
+    The lines of a property are only rebuilt when its value or timestamp changed since the last scrape,
+    and the whole block is reused while no property changed, so a scrape costs little more than joining cached strings.
+    """
+
+    def __init__(self, plc: str, units: dict[str, str]):
+        self.labels = f'plc="{escape(plc)}"'
+        self.units = units
+        """ The unit of each property, exposed as a label """
+
+        self.lines: dict[str, tuple[tuple, str]] = {}
+        """ The rendered lines of each property and the sample they were rendered from """
+
+        self.version = None
+        self.block = ''
+        """ The rendered lines of all properties at the version """
+        self.lock = threading.Lock()
+
+
+    def render_property(self, name: str, value, timestamp: float) -> str:
+        labels = f'{self.labels},property="{escape(name)}",unit="{escape(self.units.get(name, ""))}"'
+        if value is None:
+            lines = []
+        elif isinstance(value, list):
+            lines = [f'plc_property_value{{{labels},index="{index}"}} {format_value(v)}\n' for index, v in enumerate(value)]
+        else:
+            lines = [f'plc_property_value{{{labels}}} {format_value(value)}\n']
+        lines.append(f'plc_property_timestamp_seconds{{{labels}}} {format_value(float(timestamp))}\n')
+        return ''.join(lines)
+
+
+    def render_properties(self, version, entries: dict[str, tuple]) -> str:
+        """ Returns the lines of the properties, rebuilding only the properties whose sample changed """
+        with self.lock:
+            if version == self.version:
+                return self.block
+
+            parts = []
+            for name, sample in entries.items():
+                cached = self.lines.get(name)
+                if cached is None or cached[0] != sample:
+                    cached = self.lines[name] = (sample, self.render_property(name, *sample))
+                parts.append(cached[1])
+
+            self.version = version
+            self.block = ''.join(parts)
+            return self.block
+
+
+    def render(self, version, entries: dict[str, tuple], uptime: float, latency: dict[str, tuple[List[int], float, int]], buckets: List[float]) -> str:
+        """ Returns the exposition of the property samples, the uptime and the modbus latency histogram """
+        output = [
+            '# HELP plc_property_value The last sampled value of the property\n',
+            '# TYPE plc_property_value gauge\n',
+            '# HELP plc_property_timestamp_seconds The time the last value of the property was sampled\n',
+            '# TYPE plc_property_timestamp_seconds gauge\n',
+            self.render_properties(version, entries),
+            '# HELP plc_uptime_seconds The uptime of the PLC service\n',
+            '# TYPE plc_uptime_seconds gauge\n',
+            f'plc_uptime_seconds{{{self.labels}}} {format_value(uptime)}\n',
+            '# HELP plc_modbus_latency_milliseconds The latency of the modbus requests\n',
+            '# TYPE plc_modbus_latency_milliseconds histogram\n',
+        ]
+        for function, (counts, total, count) in latency.items():
+            labels = f'{self.labels},function_name="{escape(function)}"'
+            for bound, cumulative in zip([*map(format_value, map(float, buckets)), '+Inf'], counts):
+                output.append(f'plc_modbus_latency_milliseconds_bucket{{{labels},le="{bound}"}} {cumulative}\n')
+            output.append(f'plc_modbus_latency_milliseconds_sum{{{labels}}} {format_value(total)}\n')
+            output.append(f'plc_modbus_latency_milliseconds_count{{{labels}}} {count}\n')
+
+        return ''.join(output)
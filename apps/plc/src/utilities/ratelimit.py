@@ -0,0 +1,57 @@
+import time
+import threading
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket rate limiter.
+    Tokens are refilled continuously at `rate` per second up to `burst` tokens.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """ Takes the tokens if they are available, returns False otherwise """
+        with self.lock:
+            self._refill()
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+
+
+    def acquire(self, tokens: float = 1, timeout: float | None = None) -> bool:
+        """
+        Blocks until the tokens are available and takes them. Requests larger than the burst are allowed to drive
+        the bucket into debt, so a large request waits for its share of the rate instead of blocking forever.
+        Returns False if the tokens were not available within the timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.lock:
+            self._refill()
+            wait = (min(tokens, self.burst) - self.tokens) / self.rate
+            if deadline is not None and time.monotonic() + max(wait, 0) > deadline:
+                return False
+            self.tokens -= tokens
+        if wait > 0:
+            time.sleep(wait)
+        return True
+
+
+    def available(self) -> float:
+        """ Returns the number of tokens currently available """
+        with self.lock:
+            self._refill()
+            return self.tokens
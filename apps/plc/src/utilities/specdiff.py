@@ -0,0 +1,60 @@
+from dataclasses import dataclass
+
+RELOADABLE_KEYS = ('properties', 'title', 'version', 'plc_timeout')
+""" The keys of the spec that do not restart the service, a new version or timeout is rendered into the deployment and rolls it anyway """
+
+
+@dataclass(frozen=True)
+class SpecDiff:
+    """ The properties added, removed and changed between two specs of a PLC """
+
+    added: frozenset[str]
+    removed: frozenset[str]
+    changed: frozenset[str]
+
+    restart: bool
+    """ True if the specs differ outside of the properties (e.g. the base URI), which can not be applied in place """
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed or self.restart)
+
+
+def diff_specs(old: dict, new: dict) -> SpecDiff:
+    """ Returns the difference between the old and the new spec of a PLC, a property is changed if any of its fields differ """
+    old_properties, new_properties = old.get('properties', {}), new.get('properties', {})
+    keys = (set(old) | set(new)) - set(RELOADABLE_KEYS)
+
+    return SpecDiff(
+        added = frozenset(new_properties.keys() - old_properties.keys()),
+        removed = frozenset(old_properties.keys() - new_properties.keys()),
+        changed = frozenset(
+            name
+            for name in old_properties.keys() & new_properties.keys()
+            if old_properties[name] != new_properties[name]
+        ),
+        restart = any(old.get(key) != new.get(key) for key in keys),
+    )
+
+
+@dataclass(frozen=True)
+class ShardDiff:
+    """ The PLCs added to, removed from and moved to another port of a shard between two of its specs """
+
+    added: frozenset[str]
+    removed: frozenset[str]
+    moved: frozenset[str]
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.moved)
+
+
+def diff_shard(old: dict, new: dict) -> ShardDiff:
+    """
+    Returns the difference between the old and the new specs of a shard, the port and spec of each PLC by name.
+    The changed specs of the PLCs are not part of it, each PLC of a shard reloads its own spec
+    """
+    return ShardDiff(
+        added = frozenset(new.keys() - old.keys()),
+        removed = frozenset(old.keys() - new.keys()),
+        moved = frozenset(name for name in old.keys() & new.keys() if old[name]['port'] != new[name]['port']),
+    )
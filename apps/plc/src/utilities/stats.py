@@ -0,0 +1,167 @@
+import time
+import bisect
+import threading
+from collections import deque
+from typing import List
+
+started: float = time.time()
+""" The time the service was started in unix seconds """
+
+LATENCY_BUCKETS: List[float] = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+""" The upper bounds in milliseconds of the latency histogram buckets """
+
+
+class Histogram:
+    """
+    A thread-safe histogram with fixed buckets per label (e.g. the profiled function).
+    The counts are kept per bucket and accumulated when read, which matches the Prometheus exposition format.
+    """
+
+    def __init__(self, buckets: List[float]):
+        self.buckets = sorted(buckets)
+        self.series: dict[str, tuple[List[int], float, int]] = {}
+        """ The bucket counts (the last bucket is +Inf), sum and count of the observations of each label """
+        self.lock = threading.Lock()
+
+
+    def observe(self, label: str, value: float):
+        with self.lock:
+            counts, total, count = self.series.get(label) or ([0] * (len(self.buckets) + 1), 0.0, 0)
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.series[label] = (counts, total + value, count + 1)
+
+
+    def snapshot(self) -> dict[str, tuple[List[int], float, int]]:
+        """ Returns the cumulative bucket counts, sum and count of each label """
+        with self.lock:
+            snapshot = {}
+            for label, (counts, total, count) in self.series.items():
+                cumulative, running = [], 0
+                for c in counts:
+                    running += c
+                    cumulative.append(running)
+                snapshot[label] = (cumulative, total, count)
+            return snapshot
+
+
+    def quantile(self, q: float) -> float | None:
+        """
+        Returns the estimated quantile of the observations of all labels, interpolated within the bucket it falls in.
+        The observations above the last bucket are estimated at its upper bound. None if nothing was observed.
+        """
+        with self.lock:
+            counts = [sum(column) for column in zip(*(counts for counts, _, _ in self.series.values()))]
+        total = sum(counts)
+        if not total:
+            return None
+
+        rank, running = q * total, 0
+        for index, count in enumerate(counts):
+            if running + count >= rank and count:
+                if index == len(self.buckets):
+                    return float(self.buckets[-1])
+                lower = self.buckets[index - 1] if index else 0
+                return lower + (self.buckets[index] - lower) * (rank - running) / count
+            running += count
+        return float(self.buckets[-1])
+
+
+class Outcomes:
+    """ Counts the outcome of the requests and the error rate over the most recent requests """
+
+    def __init__(self, window: int = 1000):
+        self.recent: deque[bool] = deque(maxlen=window)
+        """ Whether each of the most recent requests failed """
+        self.recent_errors = 0
+        self.requests = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+
+    def record(self, error: bool):
+        with self.lock:
+            if len(self.recent) == self.recent.maxlen:
+                self.recent_errors -= self.recent[0]
+            self.recent.append(error)
+            self.recent_errors += error
+            self.requests += 1
+            self.errors += error
+
+
+    def summary(self) -> dict:
+        """ Returns the number of requests and errors and the fraction of the most recent requests that failed """
+        with self.lock:
+            return {
+                'requests': self.requests,
+                'errors': self.errors,
+                'error_rate': self.recent_errors / len(self.recent) if self.recent else 0.0,
+            }
+
+
+class Cycles:
+    """
+    Measures the poll cycles of each polling interval from the reads made by the exports.
+    The reads of an export run back to back, so a read that starts more than half an interval after the start of
+    the current cycle begins the next one. A cycle that takes longer than its interval is counted as an overrun.
+    """
+
+    def __init__(self, window: int = 100):
+        self.current: dict[float, list[float]] = {}
+        """ The start and end of the current cycle of each interval """
+        self.durations: dict[float, deque[float]] = {}
+        """ The durations in seconds of the most recent completed cycles of each interval """
+        self.window = window
+        self.cycles = 0
+        self.overruns = 0
+        self.lock = threading.Lock()
+
+
+    def record(self, interval: float, start: float, end: float):
+        """ Records a read of the interval that ran from the start to the end (monotonic seconds) """
+        with self.lock:
+            cycle = self.current.get(interval)
+            if cycle is None or start - cycle[0] > interval / 2:
+                if cycle is not None:
+                    self.complete(interval, cycle[1] - cycle[0])
+                self.current[interval] = [start, end]
+            else:
+                cycle[1] = max(cycle[1], end)
+
+
+    def complete(self, interval: float, duration: float):
+        self.durations.setdefault(interval, deque(maxlen=self.window)).append(duration)
+        self.cycles += 1
+        self.overruns += duration > interval
+
+
+    def overrun(self):
+        """ Counts a read that started more than its interval late """
+        with self.lock:
+            self.overruns += 1
+
+
+    def summary(self) -> dict:
+        """ Returns the number of cycles and overruns and the mean and max duration in milliseconds of the recent cycles """
+        with self.lock:
+            durations = [duration for recent in self.durations.values() for duration in recent]
+            return {
+                'cycles': self.cycles,
+                'overruns': self.overruns,
+                'mean_ms': sum(durations) / len(durations) * 1E3 if durations else None,
+                'max_ms': max(durations) * 1E3 if durations else None,
+            }
+
+
+latency = Histogram(LATENCY_BUCKETS)
+""" The latency in milliseconds of the modbus requests of the PLC, by function name """
+
+outcomes = Outcomes()
+""" The outcome of the modbus reads and writes of the PLC """
+
+cycles = Cycles()
+""" The poll cycles of the PLC """
+
+
+def uptime() -> float:
+    """ Returns the time in seconds since the service was started """
+    return time.time() - started
@@ -4,6 +4,8 @@ from functools import wraps
 
 from opentelemetry.metrics import Histogram
 
+import utilities.stats as stats
+
 logger = logging.getLogger()
 
 
@@ -29,6 +31,8 @@ def profile(debug: bool = False):
             else:
                 logger.info(f'profile_time elapsed "{fn.__name__}[args={args}, kwargs={kwargs}]": {elapsed} ms')
 
+            stats.latency.observe(fn.__name__, elapsed)
+
             histogram: Histogram = get_histogram(*args)
             if histogram:
                 histogram.record(elapsed, attributes={"function_name": fn.__name__})
@@ -39,8 +43,12 @@ def profile(debug: bool = False):
 
 
 def get_histogram(*args) -> Histogram | None:
-    """ Attempts to acquire the histogram for profiling execution time of a function """
+    """
+    Attempts to acquire the histogram for profiling execution time of a function.
+    Returns None while the opentelemetry client is shut down, e.g. while the PLC is unreachable or on a standby replica
+    """
     try:
-        return args[0].opentelemetry_client.histogram
+        client = args[0].opentelemetry_client
+        return client.histogram if client is not None else None
     except:
         logger.exception('failed to get histogram for profiler')
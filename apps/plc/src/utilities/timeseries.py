@@ -0,0 +1,334 @@
+import sys
+import struct
+import threading
+from collections import deque
+from typing import List
+
+_FLOAT = struct.Struct('>d')
+_UINT64 = struct.Struct('>Q')
+
+_CHUNK_OVERHEAD = 120
+""" Approximate size in bytes of the python objects that hold a sealed chunk, in addition to its payload """
+
+
+def _float_to_bits(value: float) -> int:
+    return _UINT64.unpack(_FLOAT.pack(value))[0]
+
+
+def _bits_to_float(bits: int) -> float:
+    return _FLOAT.unpack(_UINT64.pack(bits))[0]
+
+
+class BitWriter:
+    """ Appends bits to an arbitrary length integer """
+
+    def __init__(self):
+        self.value = 0
+        self.length = 0
+
+    def write(self, bits: int, n: int):
+        self.value = (self.value << n) | (bits & ((1 << n) - 1))
+        self.length += n
+
+    def to_bytes(self) -> bytes:
+        padding = -self.length % 8
+        return (self.value << padding).to_bytes((self.length + padding) // 8, 'big')
+
+
+class BitReader:
+    """ Reads the bits written by a BitWriter """
+
+    def __init__(self, data: bytes):
+        self.value = int.from_bytes(data, 'big')
+        self.length = len(data) * 8
+        self.position = 0
+
+    def read(self, n: int) -> int:
+        self.position += n
+        return (self.value >> (self.length - self.position)) & ((1 << n) - 1)
+
+
+class ChunkEncoder:
+    """
+    Compresses a block of samples with the scheme of Facebook's Gorilla paper.
+    Timestamps (in milliseconds) are stored as delta-of-delta, values as the XOR with the previous value.
+    Regularly polled samples of a slowly changing register compress to a couple of bits each.
+    """
+
+    def __init__(self, timestamp: int, value: float):
+        self.writer = BitWriter()
+        self.writer.write(timestamp, 64)
+        self.writer.write(_float_to_bits(value), 64)
+
+        self.first_timestamp = timestamp
+        self.timestamp = timestamp
+        self.delta = 0
+        self.bits = _float_to_bits(value)
+        self.leading = -1
+        self.trailing = 0
+        self.count = 1
+
+
+    def append(self, timestamp: int, value: float):
+        writer = self.writer
+
+        delta = timestamp - self.timestamp
+        dod = delta - self.delta
+        if dod == 0:
+            writer.write(0b0, 1)
+        elif -63 <= dod <= 64:
+            writer.write(0b10, 2)
+            writer.write(dod + 63, 7)
+        elif -255 <= dod <= 256:
+            writer.write(0b110, 3)
+            writer.write(dod + 255, 9)
+        elif -2047 <= dod <= 2048:
+            writer.write(0b1110, 4)
+            writer.write(dod + 2047, 12)
+        else:
+            writer.write(0b1111, 4)
+            writer.write(dod, 64)
+
+        bits = _float_to_bits(value)
+        xor = bits ^ self.bits
+        if xor == 0:
+            writer.write(0b0, 1)
+        else:
+            leading = min(64 - xor.bit_length(), 31)
+            trailing = (xor & -xor).bit_length() - 1
+            if self.leading >= 0 and leading >= self.leading and trailing >= self.trailing:
+                # the meaningful bits fit in the window of the previous value
+                writer.write(0b10, 2)
+                writer.write(xor >> self.trailing, 64 - self.leading - self.trailing)
+            else:
+                meaningful = 64 - leading - trailing
+                writer.write(0b11, 2)
+                writer.write(leading, 5)
+                writer.write(meaningful - 1, 6)
+                writer.write(xor >> trailing, meaningful)
+                self.leading, self.trailing = leading, trailing
+
+        self.timestamp, self.delta, self.bits = timestamp, delta, bits
+        self.count += 1
+
+
+    def to_bytes(self) -> bytes:
+        return self.writer.to_bytes()
+
+
+def decode_chunk(data: bytes, count: int) -> tuple[List[int], List[float]]:
+    """ Decompresses the timestamps and values of a chunk produced by a ChunkEncoder """
+    reader = BitReader(data)
+    timestamp = reader.read(64)
+    bits = reader.read(64)
+    timestamps, values = [timestamp], [_bits_to_float(bits)]
+
+    delta, leading, trailing = 0, 0, 0
+    for _ in range(count - 1):
+        if reader.read(1) == 0:
+            dod = 0
+        elif reader.read(1) == 0:
+            dod = reader.read(7) - 63
+        elif reader.read(1) == 0:
+            dod = reader.read(9) - 255
+        elif reader.read(1) == 0:
+            dod = reader.read(12) - 2047
+        else:
+            dod = reader.read(64)
+            dod = dod - (1 << 64) if dod >= 1 << 63 else dod
+        delta += dod
+        timestamp += delta
+
+        if reader.read(1) == 1:
+            if reader.read(1) == 1:
+                leading = reader.read(5)
+                meaningful = reader.read(6) + 1
+                trailing = 64 - leading - meaningful
+            bits ^= reader.read(64 - leading - trailing) << trailing
+
+        timestamps.append(timestamp)
+        values.append(_bits_to_float(bits))
+
+    return timestamps, values
+
+
+class Series:
+    """
+    A ring buffer of compressed chunks holding the recent samples of one property.
+    The oldest chunks are evicted once the series exceeds its memory budget.
+    """
+
+    def __init__(self, budget_bytes: int, samples_per_chunk: int = 128):
+        self.budget_bytes = budget_bytes
+        self.samples_per_chunk = samples_per_chunk
+
+        self.chunks: deque[tuple[int, int, int, bytes]] = deque()
+        """ The sealed chunks as (first timestamp, last timestamp, sample count, compressed samples), oldest first """
+
+        self.encoder: ChunkEncoder | None = None
+        """ The chunk that samples are appended to """
+
+        self.size = 0
+        """ The approximate memory used by the sealed chunks in bytes """
+
+        self.lock = threading.Lock()
+
+
+    def append(self, timestamp: int, value: float):
+        """ Appends a sample, timestamps are in milliseconds """
+        with self.lock:
+            if self.encoder is None:
+                self.encoder = ChunkEncoder(timestamp, value)
+                return
+
+            self.encoder.append(timestamp, value)
+            if self.encoder.count >= self.samples_per_chunk:
+                self._seal()
+
+
+    def _seal(self):
+        data = self.encoder.to_bytes()
+        self.chunks.append((self.encoder.first_timestamp, self.encoder.timestamp, self.encoder.count, data))
+        self.size += sys.getsizeof(data) + _CHUNK_OVERHEAD
+        self.encoder = None
+
+        while self.chunks and self.size > self.budget_bytes:
+            self.size -= sys.getsizeof(self.chunks.popleft()[3]) + _CHUNK_OVERHEAD
+
+
+    def memory(self) -> int:
+        """ Returns the approximate memory used by the series in bytes """
+        with self.lock:
+            return self.size + (self.encoder.writer.length // 8 + _CHUNK_OVERHEAD if self.encoder else 0)
+
+
+    def count(self) -> int:
+        """ Returns the number of samples held by the series """
+        with self.lock:
+            return sum(chunk[2] for chunk in self.chunks) + (self.encoder.count if self.encoder else 0)
+
+
+    def query(self, since: int, until: int) -> tuple[List[int], List[float]]:
+        """ Returns the timestamps and values of the samples within [since, until] """
+        with self.lock:
+            chunks = [chunk for chunk in self.chunks if chunk[1] >= since and chunk[0] <= until]
+            if self.encoder is not None and self.encoder.timestamp >= since and self.encoder.first_timestamp <= until:
+                chunks.append((self.encoder.first_timestamp, self.encoder.timestamp, self.encoder.count, self.encoder.to_bytes()))
+
+        timestamps, values = [], []
+        for _, _, count, data in chunks:
+            for timestamp, value in zip(*decode_chunk(data, count)):
+                if since <= timestamp <= until:
+                    timestamps.append(timestamp)
+                    values.append(value)
+        return timestamps, values
+
+
+class History:
+    """ The compressed time-series history of the observed properties, sharing one memory budget """
+
+    def __init__(self, properties: List[str], budget_bytes: int, samples_per_chunk: int = 128):
+        self.per_series = budget_bytes // max(len(properties), 1)
+        self.samples_per_chunk = samples_per_chunk
+        self.series: dict[str, Series] = {
+            name: Series(self.per_series, samples_per_chunk)
+            for name in properties
+        }
+
+
+    def add(self, name: str):
+        """ Starts an empty series for a property, with the budget of a series of the initial properties """
+        self.series[name] = Series(self.per_series, self.samples_per_chunk)
+
+
+    def remove(self, name: str):
+        """ Drops the series of a property """
+        self.series.pop(name, None)
+
+
+    def append(self, name: str, value, timestamp: float):
+        """ Records a sample of the property, samples that are not a single number are ignored """
+        series = self.series.get(name)
+        if series is None or value is None or isinstance(value, list):
+            return
+        series.append(int(timestamp * 1E3), float(value))
+
+
+    def query(self, name: str, since: float, until: float) -> tuple[List[float], List[float]]:
+        """ Returns the timestamps (in seconds) and values of the property within [since, until] """
+        timestamps, values = self.series[name].query(int(since * 1E3), int(until * 1E3))
+        return [timestamp / 1E3 for timestamp in timestamps], values
+
+
+    def memory(self) -> int:
+        """ Returns the approximate memory used by all series in bytes """
+        return sum(series.memory() for series in self.series.values())
+
+
+def downsample(timestamps: List[float], values: List[float], points: int) -> dict[str, List[float]]:
+    """
+    Aggregates the samples into `points` buckets of equal duration.
+    Returns the start timestamp, minimum, maximum and average of each non-empty bucket.
+    """
+    result = {'timestamps': [], 'min': [], 'max': [], 'avg': []}
+    if not timestamps or points <= 0:
+        return result
+
+    start, width = timestamps[0], max((timestamps[-1] - timestamps[0]) / points, 1E-9)
+    bucket, bucket_values = None, []
+
+    def flush():
+        result['timestamps'].append(start + bucket * width)
+        result['min'].append(min(bucket_values))
+        result['max'].append(max(bucket_values))
+        result['avg'].append(sum(bucket_values) / len(bucket_values))
+
+    for timestamp, value in zip(timestamps, values):
+        index = min(int((timestamp - start) / width), points - 1)
+        if index != bucket and bucket_values:
+            flush()
+            bucket_values = []
+        bucket = index
+        bucket_values.append(value)
+    flush()
+
+    return result
+
+
+def lttb(timestamps: List[float], values: List[float], points: int) -> tuple[List[float], List[float]]:
+    """
+    Downsamples the series to `points` samples with the Largest-Triangle-Three-Buckets algorithm,
+    which keeps the visual shape of the series (peaks and troughs) better than averaging.
+    The first and last samples are always kept, so fewer than 3 points are raised to 3.
+    """
+    n = len(timestamps)
+    points = max(points, 3)
+    if points >= n:
+        return list(timestamps), list(values)
+
+    sampled_timestamps, sampled_values = [timestamps[0]], [values[0]]
+    every = (n - 2) / (points - 2)
+    a = 0
+
+    for i in range(points - 2):
+        # the average of the next bucket is the third point of the triangle
+        next_start, next_end = int((i + 1) * every) + 1, min(int((i + 2) * every) + 1, n)
+        avg_t = sum(timestamps[next_start:next_end]) / (next_end - next_start)
+        avg_v = sum(values[next_start:next_end]) / (next_end - next_start)
+
+        # pick the point of the current bucket that forms the largest triangle
+        start, end = int(i * every) + 1, int((i + 1) * every) + 1
+        at, av = timestamps[a], values[a]
+        max_area, max_index = -1, start
+        for j in range(start, end):
+            area = abs((at - avg_t) * (values[j] - av) - (at - timestamps[j]) * (avg_v - av))
+            if area > max_area:
+                max_area, max_index = area, j
+
+        sampled_timestamps.append(timestamps[max_index])
+        sampled_values.append(values[max_index])
+        a = max_index
+
+    sampled_timestamps.append(timestamps[-1])
+    sampled_values.append(values[-1])
+    return sampled_timestamps, sampled_values
@@ -0,0 +1,108 @@
+import struct
+import threading
+from multiprocessing import shared_memory
+from typing import List
+
+_SLOT_HEADER = struct.Struct('=QdII')
+""" Slot header: sequence number, timestamp in unix seconds, kind of value, number of values """
+
+_SEQUENCE, _SLOT_FIELDS = struct.Struct('=Q'), struct.Struct('=dII')
+""" The sequence number and the other fields of the slot header, written separately """
+
+_VALUE = struct.Struct('=d')
+
+NONE, INT, FLOAT, INT_LIST, FLOAT_LIST = range(5)
+""" The kind of value held by a slot """
+
+
+class ValueTable:
+    """
+    The latest value and timestamp of every property in an array-backed shared memory block.
+    Every property has a fixed slot, so readers in other processes (forked after the table was created)
+    read the values in place without serialization or a round trip to the process that polls the PLC.
+
+    Each slot is guarded by a sequence lock: the writer makes the sequence number odd while it updates the slot
+    and even once the update is complete, readers retry until they read an even and unchanged sequence number.
+    """
+
+    def __init__(self, properties: List[str], width: int = 1):
+        self.properties: List[str] = list(properties)
+        self.indices: dict[str, int] = {name: index for index, name in enumerate(self.properties)}
+
+        self.width = max(width, 1)
+        """ The maximum number of values of a property (its quantity of registers) """
+
+        self.slot_size = _SLOT_HEADER.size + self.width * _VALUE.size
+        self.memory = shared_memory.SharedMemory(create=True, size=max(self.slot_size * len(self.properties), 1))
+        self.buffer = self.memory.buf
+
+        self.write_lock = threading.Lock()
+        """ Serializes the writers of this process, the table has a single writing process """
+
+
+    @property
+    def name(self) -> str:
+        return self.memory.name
+
+
+    def write(self, name: str, value: 'int | float | List[int | float] | None', timestamp: float):
+        """ Stores the value of the property, values beyond the width of the table are dropped """
+        offset = self.indices[name] * self.slot_size
+        if value is None:
+            kind, values = NONE, []
+        elif isinstance(value, list):
+            kind, values = (FLOAT_LIST if any(isinstance(v, float) for v in value) else INT_LIST), value[:self.width]
+        else:
+            kind, values = (FLOAT if isinstance(value, float) else INT), [value]
+
+        with self.write_lock:
+            sequence = _SLOT_HEADER.unpack_from(self.buffer, offset)[0]
+            # pack_into zeroes the bytes before it packs the fields, a reader could see an even sequence number with a
+            # partial header. The sequence number is copied in one piece and the other fields are packed while it is odd
+            self.buffer[offset:offset + _SEQUENCE.size] = _SEQUENCE.pack(sequence + 1)
+            _SLOT_FIELDS.pack_into(self.buffer, offset + _SEQUENCE.size, timestamp, kind, len(values))
+            for index, v in enumerate(values):
+                _VALUE.pack_into(self.buffer, offset + _SLOT_HEADER.size + index * _VALUE.size, v)
+            self.buffer[offset:offset + _SEQUENCE.size] = _SEQUENCE.pack(sequence + 2)
+
+
+    def sequence(self, name: str) -> int:
+        """ Returns the sequence number of the slot of the property, it changes with every write """
+        return _SLOT_HEADER.unpack_from(self.buffer, self.indices[name] * self.slot_size)[0]
+
+
+    def read(self, name: str) -> tuple['int | float | List[int | float] | None', float, int] | None:
+        """ Returns the value, timestamp and sequence number of the property, None if it was never written """
+        offset = self.indices[name] * self.slot_size
+        while True:
+            sequence, timestamp, kind, count = _SLOT_HEADER.unpack_from(self.buffer, offset)
+            if sequence & 1:
+                continue
+            values = struct.unpack_from(f'={count}d', self.buffer, offset + _SLOT_HEADER.size)
+            if _SLOT_HEADER.unpack_from(self.buffer, offset)[0] == sequence:
+                break
+
+        if sequence == 0:
+            return None
+        if kind == NONE:
+            value = None
+        elif kind == INT:
+            value = int(values[0])
+        elif kind == FLOAT:
+            value = values[0]
+        elif kind == INT_LIST:
+            value = [int(v) for v in values]
+        else:
+            value = list(values)
+        return value, timestamp, sequence
+
+
+    def close(self):
+        """ Releases the mapping of this process """
+        self.buffer = None
+        self.memory.close()
+
+
+    def unlink(self):
+        """ Removes the shared memory block once every process closed it """
+        self.memory.unlink()
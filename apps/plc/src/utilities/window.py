@@ -0,0 +1,60 @@
+import threading
+
+
+class Window:
+    """
+    Aggregates the samples of a property between two exports.
+    Numeric samples are reduced to their minimum, maximum, mean and last value,
+    samples of multiple registers are only kept as the last value.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._reset()
+
+
+    def _reset(self):
+        self.count = 0
+        self.minimum = None
+        self.maximum = None
+        self.total = 0.0
+        self.last = None
+
+
+    def add(self, value):
+        """ Adds a sample to the window, failed reads (None) are ignored """
+        if value is None:
+            return
+
+        with self.lock:
+            self.last = value
+            if isinstance(value, list):
+                return
+            self.count += 1
+            self.total += value
+            self.minimum = value if self.minimum is None else min(self.minimum, value)
+            self.maximum = value if self.maximum is None else max(self.maximum, value)
+
+
+    def drain(self) -> dict | None:
+        """
+        Returns the aggregates of the window and starts a new one.
+        Returns None if no sample was added since the last drain.
+        """
+        with self.lock:
+            if self.last is None:
+                return None
+
+            if self.count:
+                aggregates = {
+                    'min': self.minimum,
+                    'max': self.maximum,
+                    'mean': self.total / self.count,
+                    'last': self.last,
+                    'count': self.count,
+                }
+            else:
+                aggregates = {'last': self.last, 'count': 0}
+
+            self._reset()
+            return aggregates
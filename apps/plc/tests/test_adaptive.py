@@ -0,0 +1,32 @@
+from src.utilities.adaptive import AdaptiveInterval, fit_to_budget
+
+def test_adaptive_interval_backs_off_and_speeds_up():
+    controller = AdaptiveInterval(minimum=1, maximum=4)
+    assert controller.update(10) == 1
+    assert controller.update(10) == 1.5
+    assert controller.update(10) == 2.25
+    assert controller.update(10) == 3.375
+    assert controller.update(10) == 4
+    # a change halves the interval down to the minimum
+    assert controller.update(11) == 2
+    assert controller.update(12) == 1
+    assert controller.update(13) == 1
+    # failed reads keep the interval
+    assert controller.update(None) == 1
+
+def test_adaptive_interval_tolerance():
+    controller = AdaptiveInterval(minimum=1, maximum=8, tolerance=0.5)
+    controller.update(10)
+    assert controller.update(10.4) == 1.5
+    assert controller.update(11) == 1
+
+def test_fit_to_budget():
+    intervals = {'a': 1.0, 'b': 0.5}
+    costs = {'a': 1, 'b': 2}
+    # unlimited
+    assert fit_to_budget(intervals, costs, fixed_rate=10, capacity=0) == 1.0
+    # the adaptive properties demand 5 transactions per second
+    assert fit_to_budget(intervals, costs, fixed_rate=2, capacity=10) == 1.0
+    assert fit_to_budget(intervals, costs, fixed_rate=7.5, capacity=10) == 2.0
+    # the adaptive properties keep a tenth of the link
+    assert fit_to_budget(intervals, costs, fixed_rate=20, capacity=10) == 5.0
@@ -0,0 +1,48 @@
+import json
+from collections import namedtuple
+
+import pytest
+
+from src.utilities.commands import collapse, parse_command
+
+Record = namedtuple('Record', ['offset', 'value'])
+
+def command(id, data):
+    return json.dumps({'context': {'id': id}, 'data': data}).encode()
+
+def is_valid(name, value):
+    return name in ('a', 'b') and type(value) is int
+
+def test_collapse_supersedes_earlier_writes():
+    records = [
+        Record(0, command('1', {'plc': 'hvdp', 'writes': [{'property': 'a', 'value': 1}, {'property': 'b', 'value': 2}]})),
+        Record(1, command('2', {'plc': 'hvdp', 'property': 'a', 'value': 3})),
+        Record(2, command('3', {'plc': 'other', 'property': 'b', 'value': 4})),
+    ]
+    writes, coalesced = collapse(records, plc='hvdp', is_valid=is_valid)
+    assert writes == {'b': (2, '1'), 'a': (3, '2')}
+    assert list(writes) == ['b', 'a']
+    assert coalesced == 1
+
+@pytest.mark.parametrize('malformed', [
+    b'not json',
+    None,
+    b'[1, 2]',
+    command('bad', 'x'),
+    command('bad', {'plc': 'hvdp', 'writes': 'x'}),
+    command('bad', {'plc': 'hvdp', 'writes': [5, None, {'property': [], 'value': 1}, {'property': {'a': 1}, 'value': 1}]}),
+    command('bad', {'plc': 'hvdp', 'property': ['a'], 'value': 1}),
+])
+def test_collapse_skips_malformed_commands_and_keeps_the_batch(malformed):
+    records = [
+        Record(0, command('1', {'plc': 'hvdp', 'property': 'a', 'value': 1})),
+        Record(1, malformed),
+        Record(2, command('2', {'plc': 'hvdp', 'writes': [{'property': 'b', 'value': 2}, 7]})),
+    ]
+    writes, _ = collapse(records, plc='hvdp', is_valid=is_valid)
+    assert writes == {'a': (1, '1'), 'b': (2, '2')}
+
+def test_parse_command_rejects_data_that_is_not_an_object():
+    with pytest.raises(ValueError):
+        parse_command(command('1', 'x'))
+    assert parse_command(command('1', {'plc': 'hvdp', 'property': 'a', 'value': 1})) == ('hvdp', '1', [{'plc': 'hvdp', 'property': 'a', 'value': 1}])
@@ -0,0 +1,35 @@
+from src.utilities.deadband import ExceptionReporter
+
+def test_reports_first_sample_and_changes_outside_deadband():
+    reporter = ExceptionReporter(deadband=0.5, heartbeat=None)
+    assert reporter.should_report(20.0, now=0)
+    assert not reporter.should_report(20.4, now=1)
+    assert not reporter.should_report(19.6, now=2)
+    assert reporter.should_report(20.6, now=3)
+    # the deadband is centered on the last reported value, not the last sample
+    assert not reporter.should_report(20.2, now=4)
+
+def test_reports_on_heartbeat():
+    reporter = ExceptionReporter(deadband=1, heartbeat=60)
+    assert reporter.should_report(1, now=0)
+    assert not reporter.should_report(1, now=59)
+    assert reporter.should_report(1, now=60)
+    assert not reporter.should_report(1, now=61)
+
+def test_zero_deadband_reports_any_change():
+    reporter = ExceptionReporter(deadband=0, heartbeat=None)
+    assert reporter.should_report(0, now=0)
+    assert not reporter.should_report(0, now=1)
+    assert reporter.should_report(1, now=2)
+
+def test_reports_transients_within_window():
+    reporter = ExceptionReporter(deadband=5, heartbeat=None)
+    assert reporter.should_report(10, now=0)
+    assert reporter.should_report(10, now=1, extremes=(10, 30))
+
+def test_ignores_failed_reads_and_compares_lists():
+    reporter = ExceptionReporter(deadband=0, heartbeat=None)
+    assert not reporter.should_report(None, now=0)
+    assert reporter.should_report([1, 2], now=1)
+    assert not reporter.should_report([1, 2], now=2)
+    assert reporter.should_report([1, 3], now=3)
@@ -0,0 +1,52 @@
+from src.utilities.election import LeaderElector, MemoryLease
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def elector(lease, identity, clock):
+    return LeaderElector(lease, identity, duration=15, renew_deadline=10, retry_interval=2, clock=clock)
+
+def test_single_leader_while_the_lease_is_renewed():
+    lease, clock = MemoryLease(), Clock()
+    leader, candidate = elector(lease, 'plc-a', clock), elector(lease, 'plc-b', clock)
+    assert leader.try_acquire_or_renew()
+    for _ in range(10):
+        clock.now += 2
+        assert leader.try_acquire_or_renew()
+        assert not candidate.try_acquire_or_renew()
+    assert lease.get()[0]['holderIdentity'] == 'plc-a'
+
+def test_candidate_takes_over_once_the_lease_expires():
+    lease, clock = MemoryLease(), Clock()
+    leader, candidate = elector(lease, 'plc-a', clock), elector(lease, 'plc-b', clock)
+    assert leader.try_acquire_or_renew()
+    assert not candidate.try_acquire_or_renew()
+    # the leader stopped renewing, the record does not change for the lease duration on the clock of the candidate
+    clock.now += 14
+    assert not candidate.try_acquire_or_renew()
+    clock.now += 1
+    assert candidate.try_acquire_or_renew()
+    record, _ = lease.get()
+    assert record['holderIdentity'] == 'plc-b' and record['leaseTransitions'] == 1
+    # the old leader sees the new holder and does not take the lease back
+    assert not leader.try_acquire_or_renew()
+
+def test_released_lease_is_taken_over_immediately():
+    lease, clock = MemoryLease(), Clock()
+    leader, candidate = elector(lease, 'plc-a', clock), elector(lease, 'plc-b', clock)
+    assert leader.try_acquire_or_renew()
+    assert not candidate.try_acquire_or_renew()
+    leader.release()
+    assert candidate.try_acquire_or_renew()
+
+def test_stale_update_is_rejected():
+    lease = MemoryLease()
+    assert lease.create({'holderIdentity': 'plc-a'})
+    assert not lease.create({'holderIdentity': 'plc-b'})
+    record, version = lease.get()
+    assert lease.update({**record, 'holderIdentity': 'plc-b'}, version)
+    assert not lease.update({**record, 'holderIdentity': 'plc-c'}, version)
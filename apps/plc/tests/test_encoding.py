@@ -0,0 +1,42 @@
+import pytest
+
+from src.utilities.encoding import Schema, encode_frame, decode_frame, encode_snapshot, decode_snapshot
+
+@pytest.fixture
+def schema() -> Schema:
+    """ Initialize Schema fixture """
+    return Schema(["silo2Temp", "silo2Humidity", "fuelPumpFault", "generatorEvents"])
+
+def test_schema_orders_properties(schema: Schema):
+    assert schema.properties == ["fuelPumpFault", "generatorEvents", "silo2Humidity", "silo2Temp"]
+    assert schema.indices["silo2Temp"] == 3
+
+def test_schema_hash_is_stable(schema: Schema):
+    assert Schema(["fuelPumpFault", "silo2Temp", "silo2Humidity", "generatorEvents"]).hash == schema.hash
+    assert Schema(["fuelPumpFault"]).hash != schema.hash
+
+def test_frame_roundtrip(schema: Schema):
+    samples = {"silo2Temp": 21.5, "fuelPumpFault": 1, "generatorEvents": [1, 2, 3], "silo2Humidity": None}
+    frame = encode_frame(schema, 1700000000.25, samples)
+    timestamp, decoded = decode_frame(schema, frame)
+    assert timestamp == 1700000000.25
+    assert decoded == samples
+
+def test_frame_is_compact(schema: Schema):
+    frame = encode_frame(schema, 0, {"silo2Temp": 21.5, "silo2Humidity": 40.1})
+    assert len(frame) == 21 + 2 * 2 + 2 * 2 + 2 * 8
+
+def test_decode_rejects_other_schema(schema: Schema):
+    frame = encode_frame(Schema(["silo2Temp"]), 0, {"silo2Temp": 1})
+    with pytest.raises(ValueError):
+        decode_frame(schema, frame)
+
+def test_snapshot_roundtrip(schema: Schema):
+    entries = {"silo2Temp": (21.5, 1700000000.25), "generatorEvents": ([1, 2], 1700000001.5), "silo2Humidity": (None, 1700000002.0)}
+    snapshot = encode_snapshot(schema, entries)
+    assert len(snapshot) == 13 + 3 * (2 + 2 + 8) + 3 * 8
+    assert decode_snapshot(schema, snapshot) == entries
+
+def test_decode_snapshot_rejects_frames(schema: Schema):
+    with pytest.raises(ValueError):
+        decode_snapshot(schema, encode_frame(schema, 0, {"silo2Temp": 1}))
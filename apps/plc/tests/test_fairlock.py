@@ -0,0 +1,34 @@
+import time
+import threading
+
+from src.utilities.fairlock import RoundRobinLock
+
+def test_round_robin_lock_alternates_between_units():
+    lock = RoundRobinLock()
+    granted = []
+
+    def worker(unit: int):
+        with lock.hold(unit):
+            granted.append(unit)
+
+    lock.acquire('holder')
+    threads = []
+    # unit 1 queues three transactions before unit 2 queues two
+    for unit in [1, 1, 1, 2, 2]:
+        thread = threading.Thread(target=worker, args=(unit,))
+        thread.start()
+        threads.append(thread)
+        while sum(lock.waiting().values()) < len(threads):
+            time.sleep(0.001)
+    lock.release()
+
+    for thread in threads:
+        thread.join(timeout=5)
+    assert granted == [1, 2, 1, 2, 1]
+    assert lock.waiting() == {}
+
+def test_round_robin_lock_uncontended():
+    lock = RoundRobinLock()
+    with lock.hold(1):
+        assert lock.held
+    assert not lock.held
@@ -0,0 +1,19 @@
+import threading
+
+import src.clients.modbus_events as modbus_events
+
+def test_publish_drops_the_oldest_events_of_a_slow_subscriber():
+    thread_id = threading.get_ident()
+    dropped = modbus_events.dropped()
+    # subscribing creates the queue, no event is published yet
+    assert modbus_events.subscribe(thread_id, timeout=0.01, maxsize=2) is None
+    try:
+        # the publisher never blocks on a full queue
+        for i in range(5):
+            modbus_events.publish_event('a', i, i)
+        assert modbus_events.subscribe(thread_id, timeout=0.01) == ('a', 3, 3)
+        assert modbus_events.subscribe(thread_id, timeout=0.01) == ('a', 4, 4)
+        assert modbus_events.dropped() - dropped == 3
+    finally:
+        modbus_events.unsubscribe(thread_id)
+    assert modbus_events.subscribers() == 0
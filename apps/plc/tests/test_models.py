@@ -51,3 +51,35 @@ def test_plc_get_port(plc: PLC):
 
 def test_plc_get_host(plc: PLC):
     assert plc.get_host() == "10.0.9.10"
+
+def test_plc_get_sampling_times(plc: PLC):
+    assert plc.get_sampling_times() == {}
+    plc.spec["properties"]["silo2Temp"]["forms"][0]["modbus:samplingTime"] = 0.5
+    # sampling is ignored unless it is faster than the polling time
+    plc.spec["properties"]["silo2Humidity"]["forms"][0]["modbus:samplingTime"] = 5
+    assert plc.get_sampling_times() == {"silo2Temp": 0.5}
+
+def test_plc_get_adaptive_polling(plc: PLC):
+    assert plc.get_adaptive_polling() == {}
+    form = plc.spec["properties"]["silo2Temp"]["forms"][0]
+    form["modbus:adaptive"] = True
+    assert plc.get_adaptive_polling() == {"silo2Temp": (15, 150)}
+    form["modbus:minPollingTime"] = 1
+    form["modbus:maxPollingTime"] = 60
+    assert plc.get_adaptive_polling() == {"silo2Temp": (1, 60)}
+
+def test_plc_sub_second_polling(plc: PLC):
+    form = plc.spec["properties"]["silo2Humidity"]["forms"][0]
+    form["modbus:pollingTime"] = 0.25
+    # sub-second properties are exported at the minimum export interval and sampled at their polling time
+    assert plc.get_polling_times() == {1.0, 15.0}
+    assert plc.get_export_interval("silo2Humidity") == 1.0
+    assert plc.get_sampling_times() == {"silo2Humidity": 0.25}
+
+def test_plc_get_unit_id(plc: PLC):
+    assert plc.get_unit_ids() == {1}
+    assert plc.get_unit_id() == 1
+    assert plc.get_unit_id({"href": "400701", "modbus:unitID": 7}) == 7
+    assert plc.get_unit_id({"href": "modbus+tcp://10.0.9.10:502/3/400701"}) == 3
+    plc.spec["properties"]["silo2Temp"]["forms"][0]["modbus:unitID"] = 2
+    assert plc.get_unit_ids() == {1, 2}
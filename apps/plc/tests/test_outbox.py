@@ -0,0 +1,68 @@
+import os
+
+import pytest
+
+from src.clients.outbox import Outbox
+
+@pytest.fixture
+def outbox(tmp_path) -> Outbox:
+    """ Initialize Outbox fixture with small segments """
+    return Outbox(directory=str(tmp_path), segment_bytes=256, max_bytes=4096, fsync_batch=4)
+
+def test_outbox_read_and_commit(outbox: Outbox):
+    for i in range(10):
+        outbox.append(f'event-{i}'.encode())
+    records = outbox.read(max_records=4, timeout=0)
+    assert [offset for offset, _ in records] == [0, 1, 2, 3]
+    assert records[0][1] == b'event-0'
+    outbox.commit(records[-1][0])
+    assert [offset for offset, _ in outbox.read(max_records=100, timeout=0)] == list(range(4, 10))
+    assert outbox.lag() == 6
+
+def test_outbox_commits_across_a_segment_boundary(tmp_path):
+    outbox = Outbox(directory=str(tmp_path), segment_bytes=256)
+    for i in range(40):
+        outbox.append(b'x' * 20)
+    offset = 0
+    while offset < 40:
+        records = outbox.read(max_records=8, timeout=0)
+        assert [record_offset for record_offset, _ in records] == list(range(offset, min(offset + 8, 40)))
+        outbox.commit(records[-1][0])
+        offset = records[-1][0] + 1
+    assert outbox.lag() == 0
+
+def test_outbox_redelivers_unacknowledged_records(outbox: Outbox):
+    for i in range(3):
+        outbox.append(f'event-{i}'.encode())
+    assert len(outbox.read(timeout=0)) == 3
+    outbox.rewind()
+    assert [offset for offset, _ in outbox.read(timeout=0)] == [0, 1, 2]
+
+def test_outbox_resumes_from_checkpoint_after_restart(tmp_path, outbox: Outbox):
+    for i in range(50):
+        outbox.append(f'event-{i}'.encode())
+    outbox.commit(29)
+    outbox.close()
+
+    reopened = Outbox(directory=str(tmp_path), segment_bytes=256, max_bytes=4096)
+    records = reopened.read(max_records=100, timeout=0)
+    assert [offset for offset, _ in records] == list(range(30, 50))
+    assert reopened.append(b'next') == 50
+
+def test_outbox_truncates_torn_tail(tmp_path, outbox: Outbox):
+    outbox.append(b'complete')
+    outbox.close()
+    segment = os.path.join(str(tmp_path), sorted(f for f in os.listdir(tmp_path) if f.endswith('.log'))[-1])
+    with open(segment, 'ab') as f:
+        f.write(b'\x00\x00\x00')
+
+    reopened = Outbox(directory=str(tmp_path))
+    assert reopened.read(timeout=0) == [(0, b'complete')]
+    assert reopened.append(b'after') == 1
+
+def test_outbox_bounds_disk_usage(tmp_path, outbox: Outbox):
+    for i in range(1000):
+        outbox.append(b'x' * 64)
+    segments = [f for f in os.listdir(tmp_path) if f.endswith('.log')]
+    assert sum(os.path.getsize(os.path.join(tmp_path, f)) for f in segments) <= 4096 + 256 + 80
+    assert outbox.read(timeout=0)[0][0] > 0
@@ -0,0 +1,27 @@
+from src.utilities.prometheus import MetricsRenderer
+from src.utilities.stats import Histogram
+
+def test_render_properties_and_latency():
+    renderer = MetricsRenderer(plc='hvdp', units={'silo2Temp': 'C'})
+    histogram = Histogram([1, 10])
+    for value in [0.5, 5, 50]:
+        histogram.observe('readproperty', value)
+
+    output = renderer.render(1, {'silo2Temp': (21.5, 100.0), 'events': ([1, 2], 101.0), 'fault': (None, 102.0)}, 3.0, histogram.snapshot(), [1, 10])
+    assert 'plc_property_value{plc="hvdp",property="silo2Temp",unit="C"} 21.5\n' in output
+    assert 'plc_property_value{plc="hvdp",property="events",unit="",index="1"} 2\n' in output
+    assert 'property="fault"' in output and 'plc_property_value{plc="hvdp",property="fault"' not in output
+    assert 'plc_uptime_seconds{plc="hvdp"} 3.0\n' in output
+    assert 'plc_modbus_latency_milliseconds_bucket{plc="hvdp",function_name="readproperty",le="10.0"} 2\n' in output
+    assert 'plc_modbus_latency_milliseconds_bucket{plc="hvdp",function_name="readproperty",le="+Inf"} 3\n' in output
+    assert 'plc_modbus_latency_milliseconds_count{plc="hvdp",function_name="readproperty"} 3\n' in output
+
+def test_render_only_rebuilds_changed_series():
+    renderer = MetricsRenderer(plc='hvdp', units={})
+    renderer.render_properties(1, {'a': (1, 1.0), 'b': (2, 1.0)})
+    line_b = renderer.lines['b'][1]
+    block = renderer.render_properties(2, {'a': (3, 2.0), 'b': (2, 1.0)})
+    assert renderer.lines['b'][1] is line_b
+    assert 'property="a",unit=""} 3\n' in block
+    # an unchanged version reuses the block
+    assert renderer.render_properties(2, {}) is block
@@ -0,0 +1,28 @@
+from src.utilities.specdiff import diff_specs, diff_shard
+
+def spec(**properties):
+    return {'base': 'modbus+tcp://10.0.0.1:502/1', 'version': 'v1', 'properties': properties}
+
+def form(polling_time):
+    return {'forms': [{'href': '/40001?quantity=1', 'op': ['readproperty', 'observeproperty'], 'modbus:pollingTime': polling_time}]}
+
+def test_diff_properties_added_removed_and_changed():
+    diff = diff_specs(spec(a=form(1), b=form(1), c=form(1)), spec(a=form(1), b=form(5), d=form(1)))
+    assert diff.added == {'d'} and diff.removed == {'c'} and diff.changed == {'b'}
+    assert not diff.restart and diff
+
+def test_diff_identical_specs_is_empty():
+    assert not diff_specs(spec(a=form(1)), spec(a=form(1)))
+
+def test_diff_outside_of_properties_requires_restart():
+    new = {**spec(a=form(1)), 'base': 'modbus+tcp://10.0.0.2:502/1'}
+    assert diff_specs(spec(a=form(1)), new).restart
+    # a new version is rolled out by the operator, it does not restart the service
+    assert not diff_specs(spec(a=form(1)), {**spec(a=form(1)), 'version': 'v2'})
+
+def test_diff_shard_ignores_the_specs_of_its_plcs():
+    old = {'a': {'port': 5000, 'spec': spec(a=form(1))}, 'b': {'port': 5001, 'spec': spec()}, 'c': {'port': 5002, 'spec': spec()}}
+    new = {'a': {'port': 5000, 'spec': spec(a=form(5))}, 'b': {'port': 5003, 'spec': spec()}, 'd': {'port': 5002, 'spec': spec()}}
+    diff = diff_shard(old, new)
+    assert diff.added == {'d'} and diff.removed == {'c'} and diff.moved == {'b'}
+    assert not diff_shard(old, {**old, 'a': {'port': 5000, 'spec': spec()}})
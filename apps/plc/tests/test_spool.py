@@ -0,0 +1,81 @@
+import pytest
+
+from src.clients.spool import MappedQueue
+
+@pytest.fixture
+def path(tmp_path) -> str:
+    return str(tmp_path / 'metrics.spool')
+
+def test_spool_is_fifo(path: str):
+    queue = MappedQueue(path, capacity=4096)
+    for i in range(10):
+        assert queue.put(f'batch-{i}'.encode(), timestamp=float(i))
+    received = []
+    while (record := queue.peek()) is not None:
+        received.append(record)
+        queue.pop()
+    assert received == [(float(i), f'batch-{i}'.encode()) for i in range(10)]
+    assert len(queue) == 0 and queue.size() == 0
+
+def test_spool_drops_oldest_when_full(path: str):
+    queue = MappedQueue(path, capacity=1024)
+    for i in range(100):
+        queue.put(bytes([i]) * 50, timestamp=float(i))
+    assert queue.dropped > 0
+    assert len(queue) + queue.dropped == 100
+    assert queue.size() <= 1024 - 64
+    records = []
+    while (record := queue.peek()) is not None:
+        records.append(record)
+        queue.pop()
+    assert [timestamp for timestamp, _ in records] == [float(i) for i in range(100 - len(records), 100)]
+    assert all(payload == bytes([int(timestamp)]) * 50 for timestamp, payload in records)
+
+def test_spool_wraps_around(path: str):
+    queue = MappedQueue(path, capacity=512)
+    for i in range(1000):
+        queue.put(bytes([i % 256]) * (i % 37 + 1), timestamp=float(i))
+        if i % 3 == 0:
+            queue.pop()
+    previous = -1
+    while (record := queue.peek()) is not None:
+        timestamp, payload = record
+        assert timestamp > previous
+        assert payload == bytes([int(timestamp) % 256]) * (int(timestamp) % 37 + 1)
+        previous = timestamp
+        queue.pop()
+
+def test_spool_survives_reopen(path: str):
+    queue = MappedQueue(path, capacity=4096)
+    queue.put(b'first', timestamp=1.0)
+    queue.put(b'second', timestamp=2.0)
+    queue.pop()
+    queue.close()
+    reopened = MappedQueue(path, capacity=4096)
+    assert len(reopened) == 1
+    assert reopened.peek() == (2.0, b'second')
+
+def test_spool_rejects_oversized_records(path: str):
+    queue = MappedQueue(path, capacity=256)
+    assert not queue.put(b'x' * 256)
+
+def test_spool_pop_skips_a_record_dropped_since_it_was_read(path: str):
+    queue = MappedQueue(path, capacity=256)
+    while queue.dropped == 0:
+        queue.put(b'x' * 40, timestamp=float(len(queue)))
+    sequence, _, _ = queue.head_record()
+    queue.put(b'y' * 40)
+    head = queue.head_record()
+    assert not queue.pop(sequence)
+    assert queue.head_record() == head
+    assert queue.pop(head[0])
+    assert queue.head_record()[0] == head[0] + 1
+
+def test_spool_sequence_survives_reopen(path: str):
+    queue = MappedQueue(path, capacity=4096)
+    for i in range(3):
+        queue.put(f'batch-{i}'.encode(), timestamp=float(i))
+    assert queue.pop(queue.head_record()[0])
+    queue.close()
+    reopened = MappedQueue(path, capacity=4096)
+    assert reopened.head_record() == (1, 1.0, b'batch-1')
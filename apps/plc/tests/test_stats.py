@@ -0,0 +1,32 @@
+from src.utilities.stats import Histogram, Outcomes, Cycles
+
+def test_histogram_quantile_interpolates_within_bucket():
+    histogram = Histogram([10, 20])
+    assert histogram.quantile(0.5) is None
+    for value in [5, 15, 15, 15]:
+        histogram.observe('readproperty', value)
+    histogram.observe('writeproperty', 100)
+    assert histogram.quantile(0.2) == 10
+    assert histogram.quantile(0.5) == 10 + 10 * 1.5 / 3
+    # observations above the last bucket are estimated at its bound
+    assert histogram.quantile(0.99) == 20
+
+def test_outcomes_error_rate_over_recent_requests():
+    outcomes = Outcomes(window=4)
+    for error in [True, True, False, False, False, False]:
+        outcomes.record(error)
+    assert outcomes.summary() == {'requests': 6, 'errors': 2, 'error_rate': 0.0}
+    outcomes.record(True)
+    assert outcomes.summary()['error_rate'] == 0.25
+
+def test_cycles_split_reads_and_count_overruns():
+    cycles = Cycles()
+    cycles.record(1.0, 0.0, 0.2)
+    cycles.record(1.0, 0.2, 0.4)
+    cycles.record(1.0, 1.0, 2.5)
+    cycles.record(1.0, 2.5, 2.6)
+    summary = cycles.summary()
+    assert summary['cycles'] == 2 and summary['overruns'] == 1
+    assert round(summary['mean_ms']) == 950 and round(summary['max_ms']) == 1500
+    cycles.overrun()
+    assert cycles.summary()['overruns'] == 2
@@ -0,0 +1,83 @@
+import random
+
+from src.utilities.timeseries import ChunkEncoder, Series, History, decode_chunk, downsample, lttb
+
+def test_chunk_roundtrip():
+    rng = random.Random(7)
+    timestamps, values = [1700000000000], [21.5]
+    for i in range(500):
+        timestamps.append(timestamps[-1] + rng.choice([1000, 1000, 1000, 1003, 997, 250, 60000, -5]))
+        values.append(rng.choice([values[-1], values[-1], round(rng.uniform(-100, 100), 1), 0.0, -0.0, 1e300, 3]))
+
+    encoder = ChunkEncoder(timestamps[0], values[0])
+    for timestamp, value in zip(timestamps[1:], values[1:]):
+        encoder.append(timestamp, value)
+
+    decoded_timestamps, decoded_values = decode_chunk(encoder.to_bytes(), encoder.count)
+    assert decoded_timestamps == timestamps
+    assert decoded_values == values
+
+def test_chunk_compresses_regular_samples():
+    encoder = ChunkEncoder(0, 42.0)
+    for i in range(1, 1000):
+        encoder.append(i * 1000, 42.0)
+    # two bits per sample after the header and the first delta
+    assert len(encoder.to_bytes()) <= 16 + 4 + 1000 * 2 / 8
+
+def test_series_query_spans_chunks():
+    series = Series(budget_bytes=1 << 20, samples_per_chunk=16)
+    for i in range(100):
+        series.append(i * 1000, float(i))
+    timestamps, values = series.query(10_000, 49_000)
+    assert timestamps == [i * 1000 for i in range(10, 50)]
+    assert values == [float(i) for i in range(10, 50)]
+
+def test_series_evicts_oldest_chunks_beyond_budget():
+    series = Series(budget_bytes=2048, samples_per_chunk=16)
+    for i in range(10_000):
+        series.append(i * 1000, float(i % 17))
+    assert series.memory() <= 2048 + 512
+    timestamps, _ = series.query(0, 10_000_000)
+    assert timestamps[-1] == 9_999_000
+    assert timestamps[0] > 0
+
+def test_history_ignores_non_scalar_values():
+    history = History(["silo2Temp"], budget_bytes=1 << 16)
+    history.append("silo2Temp", 21.5, 1.0)
+    history.append("silo2Temp", None, 2.0)
+    history.append("silo2Temp", [1, 2], 3.0)
+    history.append("unknown", 1, 4.0)
+    assert history.query("silo2Temp", 0, 10) == ([1.0], [21.5])
+
+def test_history_adds_and_removes_series():
+    history = History(["silo2Temp"], budget_bytes=1 << 16)
+    history.add("silo3Temp")
+    history.append("silo3Temp", 19.0, 1.0)
+    history.remove("silo2Temp")
+    history.append("silo2Temp", 21.5, 1.0)
+    assert list(history.series) == ["silo3Temp"]
+    assert history.query("silo3Temp", 0, 10) == ([1.0], [19.0])
+
+def test_downsample_buckets():
+    timestamps = [float(i) for i in range(100)]
+    values = [float(i % 10) for i in range(100)]
+    result = downsample(timestamps, values, 10)
+    assert len(result['timestamps']) == 10
+    assert result['min'][0] == 0 and result['max'][0] == 9 and result['avg'][0] == 4.5
+
+def test_lttb_keeps_endpoints_and_peaks():
+    timestamps = [float(i) for i in range(1000)]
+    values = [0.0] * 1000
+    values[500] = 100.0
+    sampled_timestamps, sampled_values = lttb(timestamps, values, 20)
+    assert len(sampled_timestamps) == 20
+    assert sampled_timestamps[0] == 0 and sampled_timestamps[-1] == 999
+    assert 100.0 in sampled_values
+
+def test_lttb_raises_fewer_than_3_points_to_3():
+    timestamps = [float(i) for i in range(100)]
+    values = [float(i % 7) for i in range(100)]
+    for points in (0, 1, 2):
+        sampled_timestamps, sampled_values = lttb(timestamps, values, points)
+        assert len(sampled_timestamps) == len(sampled_values) == 3
+        assert sampled_timestamps[0] == 0 and sampled_timestamps[-1] == 99
@@ -0,0 +1,42 @@
+import multiprocessing
+
+from src.utilities.valuetable import ValueTable
+
+def test_value_table_round_trip():
+    table = ValueTable(['a', 'b', 'c'], width=2)
+    try:
+        assert table.read('a') is None
+        table.write('a', 12, 1.5)
+        table.write('b', 0.25, 2.5)
+        table.write('c', [1, 2, 3], 3.5)
+        assert table.read('a') == (12, 1.5, 2)
+        assert table.read('b') == (0.25, 2.5, 2)
+        # values beyond the width are dropped
+        assert table.read('c') == ([1, 2], 3.5, 2)
+        table.write('a', None, 4.5)
+        assert table.read('a') == (None, 4.5, 4)
+        assert table.sequence('a') == 4
+    finally:
+        table.close()
+        table.unlink()
+
+def _write(table: ValueTable):
+    for i in range(1000):
+        table.write('a', [i, i], float(i))
+
+def test_value_table_is_shared_with_forked_processes():
+    table = ValueTable(['a'], width=2)
+    try:
+        process = multiprocessing.get_context('fork').Process(target=_write, args=(table,))
+        process.start()
+        # a reader never observes a torn slot
+        while process.is_alive():
+            entry = table.read('a')
+            if entry is not None:
+                value, timestamp, _ = entry
+                assert value == [int(timestamp)] * 2
+        process.join()
+        assert table.read('a')[:2] == ([999, 999], 999.0)
+    finally:
+        table.close()
+        table.unlink()
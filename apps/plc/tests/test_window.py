@@ -0,0 +1,14 @@
+from src.utilities.window import Window
+
+def test_window_aggregates_and_resets():
+    window = Window()
+    for value in [3, 1, None, 4, 1, 5]:
+        window.add(value)
+    assert window.drain() == {'min': 1, 'max': 5, 'mean': 2.8, 'last': 5, 'count': 5}
+    assert window.drain() is None
+
+def test_window_keeps_last_of_multiple_registers():
+    window = Window()
+    window.add([1, 2])
+    window.add([3, 4])
+    assert window.drain() == {'last': [3, 4], 'count': 0}